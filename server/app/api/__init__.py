@@ -1,9 +1,10 @@
 """
 API router initialization
 """
+from app.core.config import settings
 from fastapi import APIRouter
 
-from .endpoints import auth, pm25, weather, location
+from .endpoints import auth, diagnostics, location, pm25, weather
 
 api_router = APIRouter()
 
@@ -16,3 +17,7 @@ api_router.include_router(auth.router, prefix="/auth", tags=["Auth"])
 # Include Weather endpoints
 api_router.include_router(weather.router, prefix="/weather", tags=["Weather"])
 api_router.include_router(location.router, prefix="/location", tags=["Location"])
+
+# Index stats and query plans - only for deployments that opt in
+if settings.DIAGNOSTICS_ENABLED:
+    api_router.include_router(diagnostics.router, prefix="/diagnostics", tags=["Diagnostics"])
@@ -6,13 +6,19 @@ from datetime import datetime, timedelta
 from typing import Optional
 
 from app.core.config import settings
-from app.core.security import (create_access_token, get_current_user,
-                               get_password_hash, verify_password)
+from app.core.pagination import (NEXT_CURSOR_HEADER, decode_id_cursor,
+                                 encode_id_cursor)
+from app.core.responses import model_list_response
+from app.core.security import (check_password_capacity, create_access_token,
+                               get_current_user, get_password_hash_async,
+                               verify_password_async)
 from app.db.mongodb import get_database
 from app.models.user import (Token, UserCreate, UserInDB, UserLogin,
                              UserProfile, UserResponse)
+from app.services.user_service import (find_login_user, get_user_profile,
+                                       invalidate_user, user_response)
 from bson import ObjectId
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from pydantic import BaseModel, EmailStr
 
 router = APIRouter()
@@ -35,6 +41,7 @@ async def register(payload: UserCreate):
     
     Returns JWT access token and user information
     """
+    check_password_capacity()
     db = get_database()
     
     # Check if user already exists
@@ -84,7 +91,7 @@ async def register(payload: UserCreate):
     user_dict = {
         "email": payload.email,
         "username": payload.username,
-        "hashed_password": get_password_hash(payload.password),
+        "hashed_password": await get_password_hash_async(payload.password),
         "profile": profile_dict,
         "role": payload.role or "user",
         "is_active": True,
@@ -102,21 +109,10 @@ async def register(payload: UserCreate):
         expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     )
     
-    # Prepare user response
-    user_response = UserResponse(
-        _id=str(result.inserted_id),
-        email=user_dict["email"],
-        username=user_dict["username"],
-        profile=UserProfile(**user_dict["profile"]),
-        role=user_dict["role"],
-        is_active=user_dict["is_active"],
-        created_at=user_dict["created_at"]
-    )
-    
     return Token(
         access_token=access_token,
         token_type="bearer",
-        user=user_response
+        user=user_response(user_dict)
     )
 
 
@@ -129,21 +125,15 @@ async def login(payload: UserLogin):
     - **password**: User password
     
     Returns JWT access token and user information
+    
+    Returns 503 (with Retry-After) when too many logins are already waiting
+    for a password worker.
     """
+    check_password_capacity()
     db = get_database()
     
-    # Find user by email or username
-    # Try to determine if input is email or username
-    identifier = payload.email_or_username
-    
-    # Check if identifier contains @ (likely email)
-    if "@" in identifier:
-        user = await db.users.find_one({"email": identifier})
-    else:
-        # Try username first, then email
-        user = await db.users.find_one({"username": identifier})
-        if not user:
-            user = await db.users.find_one({"email": identifier})
+    # Find user by email or username (one indexed lookup)
+    user = await find_login_user(db, payload.email_or_username)
     
     if not user:
         raise HTTPException(
@@ -152,7 +142,7 @@ async def login(payload: UserLogin):
         )
     
     # Verify password
-    if not verify_password(payload.password, user["hashed_password"]):
+    if not await verify_password_async(payload.password, user["hashed_password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email/username or password"
@@ -171,21 +161,10 @@ async def login(payload: UserLogin):
         expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     )
     
-    # Prepare user response
-    user_response = UserResponse(
-        _id=str(user["_id"]),
-        email=user["email"],
-        username=user.get("username", ""),
-        profile=UserProfile(**user.get("profile", {})),
-        role=user.get("role", "user"),
-        is_active=user.get("is_active", True),
-        created_at=user["created_at"]
-    )
-    
     return Token(
         access_token=access_token,
         token_type="bearer",
-        user=user_response
+        user=user_response(user)
     )
 
 
@@ -198,22 +177,14 @@ async def get_profile(current_user: dict = Depends(get_current_user)):
     """
     db = get_database()
     
-    user = await db.users.find_one({"email": current_user["email"]})
+    user = await get_user_profile(db, "email", current_user["email"])
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
-    return UserResponse(
-        _id=str(user["_id"]),
-        email=user["email"],
-        username=user.get("username", ""),
-        profile=UserProfile(**user.get("profile", {})),
-        role=user.get("role", "user"),
-        is_active=user.get("is_active", True),
-        created_at=user["created_at"]
-    )
+    return user
 
 
 @router.get('/profile/{user_id}', response_model=UserResponse)
@@ -226,28 +197,21 @@ async def get_profile_by_id(user_id: str):
     db = get_database()
     
     try:
-        user = await db.users.find_one({"_id": ObjectId(user_id)})
+        object_id = ObjectId(user_id)
     except Exception:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid user ID format"
         )
     
+    user = await get_user_profile(db, "_id", object_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
-    return UserResponse(
-        _id=str(user["_id"]),
-        email=user["email"],
-        username=user.get("username", ""),
-        profile=UserProfile(**user.get("profile", {})),
-        role=user.get("role", "user"),
-        is_active=user.get("is_active", True),
-        created_at=user["created_at"]
-    )
+    return user
 
 
 @router.get('/profile/username/{username}', response_model=UserResponse)
@@ -259,7 +223,7 @@ async def get_profile_by_username(username: str):
     """
     db = get_database()
     
-    user = await db.users.find_one({"username": username})
+    user = await get_user_profile(db, "username", username)
     
     if not user:
         raise HTTPException(
@@ -267,15 +231,7 @@ async def get_profile_by_username(username: str):
             detail="User not found"
         )
     
-    return UserResponse(
-        _id=str(user["_id"]),
-        email=user["email"],
-        username=user.get("username", ""),
-        profile=UserProfile(**user.get("profile", {})),
-        role=user.get("role", "user"),
-        is_active=user.get("is_active", True),
-        created_at=user["created_at"]
-    )
+    return user
 
 
 @router.put('/profile', response_model=UserResponse)
@@ -317,15 +273,8 @@ async def update_profile(
             detail="User not found"
         )
     
-    return UserResponse(
-        _id=str(result["_id"]),
-        email=result["email"],
-        username=result.get("username", ""),
-        profile=UserProfile(**result.get("profile", {})),
-        role=result.get("role", "user"),
-        is_active=result.get("is_active", True),
-        created_at=result["created_at"]
-    )
+    invalidate_user(result)
+    return user_response(result)
 
 
 @router.put('/profile/{user_id}', response_model=UserResponse)
@@ -381,30 +330,28 @@ async def update_profile_by_id(
             detail="User not found"
         )
     
-    return UserResponse(
-        _id=str(result["_id"]),
-        email=result["email"],
-        username=result.get("username", ""),
-        profile=UserProfile(**result.get("profile", {})),
-        role=result.get("role", "user"),
-        is_active=result.get("is_active", True),
-        created_at=result["created_at"]
-    )
+    invalidate_user(result)
+    return user_response(result)
 
 
 @router.get('/users', response_model=list[UserResponse])
 async def get_all_users(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
     """
     Get all users (paginated)
     
-    Requires JWT authentication. Returns list of all users.
+    Requires JWT authentication. Returns list of all users in creation
+    order. When more users follow, the X-Next-Cursor response header holds
+    the cursor for the next page.
     
     Query params:
-    - skip: Number of records to skip (default: 0)
+    - cursor: X-Next-Cursor of the previous page (constant cost per page; preferred over skip)
+    - skip: Number of records to skip (default: 0, ignored with cursor)
     - limit: Maximum number of records to return (default: 100, max: 1000)
     """
     db = get_database()
@@ -413,21 +360,23 @@ async def get_all_users(
     if limit > 1000:
         limit = 1000
     
-    cursor = db.users.find().skip(skip).limit(limit)
-    users = await cursor.to_list(length=limit)
-    
-    return [
-        UserResponse(
-            _id=str(user["_id"]),
-            email=user["email"],
-            username=user.get("username", ""),
-            profile=UserProfile(**user.get("profile", {})),
-            role=user.get("role", "user"),
-            is_active=user.get("is_active", True),
-            created_at=user["created_at"]
-        )
-        for user in users
-    ]
+    # Keyset on _id (one extra record tells whether another page follows)
+    if cursor:
+        query_cursor = db.users.find({"_id": {"$gt": decode_id_cursor(cursor)}})
+    else:
+        query_cursor = db.users.find().skip(skip)
+    users = await query_cursor.sort("_id", 1).limit(limit + 1).to_list(length=limit + 1)
+    
+    headers = {}
+    if len(users) > limit:
+        users = users[:limit]
+        headers[NEXT_CURSOR_HEADER] = encode_id_cursor(users[-1]["_id"])
+    
+    responses = [user_response(user) for user in users]
+    if settings.FAST_JSON_RESPONSES:
+        return model_list_response(UserResponse, responses, headers=headers)
+    response.headers.update(headers)
+    return responses
 
 
 @router.get('/status')
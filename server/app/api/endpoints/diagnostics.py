@@ -0,0 +1,32 @@
+"""
+Diagnostics endpoints
+"""
+import logging
+
+from app.core.security import get_current_user
+from app.db.indexes import mongo_diagnostics
+from app.db.mongodb import get_database
+from fastapi import APIRouter, Depends, HTTPException, status
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+@router.get('/mongo')
+async def get_mongo_diagnostics(current_user: dict = Depends(get_current_user)):
+    """
+    Index usage ($indexStats) for registered collections, missing indexes,
+    and query plans for the app's hot queries
+
+    Queries whose winning plan contains a COLLSCAN are listed in
+    `collscan_queries`. Only served when DIAGNOSTICS_ENABLED is set;
+    requires JWT authentication.
+    """
+    db = get_database()
+    if db is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="MongoDB is not connected")
+    try:
+        return await mongo_diagnostics(db)
+    except Exception as e:
+        logger.error(f"Error collecting MongoDB diagnostics: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Could not collect MongoDB diagnostics")
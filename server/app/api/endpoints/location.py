@@ -1,18 +1,49 @@
 """
 Location tracking endpoints
 """
+import logging
+from collections import defaultdict, deque
 from datetime import datetime, timedelta, timezone
 from math import asin, cos, radians, sin, sqrt
-from typing import List, Optional
+from typing import List, Optional, Union
 
+import numpy as np
+from app.core.config import settings
+from app.core.pagination import (NEXT_CURSOR_HEADER, after_time_cursor,
+                                 encode_time_cursor)
+from app.core.responses import model_list_response
 from app.core.security import get_current_user
 from app.db.mongodb import get_database
-from app.models.location import (LocationHistoryStats, LocationRecordCreate,
-                                 LocationRecordResponse)
+from app.models.location import (LocationBatchCreate, LocationBatchItem,
+                                 LocationHistoryStats, LocationRecordCreate,
+                                 LocationRecordResponse, SavedLocationResponse)
+from app.services.aqi_service import get_aqi_category
+from app.services.exposure_service import enrich_locations
+from app.services.location_export import (EXPORT_FORMATS, MEDIA_TYPES,
+                                          export_chunks, export_projection)
+from app.services.location_rollups import (record_location,
+                                           record_locations,
+                                           remove_rollups_before, rollup_day,
+                                           rollup_stats)
+from app.services.location_stats import (day_stats_pipeline,
+                                         location_stats_pipeline,
+                                         summarize_location_stats)
+from app.services.write_buffer import (BufferClosedError, BufferFullError,
+                                       location_write_buffer)
 from bson import ObjectId
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError, PyMongoError
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371
+
+# Neighbour sets smaller than this are checked with the scalar haversine;
+# larger ones in one vectorized NumPy pass
+_VECTORIZE_MIN_NEIGHBOURS = 16
 
 
 def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
@@ -29,22 +60,16 @@ def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     c = 2 * asin(sqrt(a))
     
     # Radius of Earth in kilometers
-    r = 6371
+    r = EARTH_RADIUS_KM
     
     return c * r
 
 
-def filter_duplicate_locations(locations: List[dict], time_threshold_minutes: int = 30, distance_threshold_km: float = 1.0) -> List[dict]:
+def _filter_duplicate_locations_scan(locations: List[dict], time_threshold_minutes: int = 30, distance_threshold_km: float = 1.0) -> List[dict]:
     """
-    Filter out duplicate location records that are too close in time and distance.
-    
-    Args:
-        locations: List of location documents (sorted by timestamp DESC)
-        time_threshold_minutes: Minimum time gap between records (default 30 minutes)
-        distance_threshold_km: Minimum distance between records (default 1 km)
-    
-    Returns:
-        Filtered list of locations
+    Reference duplicate filter: compares each record with every kept record
+
+    O(n²); used when the input isn't sorted by timestamp.
     """
     if not locations:
         return []
@@ -77,15 +102,107 @@ def filter_duplicate_locations(locations: List[dict], time_threshold_minutes: in
     return filtered
 
 
-@router.post('/save', response_model=LocationRecordResponse, status_code=status.HTTP_201_CREATED)
+def filter_duplicate_locations(locations: List[dict], time_threshold_minutes: int = 30, distance_threshold_km: float = 1.0) -> List[dict]:
+    """
+    Filter out duplicate location records that are too close in time and distance.
+    
+    A record is dropped if a kept record is within time_threshold_minutes
+    and distance_threshold_km of it. Because the input is sorted by
+    timestamp, only kept records inside the time window can match, so they
+    are held in a sliding window bucketed by latitude band (one band is at
+    least distance_threshold_km tall, so only the record's own and the two
+    neighbouring bands need checking). The result is identical to comparing
+    against every kept record.
+    
+    Args:
+        locations: List of location documents (sorted by timestamp DESC)
+        time_threshold_minutes: Minimum time gap between records (default 30 minutes)
+        distance_threshold_km: Minimum distance between records (default 1 km)
+    
+    Returns:
+        Filtered list of locations
+    """
+    if not locations:
+        return []
+    
+    timestamps = [loc["timestamp"] for loc in locations]
+    if any(later > earlier for earlier, later in zip(timestamps, timestamps[1:])):
+        return _filter_duplicate_locations_scan(locations, time_threshold_minutes, distance_threshold_km)
+    
+    lats = np.array([loc["latitude"] for loc in locations], dtype=np.float64)
+    lons = np.array([loc["longitude"] for loc in locations], dtype=np.float64)
+    lat_rad = np.radians(lats)
+    lon_rad = np.radians(lons)
+    cos_lat = np.cos(lat_rad)
+    
+    # Great-circle distance >= R * |dlat|, so bands this tall (plus a margin
+    # for rounding) put every match in the same or an adjacent band
+    band_height = np.degrees(distance_threshold_km / EARTH_RADIUS_KM) * 1.001
+    bands = np.floor(lats / band_height).astype(np.int64).tolist()
+    # Vectorized distances within this margin of the threshold are
+    # re-checked with haversine_distance so rounding can't change the result
+    tolerance = distance_threshold_km * 1e-9
+    
+    window = deque()  # kept indexes inside the time window, newest first
+    window_bands = defaultdict(deque)  # band -> kept indexes in that band
+    filtered = []
+    
+    for i, current_loc in enumerate(locations):
+        # Records are sorted, so the time gap to a kept record only grows
+        while window and abs((timestamps[window[0]] - timestamps[i]).total_seconds() / 60) >= time_threshold_minutes:
+            window_bands[bands[window[0]]].popleft()
+            window.popleft()
+        
+        band = bands[i]
+        neighbours = [k for b in (band - 1, band, band + 1) for k in window_bands.get(b, ())]
+        
+        is_duplicate = False
+        if len(neighbours) < _VECTORIZE_MIN_NEIGHBOURS:
+            is_duplicate = any(
+                haversine_distance(locations[k]["latitude"], locations[k]["longitude"],
+                                   current_loc["latitude"], current_loc["longitude"]) < distance_threshold_km
+                for k in neighbours
+            )
+        else:
+            idx = np.array(neighbours, dtype=np.int64)
+            a = (np.sin((lat_rad[i] - lat_rad[idx]) / 2) ** 2
+                 + cos_lat[idx] * cos_lat[i] * np.sin((lon_rad[i] - lon_rad[idx]) / 2) ** 2)
+            distances = 2 * np.arcsin(np.sqrt(a)) * EARTH_RADIUS_KM
+            if (distances < distance_threshold_km - tolerance).any():
+                is_duplicate = True
+            else:
+                is_duplicate = any(
+                    haversine_distance(locations[k]["latitude"], locations[k]["longitude"],
+                                       current_loc["latitude"], current_loc["longitude"]) < distance_threshold_km
+                    for k in idx[distances < distance_threshold_km + tolerance].tolist()
+                )
+        
+        if not is_duplicate:
+            filtered.append(current_loc)
+            window.append(i)
+            window_bands[band].append(i)
+    
+    return filtered
+
+
+@router.post('/save', response_model=SavedLocationResponse, status_code=status.HTTP_201_CREATED)
 async def save_location(
     payload: LocationRecordCreate,
+    ack: bool = Query(False, description="With the write-behind buffer enabled, wait until the record is written"),
     current_user: dict = Depends(get_current_user)
 ):
     """
     Save user location with AQI data
     
     Requires JWT authentication. User can only save their own location.
+    
+    If pm25 is omitted it is sampled from today's GeoTIFF at the location
+    (and aqi computed from it), so clients don't need to call /pm25/point
+    first.
+    
+    When LOCATION_WRITE_BEHIND_ENABLED is set the record is queued and
+    written in a batch shortly after the response (its id is assigned up
+    front); pass ack=true to wait for the write.
     """
     db = get_database()
     
@@ -108,61 +225,205 @@ async def save_location(
         "timestamp": datetime.now(timezone.utc)
     }
     
-    # Insert into database
-    result = await db.locations.insert_one(location_doc)
-    
-    return LocationRecordResponse(
-        _id=str(result.inserted_id),
+    if settings.LOCATION_AQI_ENRICHMENT_ENABLED:
+        await enrich_locations([location_doc])
+    
+    if location_write_buffer.running:
+        # Batched insert (rollups are updated by the buffer after the write)
+        location_doc["_id"] = ObjectId()
+        try:
+            await location_write_buffer.put(location_doc, ack=ack)
+        except (BufferFullError, BufferClosedError):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, please retry"
+            )
+        except PyMongoError as e:
+            logger.error(f"Failed to save location for user {payload.user_id}: {e}")
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to save location")
+    else:
+        # Insert into database
+        result = await db.locations.insert_one(location_doc)
+        
+        if settings.LOCATION_ROLLUPS_ENABLED:
+            try:
+                await record_location(db, location_doc)
+            except Exception as e:
+                # The record itself is saved; the rollup is fixed by the next backfill
+                logger.error(f"Failed to update daily rollup for user {payload.user_id}: {e}")
+    
+    return SavedLocationResponse(
+        _id=str(location_doc["_id"]),
         user_id=location_doc["user_id"],
         latitude=location_doc["latitude"],
         longitude=location_doc["longitude"],
         aqi=location_doc["aqi"],
         pm25=location_doc["pm25"],
+        category=get_aqi_category(location_doc["aqi"]),
         address=location_doc["address"],
         timestamp=location_doc["timestamp"]
     )
 
 
-@router.get('/history', response_model=List[LocationRecordResponse])
-async def get_location_history(
-    user_id: Optional[str] = Query(None, description="User ID to get history for"),
-    days: int = Query(15, ge=1, le=90, description="Number of days to retrieve"),
-    limit: int = Query(1000, ge=1, le=10000, description="Maximum records to return"),
+def _point_key(ts: datetime, latitude: float, longitude: float) -> tuple:
+    """Near-duplicate key: same second and coordinates within ~1 m"""
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return (int(ts.timestamp()), round(latitude, 5), round(longitude, 5))
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" if err["loc"] else err["msg"]
+        for err in error.errors()
+    )
+
+
+@router.post('/save/batch')
+async def save_location_batch(
+    payload: LocationBatchCreate,
     current_user: dict = Depends(get_current_user)
 ):
     """
-    Get location history for a user
-    
-    Requires JWT authentication. User can only get their own history.
+    Save a batch of locations queued on the device (e.g. recorded offline)
+    
+    Requires JWT authentication. Each item is validated on its own and gets
+    a result in request order with status "created" (with its id),
+    "duplicate" (same second and coordinates as a point in this batch or
+    already saved), "invalid" or "forbidden" (another user's point).
+    Items without a timestamp are stamped with the server time. Items
+    without pm25 are sampled from the GeoTIFF of their day, one read per
+    file for the whole batch.
     """
     db = get_database()
+    user_id = current_user["user_id"]
+    now = datetime.now(timezone.utc)
+    latest_allowed = now + timedelta(seconds=settings.LOCATION_BATCH_MAX_FUTURE_SECONDS)
+    
+    results: List[Optional[dict]] = [None] * len(payload.items)
+    docs, doc_indexes, keys = [], [], set()
+    for i, raw_item in enumerate(payload.items):
+        try:
+            item = LocationBatchItem.model_validate(raw_item)
+        except ValidationError as e:
+            results[i] = {"index": i, "status": "invalid", "error": _validation_message(e)}
+            continue
+        if item.user_id != user_id:
+            results[i] = {"index": i, "status": "forbidden", "error": "You can only save your own location"}
+            continue
+        
+        ts = item.timestamp or now
+        ts = ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts.astimezone(timezone.utc)
+        ts = ts.replace(microsecond=ts.microsecond // 1000 * 1000)  # MongoDB stores milliseconds
+        if ts > latest_allowed:
+            results[i] = {"index": i, "status": "invalid", "error": "timestamp: Timestamp is in the future"}
+            continue
+        
+        key = _point_key(ts, item.latitude, item.longitude)
+        if key in keys:
+            results[i] = {"index": i, "status": "duplicate"}
+            continue
+        keys.add(key)
+        docs.append({
+            "user_id": user_id,
+            "latitude": item.latitude,
+            "longitude": item.longitude,
+            "aqi": item.aqi,
+            "pm25": item.pm25,
+            "address": item.address,
+            "timestamp": ts
+        })
+        doc_indexes.append(i)
+    
+    # Drop points that were already saved (e.g. a batch replayed after a timeout)
+    if docs:
+        stored = await db.locations.find(
+            {"user_id": user_id, "timestamp": {"$gte": min(d["timestamp"] for d in docs),
+                                               "$lte": max(d["timestamp"] for d in docs)}},
+            {"_id": 0, "timestamp": 1, "latitude": 1, "longitude": 1}
+        ).to_list(length=None)
+        stored_keys = {_point_key(d["timestamp"], d["latitude"], d["longitude"]) for d in stored}
+        new_docs, new_indexes = [], []
+        for doc, i in zip(docs, doc_indexes):
+            if _point_key(doc["timestamp"], doc["latitude"], doc["longitude"]) in stored_keys:
+                results[i] = {"index": i, "status": "duplicate"}
+            else:
+                new_docs.append(doc)
+                new_indexes.append(i)
+        docs, doc_indexes = new_docs, new_indexes
+    
+    if docs and settings.LOCATION_AQI_ENRICHMENT_ENABLED:
+        await enrich_locations(docs)
+    
+    failed = {}
+    if docs:
+        try:
+            await db.locations.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            failed = {err["index"]: err.get("errmsg", "write failed") for err in e.details.get("writeErrors", [])}
+    
+    saved = []
+    for n, (doc, i) in enumerate(zip(docs, doc_indexes)):
+        if n in failed:
+            results[i] = {"index": i, "status": "error", "error": failed[n]}
+        else:
+            results[i] = {"index": i, "status": "created", "id": str(doc["_id"])}
+            saved.append(doc)
+    
+    if saved and settings.LOCATION_ROLLUPS_ENABLED:
+        try:
+            await record_locations(db, saved)
+        except Exception as e:
+            logger.error(f"Failed to update daily rollups for user {user_id}: {e}")
+    
+    statuses = [r["status"] for r in results]
+    return {
+        "count": len(results),
+        "created": statuses.count("created"),
+        "duplicates": statuses.count("duplicate"),
+        "rejected": len(results) - statuses.count("created") - statuses.count("duplicate"),
+        "results": results
+    }
+
+
+async def _history_page(
+    user_id: str,
+    days: int,
+    limit: int,
+    cursor: Optional[str],
+    response: Response
+) -> Union[List[LocationRecordResponse], Response]:
+    """
+    One page of a user's location history, newest first
     
-    # Use current user's ID if not specified
-    target_user_id = user_id or current_user["user_id"]
-    
-    # Verify user is getting their own history
-    if current_user["user_id"] != target_user_id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You can only access your own location history"
-        )
+    Pages are keyed on (timestamp, _id) and read from the
+    (user_id, timestamp, _id) index. When more records follow, the token
+    for the next page is set in the X-Next-Cursor header. Duplicates are
+    filtered within each page. With FAST_JSON_RESPONSES the serialized
+    response is returned directly.
+    """
+    db = get_database()
     
     # Calculate date range
     vn_tz = timezone(timedelta(hours=7))  # UTC+7 Vietnam timezone
     cutoff_date = datetime.now(vn_tz) - timedelta(days=days)  # convert to UTC
     
-    # Query database
-    cursor = db.locations.find({
-        "user_id": target_user_id,
-        "timestamp": {"$gte": cutoff_date}
-    }).sort("timestamp", -1).limit(limit)
+    # Query database (one extra record tells whether another page follows)
+    query = {"user_id": user_id, "timestamp": {"$gte": cutoff_date}, **after_time_cursor(cursor)}
+    locations = await db.locations.find(query).sort(
+        [("timestamp", -1), ("_id", -1)]
+    ).limit(limit + 1).to_list(length=limit + 1)
     
-    locations = await cursor.to_list(length=limit)
+    headers = {}
+    if len(locations) > limit:
+        locations = locations[:limit]
+        last = locations[-1]
+        headers[NEXT_CURSOR_HEADER] = encode_time_cursor(last["timestamp"], last["_id"])
     
     # Filter out duplicates (same location within 30 minutes and 1km)
     filtered_locations = filter_duplicate_locations(locations)
     
-    return [
+    records = [
         LocationRecordResponse(
             _id=str(loc["_id"]),
             user_id=loc["user_id"],
@@ -175,22 +436,58 @@ async def get_location_history(
         )
         for loc in filtered_locations
     ]
+    
+    if settings.FAST_JSON_RESPONSES:
+        # Records are already validated - serialize them in one pass
+        return model_list_response(LocationRecordResponse, records, headers=headers)
+    response.headers.update(headers)
+    return records
+
+
+@router.get('/history', response_model=List[LocationRecordResponse])
+async def get_location_history(
+    response: Response,
+    user_id: Optional[str] = Query(None, description="User ID to get history for"),
+    days: int = Query(15, ge=1, le=90, description="Number of days to retrieve"),
+    limit: int = Query(1000, ge=1, le=10000, description="Maximum records to return"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get location history for a user
+    
+    Requires JWT authentication. User can only get their own history.
+    If more records follow, the X-Next-Cursor response header holds the
+    cursor for the next page.
+    """
+    # Use current user's ID if not specified
+    target_user_id = user_id or current_user["user_id"]
+    
+    # Verify user is getting their own history
+    if current_user["user_id"] != target_user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You can only access your own location history"
+        )
+    
+    return await _history_page(target_user_id, days, limit, cursor, response)
 
 
 @router.get('/history/{user_id}', response_model=List[LocationRecordResponse])
 async def get_user_location_history(
     user_id: str,
+    response: Response,
     days: int = Query(15, ge=1, le=90, description="Number of days to retrieve"),
     limit: int = Query(1000, ge=1, le=10000, description="Maximum records to return"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
     current_user: dict = Depends(get_current_user)
 ):
     """
     Get location history for a specific user by ID
     
     Requires JWT authentication. User can only get their own history.
+    Paginated like /history.
     """
-    db = get_database()
-    
     # Verify user is getting their own history
     if current_user["user_id"] != user_id:
         raise HTTPException(
@@ -198,34 +495,45 @@ async def get_user_location_history(
             detail="You can only access your own location history"
         )
     
-    # Calculate date range
-    vn_tz = timezone(timedelta(hours=7))  # UTC+7 Vietnam timezone
-    cutoff_date = datetime.now(vn_tz) - timedelta(days=days)
+    return await _history_page(user_id, days, limit, cursor, response)
+
+
+@router.get('/export')
+async def export_location_history(
+    fmt: str = Query("ndjson", alias="format", description="ndjson, csv or columnar"),
+    start: Optional[datetime] = Query(None, description="Start of the range (UTC if no offset, default: `days` ago)"),
+    end: Optional[datetime] = Query(None, description="End of the range, exclusive (default: now)"),
+    days: int = Query(15, ge=1, le=3650, description="Number of days to export when start is omitted"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Stream the current user's raw location records, oldest first
     
-    # Query database
-    cursor = db.locations.find({
-        "user_id": user_id,
-        "timestamp": {"$gte": cutoff_date}
-    }).sort("timestamp", -1).limit(limit)
+    Requires JWT authentication. Unlike /history, records are not
+    deduplicated or capped: the cursor is streamed in chunks, so any range
+    can be exported with constant memory. The columnar format returns
+    parallel arrays (t, lat, lon, aqi, pm25) and is the most compact.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}"
+        )
     
-    locations = await cursor.to_list(length=limit)
+    db = get_database()
+    user_id = current_user["user_id"]
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(days=days)
     
-    # Filter out duplicates (same location within 30 minutes and 1km)
-    filtered_locations = filter_duplicate_locations(locations)
+    cursor = db.locations.find(
+        {"user_id": user_id, "timestamp": {"$gte": start, "$lt": end}},
+        export_projection(fmt)
+    ).sort("timestamp", 1).batch_size(1000)
     
-    return [
-        LocationRecordResponse(
-            _id=str(loc["_id"]),
-            user_id=loc["user_id"],
-            latitude=loc["latitude"],
-            longitude=loc["longitude"],
-            aqi=loc.get("aqi"),
-            pm25=loc.get("pm25"),
-            address=loc.get("address"),
-            timestamp=loc["timestamp"]
-        )
-        for loc in filtered_locations
-    ]
+    headers = {}
+    if fmt == "csv":
+        headers["Content-Disposition"] = f'attachment; filename="locations_{start:%Y%m%d}_{end:%Y%m%d}.csv"'
+    return StreamingResponse(export_chunks(cursor, fmt), media_type=MEDIA_TYPES[fmt], headers=headers)
 
 
 @router.get('/stats', response_model=LocationHistoryStats)
@@ -249,128 +557,23 @@ async def get_location_stats(
     cutoff_local = datetime(start_local_date.year, start_local_date.month, start_local_date.day, 0, 0, 0, tzinfo=vn_tz)
     cutoff_utc = cutoff_local.astimezone(timezone.utc)
     print('[get_location_stats] cutoff_local:', cutoff_local, 'cutoff_utc:', cutoff_utc)
-    # Get all records for the period (DB stores timestamps in UTC)
-    cursor = db.locations.find({
-        "user_id": user_id,
-        "timestamp": {"$gte": cutoff_utc}
-    })
-   
-    locations = await cursor.to_list(length=10000)
-   
-    if not locations:
-        return LocationHistoryStats(
-            total_records=0,
-            date_range={"start": None, "end": None},
-            avg_aqi=None,
-            max_aqi=None,
-            min_aqi=None,
-            avg_pm25=None,
-            max_pm25=None,
-            min_pm25=None,
-            most_visited_location=None,
-            unique_locations=0,
-            daily_avg_aqi=[]
+    if settings.LOCATION_ROLLUPS_ENABLED:
+        # One rollup document per VN-local day
+        day_stats, most_visited, unique_locations = await rollup_stats(
+            db, user_id, start_local_date.strftime("%Y-%m-%d")
         )
-    
-    # We'll build a list of valid records (exclude today's partial data) and compute stats from that
-    valid_records = []
-    # Set end_date to yesterday (VN local) to avoid including today's partial data
-    now_local = datetime.now(vn_tz)
-    today_local = now_local.date()
-    yesterday_local = (now_local - timedelta(days=1)).date()
-    end_date = yesterday_local.strftime("%Y-%m-%d")
-
-    # AQI statistics - compute per-day averages then average across days
-    from collections import defaultdict
-
-    # Group AQI and PM2.5 values by local date string
-    daily_aqi_map = defaultdict(list)
-    daily_pm25_map = defaultdict(list)
-    aqi_values = []
-    pm25_values = []
-    for loc in locations:
-        ts = loc.get("timestamp")
-        if ts is None:
-            continue
-        # make tz-aware if naive: interpret naive timestamps as VN-local
-        if ts.tzinfo is None:
-            ts = ts.replace(tzinfo=vn_tz)
-        # convert to VN local for grouping and for excluding today
-        ts_local = ts.astimezone(vn_tz)
-        if ts_local.date() == today_local:
-            # skip today's partial data
-            continue
-        # record is valid for stats
-        valid_records.append(loc)
-
-        if loc.get("aqi") is not None and loc.get("aqi") > 0:
-            date_str = ts_local.strftime("%Y-%m-%d")
-            daily_aqi_map[date_str].append(loc["aqi"])
-            aqi_values.append(loc["aqi"])  # keep flat list for max/min
-
-        if loc.get("pm25") is not None and loc.get("pm25") > 0:
-            date_str = ts_local.strftime("%Y-%m-%d")
-            daily_pm25_map[date_str].append(loc["pm25"])
-            pm25_values.append(loc["pm25"])  # keep flat list for max/min
-    print('[get_location_stats] daily_aqi_map:', daily_aqi_map)
-    # total_records should count valid_records (we excluded today's records above)
-    total_records = len(valid_records)
-    if valid_records:
-        valid_timestamps = [r["timestamp"] for r in valid_records if r.get("timestamp") is not None]
-        min_ts = min(valid_timestamps)
-        if min_ts.tzinfo is None:
-            min_ts = min_ts.replace(tzinfo=vn_tz)
-        start_date = min_ts.astimezone(vn_tz).strftime("%Y-%m-%d")
     else:
-        start_date = None
-    # Average across days (only days that have values)
-    daily_aqi_avgs = [sum(v) / len(v) for v in daily_aqi_map.values()] if daily_aqi_map else []
-    avg_aqi = sum(daily_aqi_avgs) / len(daily_aqi_avgs) if daily_aqi_avgs else None
-    max_aqi = max(aqi_values) if aqi_values else None
-    min_aqi = min(aqi_values) if aqi_values else None
-
-    # PM2.5: average across days
-    daily_pm25_avgs = [sum(v) / len(v) for v in daily_pm25_map.values()] if daily_pm25_map else []
-    avg_pm25 = sum(daily_pm25_avgs) / len(daily_pm25_avgs) if daily_pm25_avgs else None
-    max_pm25 = max(pm25_values) if pm25_values else None
-    min_pm25 = min(pm25_values) if pm25_values else None
-   
-
-    # Most visited location
-    address_counts = {}
-    for loc in locations:
-        addr = loc.get("address")
-        if addr:
-            address_counts[addr] = address_counts.get(addr, 0) + 1
-
-    most_visited = max(address_counts.items(), key=lambda x: x[1])[0] if address_counts else None
-    unique_locations = len(address_counts)
-
-    # Tính daily_avg_aqi: mảng các dict {date, avg_aqi}, chỉ lấy từ ngày -7 đến -1 (không lấy hôm nay)
-    import datetime as dt
-    today = dt.datetime.now(timezone(timedelta(hours=7))).date()
-    # Lấy các ngày từ -7 đến -1 (không lấy hôm nay)
-    valid_dates = [(today - dt.timedelta(days=i)).strftime("%Y-%m-%d") for i in range(1, 8)]
-    daily_avg_aqi = [
-        {"date": date, "avg_aqi": round(sum(daily_aqi_map[date]) / len(daily_aqi_map[date]), 1)}
-        for date in sorted(daily_aqi_map.keys())
-        if date in valid_dates
-    ]
-
-    length = len(daily_avg_aqi)
-    return LocationHistoryStats(
-        total_records=total_records,
-        date_range={"start": start_date, "end": end_date},
-        avg_aqi=round(avg_aqi, 1) if avg_aqi is not None else None,
-        max_aqi=max_aqi,
-        min_aqi=min_aqi,
-        avg_pm25=round(avg_pm25, 1) if avg_pm25 is not None else None,
-        max_pm25=round(max_pm25, 1) if max_pm25 else None,
-        min_pm25=round(min_pm25, 1) if min_pm25 else None,
-        most_visited_location=most_visited,
+        # Aggregate per VN-local day in MongoDB (DB stores timestamps in UTC)
+        cursor = db.locations.aggregate(location_stats_pipeline(user_id, cutoff_utc))
+        result = (await cursor.to_list(length=1))[0]
+        addresses = result["addresses"][0] if result["addresses"] else {"top": None, "unique": 0}
+        day_stats, most_visited, unique_locations = result["days"], addresses["top"], addresses["unique"]
+    
+    return summarize_location_stats(
+        day_stats,
+        most_visited=most_visited,
         unique_locations=unique_locations,
-        daily_avg_aqi=daily_avg_aqi,
-        length=length
+        now_local=now_local_for_cutoff
     )
 
 
@@ -399,15 +602,25 @@ async def get_stats_for_day(
     except Exception:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid date format, expected YYYY-MM-DD")
 
-    cursor = db.locations.find({
-        "user_id": user_id,
-        "timestamp": {"$gte": start_utc, "$lt": end_utc}
-    })
-
-    records = await cursor.to_list(length=10000)
+    if settings.LOCATION_ROLLUPS_ENABLED:
+        day_stats = await rollup_day(db, user_id, start_local.strftime("%Y-%m-%d"))
+        if day_stats is not None:
+            totals = {"total": day_stats["count"]}
+            for field in ("aqi", "pm25"):
+                count = day_stats[f"{field}_count"]
+                totals[f"{field}_avg"] = day_stats[f"{field}_sum"] / count if count else None
+                totals[f"{field}_min"] = day_stats[f"{field}_min"]
+                totals[f"{field}_max"] = day_stats[f"{field}_max"]
+            address_counts = day_stats["addresses"]
+        else:
+            totals = None
+    else:
+        cursor = db.locations.aggregate(day_stats_pipeline(user_id, start_utc, end_utc))
+        result = (await cursor.to_list(length=1))[0]
+        totals = result["totals"][0] if result["totals"] and result["totals"][0]["total"] else None
+        address_counts = {a["_id"]: a["count"] for a in result["addresses"]}
 
-    total = len(records)
-    if total == 0:
+    if totals is None:
         return {
             "date": date,
             "total_records": 0,
@@ -421,36 +634,17 @@ async def get_stats_for_day(
             "unique_locations": 0
         }
 
-    aqi_values = [r["aqi"] for r in records if r.get("aqi") is not None and r.get("aqi") > 0]
-    avg_aqi = round(sum(aqi_values) / len(aqi_values), 1) if aqi_values else None
-    max_aqi = max(aqi_values) if aqi_values else None
-    min_aqi = min(aqi_values) if aqi_values else None
-
-    pm25_values = [r.get("pm25") for r in records if r.get("pm25") is not None and r.get("pm25") > 0]
-    avg_pm25 = round(sum(pm25_values) / len(pm25_values), 1) if pm25_values else None
-    max_pm25 = max(pm25_values) if pm25_values else None
-    min_pm25 = min(pm25_values) if pm25_values else None
-
-    address_counts = {}
-    for r in records:
-        addr = r.get("address")
-        if addr:
-            address_counts[addr] = address_counts.get(addr, 0) + 1
-
-    most_visited = max(address_counts.items(), key=lambda x: x[1])[0] if address_counts else None
-    unique_locations = len(address_counts)
-
     return {
         "date": date,
-        "total_records": total,
-        "avg_aqi": avg_aqi,
-        "max_aqi": max_aqi,
-        "min_aqi": min_aqi,
-        "avg_pm25": avg_pm25,
-        "max_pm25": max_pm25,
-        "min_pm25": min_pm25,
+        "total_records": totals["total"],
+        "avg_aqi": round(totals["aqi_avg"], 1) if totals["aqi_avg"] is not None else None,
+        "max_aqi": totals["aqi_max"],
+        "min_aqi": totals["aqi_min"],
+        "avg_pm25": round(totals["pm25_avg"], 1) if totals["pm25_avg"] is not None else None,
+        "max_pm25": totals["pm25_max"],
+        "min_pm25": totals["pm25_min"],
         "most_visited_location": address_counts,
-        "unique_locations": unique_locations,
+        "unique_locations": len(address_counts),
     }
 
 
@@ -470,6 +664,7 @@ async def clear_location_history(
     
     # Build query
     query = {"user_id": user_id}
+    cutoff_date = None
     
     if days:
         cutoff_date = datetime.utcnow() - timedelta(days=days)
@@ -478,4 +673,8 @@ async def clear_location_history(
     # Delete records
     result = await db.locations.delete_many(query)
     
+    if settings.LOCATION_ROLLUPS_ENABLED:
+        # Drop rollups of deleted days, rebuild the day the cutoff falls in
+        await remove_rollups_before(db, user_id, cutoff_date)
+    
     return {"deleted_count": result.deleted_count}
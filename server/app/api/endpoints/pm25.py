@@ -1,16 +1,22 @@
 """
 PM2.5 API endpoints
 """
+import asyncio
 import logging
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, List, Optional
 
-import httpx
+import numpy as np
+from app.core.config import settings
+from app.core.executor import raster_executor
+from app.core.timing import span
+from app.models.pm25 import PointsQuery
 from app.services import (create_tile_png, create_transparent_tile,
-                          get_aqi_category, get_available_dates,
-                          get_tif_file_path, pm25_to_aqi)
-from fastapi import APIRouter, HTTPException, Query
-from rio_tiler.io import Reader
+                          datacube, etag_matches, get_aqi_category,
+                          get_available_dates, get_tif_entry, make_tile_etag,
+                          make_tile_key, pm25_to_aqi, read_tile, sample_point,
+                          sample_points, tile_cache, weather_service)
+from fastapi import APIRouter, Header, HTTPException, Query
 from starlette.responses import Response
 
 logger = logging.getLogger(__name__)
@@ -31,6 +37,48 @@ async def get_pm25_dates():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _query_point(abs_path: str, mtime_ns: int, lon: float, lat: float, date: Optional[str]) -> dict:
+    """Read the PM2.5 value at a coordinate (blocking - run on the raster executor)"""
+    try:
+        sample = sample_point(abs_path, lon, lat, mtime_ns)
+        
+        # Check bounds
+        if not sample["in_bounds"]:
+            return {
+                "lon": lon,
+                "lat": lat,
+                "pm25": None,
+                "aqi": None,
+                "category": None,
+                "message": "Coordinates out of bounds"
+            }
+        
+        pm25_value = sample["value"]
+        aqi_value = pm25_to_aqi(pm25_value) if pm25_value is not None else None
+        category = get_aqi_category(aqi_value)
+        
+        return {
+            "lon": lon,
+            "lat": lat,
+            "pm25": pm25_value,
+            "aqi": aqi_value,
+            "category": category,
+            "date": date,
+            "unit": "μg/m³"
+        }
+        
+    except Exception as e:
+        logger.error(f"Error converting coordinates: {e}")
+        return {
+            "lon": lon,
+            "lat": lat,
+            "pm25": None,
+            "aqi": None,
+            "category": None,
+            "error": str(e)
+        }
+
+
 @router.get("/point")
 async def get_pm25_point(
     lon: float = Query(..., description="Longitude"),
@@ -39,66 +87,119 @@ async def get_pm25_point(
 ):
     """Get PM2.5 and AQI value at a specific coordinate"""
     try:
-        import rasterio
-        from rasterio.transform import rowcol
+        with span("locate"):
+            tif_entry = get_tif_entry(date)
+            abs_path = str(tif_entry["path"].resolve())
         
-        tif_path = get_tif_file_path(date)
-        abs_path = str(tif_path.resolve())
+        logger.info(f"Point query: lon={lon}, lat={lat}, date={date}, file={tif_entry['filename']}")
         
-        logger.info(f"Point query: lon={lon}, lat={lat}, date={date}, file={tif_path.name}")
+        return await raster_executor.run(_query_point, abs_path, tif_entry["mtime_ns"], lon, lat, date)
+                
+    except FileNotFoundError as e:
+        logger.error(f"File not found for date {date}: {e}")
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error getting PM2.5 point value: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _sample_batch(groups: Dict[str, dict]) -> Dict[str, dict]:
+    """
+    Sample each file once for its group of points (blocking - run on the raster executor)
+    
+    Args:
+        groups: Mapping of date string to {"path", "mtime_ns", "lons", "lats"}
         
-        with rasterio.open(abs_path) as src:
+    Returns:
+        Mapping of date string to sample_points() results (or {"error": ...})
+    """
+    samples = {}
+    for date_str, group in groups.items():
+        try:
+            samples[date_str] = sample_points(group["path"], group["lons"], group["lats"], group["mtime_ns"])
+        except Exception as e:
+            logger.warning(f"Error reading data for date {date_str}: {e}")
+            samples[date_str] = {"error": str(e)}
+    return samples
+
+
+@router.post("/points")
+async def get_pm25_points(payload: PointsQuery):
+    """
+    Get PM2.5 and AQI values for many coordinates in one call
+    
+    Points are grouped by date so each GeoTIFF is read once. Results are
+    returned in input order.
+    """
+    try:
+        points = payload.points
+        results: List[Optional[dict]] = [None] * len(points)
+        
+        # Group point indices by resolved file date
+        indices_by_date: Dict[str, List[int]] = {}
+        paths: Dict[str, str] = {}
+        mtimes: Dict[str, int] = {}
+        for i, point in enumerate(points):
             try:
-                row, col = rowcol(src.transform, lon, lat)
-                
-                # Check bounds
-                if row < 0 or row >= src.height or col < 0 or col >= src.width:
-                    return {
-                        "lon": lon,
-                        "lat": lat,
-                        "pm25": None,
-                        "aqi": None,
-                        "category": None,
-                        "message": "Coordinates out of bounds"
-                    }
-                
-                # Read pixel value
-                value = src.read(1)[row, col]
-                
-                # Check for nodata
-                if src.nodata is not None and value == src.nodata:
-                    value = None
-                
-                pm25_value = float(value) if value is not None else None
-                aqi_value = pm25_to_aqi(pm25_value) if pm25_value is not None else None
-                category = get_aqi_category(aqi_value)
-                
-                return {
-                    "lon": lon,
-                    "lat": lat,
-                    "pm25": pm25_value,
-                    "aqi": aqi_value,
-                    "category": category,
-                    "date": date,
-                    "unit": "μg/m³"
-                }
-                
-            except Exception as e:
-                logger.error(f"Error converting coordinates: {e}")
-                return {
-                    "lon": lon,
-                    "lat": lat,
+                tif_entry = get_tif_entry(point.date)
+            except FileNotFoundError as e:
+                results[i] = {
+                    "lon": point.lon,
+                    "lat": point.lat,
                     "pm25": None,
                     "aqi": None,
                     "category": None,
+                    "date": point.date,
                     "error": str(e)
                 }
-                
-    except FileNotFoundError as e:
-        logger.error(f"File not found for date {date}: {e}")
-        raise HTTPException(status_code=404, detail=str(e))
+                continue
+            date_str = tif_entry["date_str"]
+            paths[date_str] = str(tif_entry["path"].resolve())
+            mtimes[date_str] = tif_entry["mtime_ns"]
+            indices_by_date.setdefault(date_str, []).append(i)
+        
+        groups = {
+            date_str: {
+                "path": paths[date_str],
+                "mtime_ns": mtimes[date_str],
+                "lons": np.array([points[i].lon for i in indices]),
+                "lats": np.array([points[i].lat for i in indices]),
+            }
+            for date_str, indices in indices_by_date.items()
+        }
+        samples = await raster_executor.run(_sample_batch, groups)
+        
+        for date_str, indices in indices_by_date.items():
+            sample = samples[date_str]
+            for j, i in enumerate(indices):
+                result = {
+                    "lon": points[i].lon,
+                    "lat": points[i].lat,
+                    "pm25": None,
+                    "aqi": None,
+                    "category": None,
+                    "date": date_str
+                }
+                if "error" in sample:
+                    result["error"] = sample["error"]
+                elif not sample["in_bounds"][j]:
+                    result["message"] = "Coordinates out of bounds"
+                elif not np.isnan(sample["values"][j]):
+                    pm25_value = float(sample["values"][j])
+                    aqi_value = pm25_to_aqi(pm25_value)
+                    result["pm25"] = pm25_value
+                    result["aqi"] = aqi_value
+                    result["category"] = get_aqi_category(aqi_value)
+                results[i] = result
+        
+        return {
+            "count": len(results),
+            "results": results,
+            "unit": "μg/m³"
+        }
+        
     except Exception as e:
-        logger.error(f"Error getting PM2.5 point value: {e}", exc_info=True)
+        logger.error(f"Error getting PM2.5 point values: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -109,26 +210,39 @@ async def get_pm25_tile(
     y: int,
     date: Optional[str] = Query(None, description="Date in YYYYMMDD format"),
     colormap_name: str = Query("aqi", description="Colormap name"),
-    rescale: Optional[str] = Query(None, description="Min,Max rescaling values")
+    rescale: Optional[str] = Query(None, description="Min,Max rescaling values"),
+    if_none_match: Optional[str] = Header(None)
 ):
     """Get PM2.5 tile with AQI colormap"""
     try:
-        tif_path = get_tif_file_path(date)
-        abs_path = str(tif_path.resolve())
+        with span("locate"):
+            tif_entry = get_tif_entry(date)
+            abs_path = str(tif_entry["path"].resolve())
+            
+            # logger.info(f"Tile request: z={z}, x={x}, y={y}, date={date}, colormap={colormap_name}")
+            
+            cache_key = make_tile_key(tif_entry, z, x, y, colormap_name, rescale)
+            etag = make_tile_etag(cache_key)
+            headers = {"ETag": etag}
         
-        # logger.info(f"Tile request: z={z}, x={x}, y={y}, date={date}, colormap={colormap_name}")
+        # Client already has this exact tile
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        
+        if settings.TILE_CACHE_ENABLED:
+            with span("cache"):
+                cached = tile_cache.get(cache_key)
+            if cached is not None:
+                return Response(content=cached[0], media_type="image/png", headers=headers)
         
         # Read tile using rio-tiler
-        with Reader(abs_path) as src:
-            img = src.tile(x, y, z)
-            
-            # Check if tile has data
-            if img.data.size == 0:
-                png_bytes = create_transparent_tile()
-                return Response(content=png_bytes, media_type="image/png")
-            
-            data = img.data[0]
-            mask = img.mask[0] if img.mask is not None else None
+        tile = await raster_executor.run(read_tile, abs_path, x, y, z)
+        
+        # Check if tile has data
+        if tile is None:
+            png_bytes = create_transparent_tile()
+        else:
+            data, mask = tile
             
             # Parse rescale for non-AQI colormaps
             vmin, vmax = 0, 150
@@ -136,8 +250,11 @@ async def get_pm25_tile(
                 vmin, vmax = map(float, rescale.split(','))
             
             # Create PNG tile
-            png_bytes = create_tile_png(data, mask, colormap_name, vmin, vmax)
-            return Response(content=png_bytes, media_type="image/png")
+            png_bytes = await raster_executor.run_cpu(create_tile_png, data, mask, colormap_name, vmin, vmax)
+        
+        if settings.TILE_CACHE_ENABLED:
+            tile_cache.set(cache_key, (png_bytes, etag))
+        return Response(content=png_bytes, media_type="image/png", headers=headers)
             
     except FileNotFoundError as e:
         logger.error(f"File not found for date {date}: {e}")
@@ -147,6 +264,44 @@ async def get_pm25_tile(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _read_forecast_values(entries: Dict[str, dict], lon: float, lat: float) -> Dict[str, Optional[float]]:
+    """
+    Read PM2.5 values at a coordinate for several dates (blocking - run on the raster executor)
+    
+    Dates held in the datacube come from one contiguous time-series read;
+    the rest are sampled file by file.
+    
+    Args:
+        entries: Mapping of YYYYMMDD date string to GeoTIFF catalog entry
+        
+    Returns:
+        Mapping of date string to PM2.5 value (None for nodata/negative/out of bounds)
+    """
+    values = {}
+    if settings.CUBE_ENABLED:
+        try:
+            with span("cube"):
+                values = datacube.sample_series(lon, lat, {d: e["mtime_ns"] for d, e in entries.items()})
+        except Exception as e:
+            logger.warning(f"Datacube read failed, falling back to GeoTIFFs: {e}")
+    
+    for date_str, entry in entries.items():
+        if date_str in values:
+            continue
+        values[date_str] = None
+        try:
+            values[date_str] = sample_point(str(entry["path"].resolve()), lon, lat, entry["mtime_ns"])["value"]
+        except Exception as e:
+            logger.warning(f"Error reading data for date {date_str}: {e}")
+    
+    return {d: (v if v is not None and v >= 0 else None) for d, v in values.items()}
+
+
+async def _get_weather(lat: float, lon: float, days: int) -> dict:
+    with span("weather"):
+        return await weather_service.get_daily(lat, lon, days)
+
+
 @router.get("/forecast")
 async def get_pm25_forecast(
     lon: float = Query(..., description="Longitude"),
@@ -158,46 +313,34 @@ async def get_pm25_forecast(
     Returns null for dates without data
     """
     try:
-        import rasterio
-        from rasterio.transform import rowcol
-
-        # Fetch weather forecast from Open-Meteo API
-        weather_data = {}
-        try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                weather_url = f"https://api.open-meteo.com/v1/forecast?latitude={lat}&longitude={lon}&daily=temperature_2m_max,temperature_2m_min,relative_humidity_2m_mean,wind_speed_10m_max,rain_sum&timezone=Asia/Bangkok&forecast_days={days}"
-                weather_response = await client.get(weather_url)
-                
-                if weather_response.status_code == 200:
-                    weather_json = weather_response.json()
-                    daily = weather_json.get("daily", {})
-                    
-                    # Map weather data by date
-                    for i, date_str in enumerate(daily.get("time", [])):
-                        weather_data[date_str] = {
-                            "temp_max": daily.get("temperature_2m_max", [])[i] if i < len(daily.get("temperature_2m_max", [])) else None,
-                            "temp_min": daily.get("temperature_2m_min", [])[i] if i < len(daily.get("temperature_2m_min", [])) else None,
-                            "humidity": daily.get("relative_humidity_2m_mean", [])[i] if i < len(daily.get("relative_humidity_2m_mean", [])) else None,
-                            "wind_speed": daily.get("wind_speed_10m_max", [])[i] if i < len(daily.get("wind_speed_10m_max", [])) else None,
-                            "rain_sum": daily.get("rain_sum", [])[i] if i < len(daily.get("rain_sum", [])) else None,
-                        }
-                    logger.info(f"✅ Weather data fetched for {len(weather_data)} days")
-                else:
-                    logger.warning(f"⚠️ Weather API returned {weather_response.status_code}")
-        except Exception as e:
-            logger.warning(f"⚠️ Could not fetch weather data: {e}")
-
-        # Get available dates
-        available_dates_list = get_available_dates()
-        if not available_dates_list:
-            raise HTTPException(status_code=404, detail="No PM2.5 data available")
-        
-        # Find today's date or closest available
-        available_date_strs = {d["date_str"]: d for d in available_dates_list}
+        with span("locate"):
+            # Get available dates
+            available_dates_list = get_available_dates()
+            if not available_dates_list:
+                raise HTTPException(status_code=404, detail="No PM2.5 data available")
+            
+            # Find today's date or closest available
+            available_date_strs = {d["date_str"]: d for d in available_dates_list}
+            
+            # Generate forecast for next N days
+            forecast_data = []
+            current_date = datetime.now()
+            
+            # Read PM2.5 values for all forecast days in one executor call
+            forecast_entries = {}
+            for i in range(days):
+                date_str = (current_date + timedelta(days=i)).strftime("%Y%m%d")
+                if date_str in available_date_strs:
+                    try:
+                        forecast_entries[date_str] = get_tif_entry(date_str)
+                    except Exception as e:
+                        logger.warning(f"Error reading data for date {date_str}: {e}")
         
-        # Generate forecast for next N days
-        forecast_data = []
-        current_date = datetime.now()
+        # Weather (pooled client + cache) and PM2.5 sampling run concurrently
+        weather_data, pm25_values = await asyncio.gather(
+            _get_weather(lat, lon, days),
+            raster_executor.run(_read_forecast_values, forecast_entries, lon, lat),
+        )
         
         for i in range(days):
             forecast_date = current_date + timedelta(days=i)
@@ -217,27 +360,11 @@ async def get_pm25_forecast(
             aqi_value = None
             category = None
             
-            if date_str in available_date_strs:
-                try:
-                    tif_path = get_tif_file_path(date_str)
-                    abs_path = str(tif_path.resolve())
-                    
-                    with rasterio.open(abs_path) as src:
-                        row, col = rowcol(src.transform, lon, lat)
-                        
-                        # Check bounds
-                        if 0 <= row < src.height and 0 <= col < src.width:
-                            value = src.read(1)[row, col]
-                            
-                            # Check for nodata
-                            if src.nodata is None or value != src.nodata:
-                                pm25_value = float(value) if value >= 0 else None
-                                if pm25_value is not None:
-                                    aqi_value = pm25_to_aqi(pm25_value)
-                                    category = get_aqi_category(aqi_value)
-                
-                except Exception as e:
-                    logger.warning(f"Error reading data for date {date_str}: {e}")
+            if date_str in pm25_values:
+                pm25_value = pm25_values[date_str]
+                if pm25_value is not None:
+                    aqi_value = pm25_to_aqi(pm25_value)
+                    category = get_aqi_category(aqi_value)
             
             # Day of week: Monday=0 -> Sunday=6
             day_names = ["T2", "T3", "T4", "T5", "T6", "T7", "CN"]
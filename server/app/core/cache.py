@@ -0,0 +1,111 @@
+"""
+In-process caches with hit/miss/eviction counters
+"""
+import threading
+import time
+from typing import Any, Callable, Hashable, Optional
+
+from cachetools import LRUCache, TLRUCache
+
+
+class _CountingLRUCache(LRUCache):
+    """LRUCache that counts entries evicted to make room for new ones"""
+
+    def __init__(self, maxsize, getsizeof=None):
+        super().__init__(maxsize, getsizeof=getsizeof)
+        self.evictions = 0
+
+    def popitem(self):
+        # LRUCache only calls popitem() when it needs to free space
+        self.evictions += 1
+        return super().popitem()
+
+
+class _CountingTLRUCache(TLRUCache):
+    """TLRUCache that counts entries evicted to make room for new ones (expired entries aren't counted)"""
+
+    def __init__(self, maxsize, ttu, timer, getsizeof=None):
+        super().__init__(maxsize, ttu, timer=timer, getsizeof=getsizeof)
+        self.evictions = 0
+
+    def popitem(self):
+        self.evictions += 1
+        return super().popitem()
+
+
+class BoundedCache:
+    """
+    Thread-safe, size-bounded LRU cache
+
+    Args:
+        maxsize: Maximum total size of the cache
+        getsizeof: Optional function returning the size of a value
+            (defaults to 1 per entry, i.e. maxsize is an entry count)
+        ttu: Optional function (key, value, now) -> time at which the entry
+            expires; expired entries are never returned
+        timer: Clock used with ttu (default: time.time)
+    """
+
+    # Cumulative stats() fields, exported as counters by /metrics
+    COUNTER_FIELDS = ("hits", "misses", "evictions")
+
+    def __init__(
+        self,
+        maxsize: int,
+        getsizeof: Optional[Callable[[Any], int]] = None,
+        ttu: Optional[Callable[[Hashable, Any, float], float]] = None,
+        timer: Callable[[], float] = time.time,
+    ):
+        if ttu is None:
+            self._cache = _CountingLRUCache(maxsize, getsizeof=getsizeof)
+        else:
+            self._cache = _CountingTLRUCache(maxsize, ttu, timer, getsizeof=getsizeof)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for key, or None on a miss"""
+        with self._lock:
+            value = self._cache.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store a value, evicting least recently used entries as needed"""
+        with self._lock:
+            try:
+                self._cache[key] = value
+            except ValueError:
+                # Value is larger than the whole cache - don't store it
+                pass
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        """Remove a key and return its value (None if absent)"""
+        with self._lock:
+            return self._cache.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop all entries (counters are kept)"""
+        with self._lock:
+            self._cache.clear()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def stats(self) -> dict:
+        """Snapshot of cache counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._cache),
+                "size": self._cache.currsize,
+                "max_size": self._cache.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self._cache.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            }
@@ -32,13 +32,59 @@ class Settings(BaseSettings):
     # Data paths
     BASE_DIR: Path = Path(__file__).parent.parent.parent  # Go up to server/ directory
     TIF_DIR: Path = BASE_DIR / "data" / "tif_files"
+    TIF_CATALOG_POLL_SECONDS: float = 30.0  # 0 disables watching for new files
+
+    # Memory-mapped grids for point lookups (see scripts/ingest_grids.py)
+    GRID_DIR: Path = BASE_DIR / "data" / "grids"
+    GRID_STORE_ENABLED: bool = True  # use ingested grids when present
+    GRID_STORE_AUTO_INGEST: bool = False  # ingest new GeoTIFFs as the catalog sees them
+    GRID_STORE_DTYPE: str = "float32"  # or "uint16" (scaled, half the size)
+    GRID_UINT16_SCALE: float = 0.1  # µg/m³ per uint16 step
+
+    # Time-stacked datacube for /pm25/forecast (see scripts/build_datacube.py)
+    CUBE_DIR: Path = BASE_DIR / "data" / "cube"
+    CUBE_SLOTS: int = 32  # number of dates kept; the oldest is replaced when full
+    CUBE_ENABLED: bool = True  # use the cube for forecasts when present
+    CUBE_AUTO_UPDATE: bool = False  # add new GeoTIFFs to the cube as the catalog sees them
     
     # PM2.5 Settings
     DEFAULT_COLORMAP: str = "aqi"
     DEFAULT_OPACITY: float = 0.6
     TILE_SIZE: int = 256
     MAX_ZOOM: int = 18
+    PM25_BATCH_MAX_POINTS: int = 5000  # max coordinates per POST /pm25/points
+
+    # Open-Meteo weather for /pm25/forecast
+    WEATHER_API_URL: str = "https://api.open-meteo.com/v1/forecast"
+    WEATHER_TIMEOUT: float = 10.0
+    WEATHER_MAX_CONNECTIONS: int = 10
+    WEATHER_CACHE_TTL: float = 3600.0  # seconds a response is served as fresh
+    WEATHER_CACHE_STALE_SECONDS: float = 3 * 3600.0  # then served stale while refreshing
+    WEATHER_CACHE_CELL_DEG: float = 0.05  # coordinates are rounded to this grid
+    WEATHER_CACHE_MAX_ENTRIES: int = 4096
+
+    # Rendered tile cache (size in bytes of encoded PNGs)
+    TILE_CACHE_ENABLED: bool = True
+    TILE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+
+    # Raster executor (keeps rasterio / PIL work off the event loop)
+    RASTER_MAX_WORKERS: int = 4
+    RASTER_MAX_CONCURRENCY: int = 16
+    RASTER_PROCESS_WORKERS: int = 0  # > 0 encodes PNG tiles in worker processes
     
+    # Password executor (bcrypt runs here, off the event loop)
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 64  # logins/registrations waiting for a worker before new ones get 503
+
+    # Open GeoTIFF dataset pool
+    DATASET_POOL_IDLE_TTL: float = 300.0  # seconds before an unused handle is closed
+    DATASET_POOL_MAX_IDLE_PER_FILE: int = 4
+
+    # GDAL caches (applied at startup)
+    GDAL_CACHEMAX: int = 256  # block cache size in MB
+    VSI_CACHE: bool = True
+    VSI_CACHE_SIZE: int = 25 * 1024 * 1024  # bytes per opened file
+
     # AQI Breakpoints (US EPA for PM2.5)
     AQI_BREAKPOINTS: list = [
         {"pm_min": 0.0, "pm_max": 25.0, "aqi_min": 0, "aqi_max": 50, "color": (27, 190, 88, 255), "level": "Good"},
@@ -50,14 +96,50 @@ class Settings(BaseSettings):
     ]
 
     
+    # Serialize responses with orjson, and history/users lists without re-validation
+    FAST_JSON_RESPONSES: bool = False
+    
+    # Prometheus /metrics endpoint (request latency, executor, cache and MongoDB pool metrics)
+    METRICS_ENABLED: bool = True
+    
+    # Server-Timing header with per-stage durations (locate, open, read, colormap, encode, ...)
+    SERVER_TIMING_ENABLED: bool = True
+    TIMING_LOG_MS: float = 0  # log stage timings as JSON for requests at least this slow (0 = off)
+    
     # MongoDB Settings (load from .env)
     MONGODB_URL: str = "mongodb://localhost:27017"  # Default fallback
     MONGODB_DB_NAME: str = "smartair"
+    MONGO_ENSURE_INDEXES: bool = True  # create the indexes in app/db/indexes.py on connect
+    DIAGNOSTICS_ENABLED: bool = False  # serve /diagnostics/mongo (index stats and query plans)
+    MONGO_INDEX_BUILD_BACKGROUND: bool = True  # build them in the background instead of blocking startup
+    
+    # Per-user daily location rollups (run migrations/backfill_location_rollups.py once before enabling on existing data)
+    LOCATION_ROLLUPS_ENABLED: bool = False  # maintain rollups on save and serve /location/stats from them
+    
+    # Fill in PM2.5/AQI of saved locations from the GeoTIFF when the client omits them
+    LOCATION_AQI_ENRICHMENT_ENABLED: bool = True
+    
+    # POST /location/save/batch
+    LOCATION_BATCH_MAX_ITEMS: int = 5000
+    LOCATION_BATCH_MAX_FUTURE_SECONDS: int = 300  # client clock skew tolerated for item timestamps
+    
+    # Write-behind buffer for /location/save (inserts coalesced into insert_many batches)
+    LOCATION_WRITE_BEHIND_ENABLED: bool = False
+    LOCATION_WRITE_BATCH_SIZE: int = 500  # flush when this many records are queued...
+    LOCATION_WRITE_FLUSH_MS: int = 200  # ...or this long after the first one
+    LOCATION_WRITE_QUEUE_SIZE: int = 10000  # queued records before saves wait (backpressure)
+    LOCATION_WRITE_PUT_TIMEOUT: float = 5.0  # seconds a save waits for queue space before 503
     
     # JWT Settings (load from .env - SECRET_KEY is required)
     SECRET_KEY: str  # Must be set in .env file
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30 * 24 * 60  # 30 days
+    JWT_CACHE_SIZE: int = 10000  # verified tokens cached until exp (0 = verify every request)
+    JWT_BACKEND: str = "jose"  # "jose" or "pyjwt" (pip install pyjwt)
+    
+    # Profile lookups (/auth/profile*) cache; updates on other workers show up after the TTL
+    USER_CACHE_SIZE: int = 10000  # 0 = off
+    USER_CACHE_TTL: int = 60  # seconds
     
     class Config:
         case_sensitive = True
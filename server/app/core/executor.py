@@ -0,0 +1,177 @@
+"""
+Bounded executors for blocking work (raster I/O, image encoding)
+
+Keeps rasterio / rio-tiler / PIL calls off the asyncio event loop so one
+slow tile doesn't stall unrelated requests on the same worker.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.timing import record
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedExecutor:
+    """
+    Thread pool (plus optional process pool) with bounded concurrency
+
+    At most `max_concurrency` calls are submitted at once; further callers
+    wait on a semaphore, which is what the queue-depth metrics measure.
+
+    Args:
+        name: Name used for thread names and logging
+        max_workers: Thread pool size
+        max_concurrency: Maximum number of calls submitted at the same time
+        process_workers: Size of the process pool used by run_cpu()
+            (0 = run CPU-heavy work on the thread pool too)
+    """
+
+    # Cumulative stats() fields, exported as counters by /metrics
+    COUNTER_FIELDS = ("completed", "failed")
+
+    def __init__(self, name: str, max_workers: int, max_concurrency: int, process_workers: int = 0):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency
+        self.process_workers = process_workers
+        self._labels = (("executor", name),)
+        self._wait_stage = f"{name}_wait"
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        # Metrics
+        self.waiting = 0
+        self.max_waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+
+    def start(self) -> None:
+        """Create the worker pools (idempotent)"""
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            logger.info(f"{self.name} executor started: {self.max_workers} threads, "
+                        f"max concurrency {self.max_concurrency}")
+        if self.process_workers > 0 and self._processes is None:
+            self._processes = ProcessPoolExecutor(max_workers=self.process_workers)
+            logger.info(f"{self.name} executor started {self.process_workers} worker processes")
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stop the worker pools
+
+        Calls not yet started are cancelled; running calls (a raster read,
+        a bcrypt hash) are waited for if `wait`. Blocking - use aclose()
+        from the event loop.
+        """
+        pools = [pool for pool in (self._threads, self._processes) if pool is not None]
+        self._threads = None
+        self._processes = None
+        self._semaphore = None
+        for pool in pools:
+            pool.shutdown(wait=wait, cancel_futures=True)
+
+    async def aclose(self) -> None:
+        """shutdown() without blocking the event loop while running calls finish"""
+        await asyncio.to_thread(self.shutdown)
+
+    async def run(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        """Run a blocking function on the thread pool"""
+        self.start()
+        # Copy the caller's context so contextvars (e.g. request timing) carry over
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, func, *args, **kwargs)
+        return await self._submit(self._threads, call)
+
+    async def run_cpu(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        """
+        Run a CPU-heavy function, on the process pool if one is configured
+
+        func and its arguments must be picklable when a process pool is used.
+        """
+        self.start()
+        if self._processes is None:
+            return await self.run(func, *args, **kwargs)
+        return await self._submit(self._processes, functools.partial(func, *args, **kwargs))
+
+    async def _submit(self, pool: Executor, call: Callable) -> Any:
+        loop = asyncio.get_running_loop()
+        queued_at = time.perf_counter()
+        # Kept locally: shutdown() drops the executor's reference while calls still run
+        semaphore = self._semaphore
+
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        started_at = time.perf_counter()
+        waited = started_at - queued_at
+        self.total_wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        metrics.observe("executor_wait_seconds", self._labels, waited)
+        record(self._wait_stage, waited)
+        self.in_flight += 1
+        try:
+            result = await loop.run_in_executor(pool, call)
+            self.completed += 1
+            return result
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            ran = time.perf_counter() - started_at
+            self.total_run_seconds += ran
+            metrics.observe("executor_run_seconds", self._labels, ran)
+            semaphore.release()
+
+    def stats(self) -> dict:
+        """Snapshot of executor metrics"""
+        finished = self.completed + self.failed
+        return {
+            "max_workers": self.max_workers,
+            "process_workers": self.process_workers,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_wait_ms": round(self.total_wait_seconds / finished * 1000, 3) if finished else None,
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 3),
+            "avg_run_ms": round(self.total_run_seconds / finished * 1000, 3) if finished else None,
+        }
+
+
+# Executor for rasterio / rio-tiler reads and PNG encoding
+raster_executor = BoundedExecutor(
+    "raster",
+    max_workers=settings.RASTER_MAX_WORKERS,
+    max_concurrency=settings.RASTER_MAX_CONCURRENCY,
+    process_workers=settings.RASTER_PROCESS_WORKERS,
+)
+
+
+# Executor for bcrypt hashing / verification (~100-300 ms of CPU per call);
+# separate from the raster pool so a burst of logins can't starve tiles
+password_executor = BoundedExecutor(
+    "password",
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_concurrency=settings.PASSWORD_HASH_WORKERS,
+)
@@ -0,0 +1,280 @@
+"""
+In-process metrics in the Prometheus text exposition format
+
+Counters and histograms are sharded per thread: each thread (the event
+loop, executor workers, pymongo's monitoring threads) updates its own
+shard without locking, and /metrics sums the shards when scraped. The only
+lock is taken once per thread, when its shard is created.
+
+Gauges are read at scrape time from callbacks registered with
+add_gauge_source(). Those callbacks may also report counters that a
+component keeps itself (its stats() totals); such names are typed as
+counters with describe().
+"""
+import bisect
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _Shard:
+    """Metric values written by one thread"""
+
+    def __init__(self):
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        # (name, labels) -> [per-bucket counts (last one is +Inf), sum]
+        self.histograms: Dict[Tuple[str, Labels], list] = {}
+
+
+class MetricsRegistry:
+    """Counters, histograms and scrape-time gauges"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._shards_lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._gauge_sources: List[Callable[[], Iterable[Tuple[str, Labels, float]]]] = []
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = _Shard()
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def describe(self, name: str, kind: str, help_text: str, buckets: Tuple[float, ...] = None) -> None:
+        """Register the TYPE and HELP lines (and histogram buckets, if not the default) of a metric"""
+        self._help[name] = (kind, help_text)
+        if buckets is not None:
+            self._buckets[name] = buckets
+
+    def inc(self, name: str, labels: Labels = (), amount: float = 1) -> None:
+        """Add to a counter"""
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + amount
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        """Record a histogram observation"""
+        histograms = self._shard().histograms
+        key = (name, labels)
+        entry = histograms.get(key)
+        buckets = self._buckets.get(name, self.buckets)
+        if entry is None:
+            entry = histograms[key] = [[0] * (len(buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(buckets, value)] += 1
+        entry[1] += value
+
+    def counter_value(self, name: str, labels: Labels = ()) -> float:
+        """Current value of a counter, summed over all threads"""
+        with self._shards_lock:
+            shards = list(self._shards)
+        return sum(shard.counters.get((name, labels), 0) for shard in shards)
+
+    def histogram(self, name: str) -> Dict[Labels, Tuple[Tuple[float, ...], List[int], float]]:
+        """Merged (bucket bounds, per-bucket counts, sum) of a histogram, by label set"""
+        _, histograms = self._merged()
+        buckets = self._buckets.get(name, self.buckets)
+        return {
+            labels: (buckets, counts, total)
+            for (metric, labels), (counts, total) in histograms.items()
+            if metric == name
+        }
+
+    def add_gauge_source(self, source: Callable[[], Iterable[Tuple[str, Labels, float]]]) -> None:
+        """Register a callback returning (name, labels, value) samples at scrape time (gauges unless described otherwise)"""
+        self._gauge_sources.append(source)
+
+    def _merged(self):
+        counters: Dict[Tuple[str, Labels], float] = {}
+        histograms: Dict[Tuple[str, Labels], list] = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            # Copies: the owning threads keep writing while we read
+            for key, value in list(shard.counters.items()):
+                counters[key] = counters.get(key, 0) + value
+            for key, (counts, total) in list(shard.histograms.items()):
+                merged = histograms.setdefault(key, [[0] * len(counts), 0.0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+        return counters, histograms
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text format (version 0.0.4)"""
+        counters, histograms = self._merged()
+        samples: Dict[str, List[str]] = {}
+
+        for (name, labels), value in counters.items():
+            samples.setdefault(name, []).append(f"{name}{_labels(labels)} {_number(value)}")
+
+        for (name, labels), (counts, total) in histograms.items():
+            lines = samples.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip(self._buckets.get(name, self.buckets) + (math.inf,), counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else _number(bound)
+                lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+
+        for source in self._gauge_sources:
+            for name, labels, value in source():
+                if value is not None:
+                    samples.setdefault(name, []).append(f"{name}{_labels(labels)} {_number(value)}")
+
+        out = []
+        for name in sorted(samples):
+            kind, help_text = self._help.get(name, ("gauge", ""))
+            if help_text:
+                out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(sorted(samples[name]) if kind != "histogram" else samples[name])
+        return "\n".join(out) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels) + "}"
+
+
+def _number(value: float) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def estimate_quantile(q: float, buckets: Tuple[float, ...], counts: List[int]) -> Optional[float]:
+    """
+    Estimate a quantile from histogram bucket counts
+
+    Interpolates linearly inside the bucket holding the quantile, like
+    PromQL's histogram_quantile(); observations in the +Inf bucket are
+    reported as the largest finite bound.
+    """
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for i, count in enumerate(counts):
+        if count and seen + count >= rank:
+            if i == len(buckets):
+                return buckets[-1]
+            lower = buckets[i - 1] if i else 0.0
+            return lower + (buckets[i] - lower) * (rank - seen) / count
+        seen += count
+    return buckets[-1]
+
+
+def stats_samples(
+    prefix: str,
+    stats: dict,
+    counters: Iterable[str] = (),
+    labels: Labels = ()
+) -> List[Tuple[str, Labels, float]]:
+    """
+    Numeric fields of a component's stats() dict as /metrics samples
+
+    Fields become <prefix>_<field> gauges (nested dicts <prefix>_<key>_<field>).
+    Fields listed in counters - cumulative counts, given as dotted paths
+    for nested dicts, e.g. "token_cache.hits" - become <prefix>_<field>_total
+    and are typed as counters by describe_stats_counters(). Strings and None
+    are skipped.
+    """
+    counters = set(counters)
+    samples = []
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            nested = [c[len(key) + 1:] for c in counters if c.startswith(f"{key}.")]
+            samples.extend(stats_samples(f"{prefix}_{key}", value, nested, labels))
+        elif not isinstance(value, (int, float)):
+            continue
+        elif key in counters:
+            samples.append((f"{prefix}_{key}_total", labels, value))
+        else:
+            samples.append((f"{prefix}_{key}", labels, value))
+    return samples
+
+
+metrics = MetricsRegistry()
+
+metrics.describe("http_requests_total", "counter", "HTTP requests by method, route template and status")
+metrics.describe("http_request_duration_seconds", "histogram", "HTTP request latency by method and route template")
+metrics.describe("http_requests_in_flight", "gauge", "HTTP requests being processed")
+metrics.describe("executor_wait_seconds", "histogram", "Time calls waited for a worker, by executor")
+metrics.describe("executor_run_seconds", "histogram", "Time calls ran on a worker, by executor (raster reads, bcrypt)")
+metrics.describe("mongodb_command_duration_seconds", "histogram", "MongoDB command latency by command")
+metrics.describe("mongodb_command_failures_total", "counter", "Failed MongoDB commands by command")
+metrics.describe("mongodb_pool_checked_out_connections", "gauge", "MongoDB connections checked out of the pool")
+metrics.describe("mongodb_pool_max_size", "gauge", "MongoDB connection pool size limit")
+
+
+def describe_stats_counters(prefix: str, counters: Iterable[str], registry: MetricsRegistry = metrics) -> None:
+    """Register the counter fields of a component's stats() (see stats_samples())"""
+    for path in counters:
+        name = f"{prefix}_{path.replace('.', '_')}_total"
+        registry.describe(name, "counter", f"Cumulative {path} of {prefix} (stats() field)")
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request counts, latency and in-flight requests
+
+    Requests are labelled with the matched route template (e.g.
+    /pm25/tiles/{z}/{x}/{y}.png), so label cardinality stays bounded;
+    unmatched paths share the route label "<unmatched>".
+    """
+
+    def __init__(self, app, registry: MetricsRegistry = metrics):
+        self.app = app
+        self.registry = registry
+        self.in_flight = 0
+        registry.add_gauge_source(lambda: [("http_requests_in_flight", (), self.in_flight)])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+        self.in_flight += 1
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.in_flight -= 1
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "<unmatched>"
+            method = scope["method"]
+            self.registry.inc("http_requests_total",
+                              (("method", method), ("route", template), ("status", str(status_code))))
+            self.registry.observe("http_request_duration_seconds",
+                                  (("method", method), ("route", template)), time.perf_counter() - started)
@@ -0,0 +1,79 @@
+"""
+Opaque continuation tokens for keyset pagination
+
+A token encodes the sort key of the last document of a page; the next
+page is the documents after it in index order, so every page costs the
+same whatever its depth (unlike skip()).
+"""
+import base64
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException, status
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _encode(raw: str) -> str:
+    return base64.urlsafe_b64encode(raw.encode("ascii")).decode("ascii").rstrip("=")
+
+
+def _decode(token: str) -> str:
+    try:
+        return base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode("ascii")
+    except (ValueError, UnicodeDecodeError):
+        raise _invalid_cursor()
+
+
+def _invalid_cursor() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def encode_id_cursor(_id: ObjectId) -> str:
+    return _encode(str(_id))
+
+
+def decode_id_cursor(token: str) -> ObjectId:
+    """
+    Raises:
+        HTTPException: 400 if the token is malformed
+    """
+    try:
+        return ObjectId(_decode(token))
+    except InvalidId:
+        raise _invalid_cursor()
+
+
+def encode_time_cursor(ts: datetime, _id: ObjectId) -> str:
+    """Token for a (timestamp, _id) position; timestamps are kept to the millisecond, as in MongoDB"""
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    millis = (ts - _EPOCH) // timedelta(milliseconds=1)
+    return _encode(f"{millis}:{_id}")
+
+
+def decode_time_cursor(token: str) -> Tuple[datetime, ObjectId]:
+    """
+    Returns:
+        (UTC timestamp, _id) of the last document of the previous page
+
+    Raises:
+        HTTPException: 400 if the token is malformed
+    """
+    try:
+        millis, _id = _decode(token).split(":")
+        return _EPOCH + timedelta(milliseconds=int(millis)), ObjectId(_id)
+    except (ValueError, InvalidId, OverflowError):
+        raise _invalid_cursor()
+
+
+def after_time_cursor(token: Optional[str]) -> dict:
+    """Filter for documents after a (timestamp, _id) cursor in descending order"""
+    if not token:
+        return {}
+    ts, _id = decode_time_cursor(token)
+    return {"$or": [{"timestamp": {"$lt": ts}}, {"timestamp": ts, "_id": {"$lt": _id}}]}
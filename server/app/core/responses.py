@@ -0,0 +1,52 @@
+"""
+Fast JSON responses (opt-in with FAST_JSON_RESPONSES)
+
+FastJSONResponse renders with orjson when it is installed. For endpoints
+returning long lists of response models, model_list_response() serializes
+the already-built models in one pydantic-core pass, skipping the
+dump/re-validate/encode round trip FastAPI runs for response_model.
+
+Both produce the same compact UTF-8 JSON as FastAPI's default response,
+except that floats below 1e-4 or from 1e16 up are written in exponent form
+without padding (1e-5, not 1e-05).
+"""
+from functools import lru_cache
+from typing import List, Optional, Type
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - stdlib json fallback
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson (stdlib json if orjson isn't installed)"""
+
+    def render(self, content) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+@lru_cache(maxsize=None)
+def _list_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(List[model])
+
+
+def model_list_response(
+    model: Type[BaseModel],
+    items: List[BaseModel],
+    headers: Optional[dict] = None
+) -> Response:
+    """
+    JSON array of response models, serialized by alias in one pass
+
+    The items must already be instances of model (validated, or built with
+    model_construct() from trusted data); they aren't validated again.
+    """
+    body = _list_adapter(model).dump_json(items, by_alias=True)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,10 +1,18 @@
 """
 Security utilities for password hashing and JWT tokens
+
+Verified tokens are cached by SHA-256 digest until their exp claim, so the
+long-lived token a client presents on every request is only decoded and
+checked once.
 """
+import hashlib
+import logging
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Callable, Optional, Tuple
 
+from app.core.cache import BoundedCache
 from app.core.config import settings
+from app.core.executor import password_executor
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
@@ -16,6 +24,11 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 # HTTP Bearer token
 security = HTTPBearer()
 
+logger = logging.getLogger(__name__)
+
+# Claims cached for tokens without exp (create_access_token always sets one)
+_NO_EXP_CACHE_SECONDS = 300
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a plain password against a hashed password"""
     # Truncate password to 72 bytes for bcrypt (handle UTF-8 encoding)
@@ -32,6 +45,28 @@ def get_password_hash(password: str) -> str:
         password = password_bytes.decode('utf-8', errors='ignore')
     return pwd_context.hash(password)
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password() on the password executor, off the event loop"""
+    return await password_executor.run(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash() on the password executor, off the event loop"""
+    return await password_executor.run(get_password_hash, password)
+
+def check_password_capacity() -> None:
+    """
+    Reject new password work while too many calls are queued
+
+    Raises:
+        HTTPException: 503 when PASSWORD_HASH_MAX_PENDING calls are waiting
+    """
+    if password_executor.waiting >= settings.PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many login attempts in progress, please retry",
+            headers={"Retry-After": "1"},
+        )
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token"""
     to_encode = data.copy()
@@ -44,17 +79,66 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
+def _jose_decode(token: str) -> dict:
+    return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+
+def _load_jwt_backend() -> Tuple[str, Callable[[str], dict], tuple]:
+    """
+    JWT verifier selected by JWT_BACKEND
+
+    Returns:
+        (backend name, decode function, exceptions it raises for invalid tokens)
+    """
+    if settings.JWT_BACKEND == "pyjwt":
+        try:
+            import jwt as pyjwt
+        except ImportError:
+            logger.warning("⚠️ JWT_BACKEND=pyjwt but PyJWT is not installed (pip install pyjwt); using python-jose")
+        else:
+            return ("pyjwt",
+                    lambda token: pyjwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]),
+                    (pyjwt.PyJWTError,))
+    return "jose", _jose_decode, (JWTError,)
+
+jwt_backend, _backend_decode, _backend_errors = _load_jwt_backend()
+
+def _claims_expiry(key, claims: dict, now: float) -> float:
+    exp = claims.get("exp")
+    return float(exp) if isinstance(exp, (int, float)) else now + _NO_EXP_CACHE_SECONDS
+
+# Verified token digest -> claims, dropped at the token's exp
+token_cache = BoundedCache(max(settings.JWT_CACHE_SIZE, 1), ttu=_claims_expiry)
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
 def decode_token(token: str) -> dict:
-    """Decode and verify a JWT token"""
+    """
+    Decode and verify a JWT token
+
+    Valid tokens are served from token_cache until they expire; invalid
+    ones are never cached. Returns the claims (treat as read-only).
+    """
+    key = hashlib.sha256(token.encode("utf-8")).digest() if settings.JWT_CACHE_SIZE > 0 else None
+    if key is not None:
+        claims = token_cache.get(key)
+        if claims is not None:
+            return claims
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        return payload
-    except JWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        claims = _backend_decode(token)
+    except _backend_errors:
+        raise _credentials_exception()
+    if key is not None:
+        token_cache.set(key, claims)
+    return claims
+
+def auth_stats() -> dict:
+    """JWT backend and verified-token cache counters"""
+    return {"jwt_backend": jwt_backend, "token_cache": token_cache.stats()}
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     """Dependency to get current authenticated user from JWT token"""
@@ -65,10 +149,6 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     user_id: str = payload.get("user_id")
     
     if email is None or user_id is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise _credentials_exception()
     
     return {"email": email, "user_id": user_id}
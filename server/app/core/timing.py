@@ -0,0 +1,153 @@
+"""
+Per-stage request timing (Server-Timing)
+
+Endpoints wrap their stages in span("name"). The spans of a request are
+collected in a context variable, so they are picked up from executor
+threads too (BoundedExecutor.run copies the caller's context). When the
+response starts, ServerTimingMiddleware adds them as a Server-Timing
+header; afterwards it feeds them into the request_stage_duration_seconds
+histogram and, for slow requests, logs them as one JSON line.
+
+Outside a timed request span() only does a context variable lookup.
+Spans recorded in worker processes (RASTER_PROCESS_WORKERS) are lost.
+"""
+import contextvars
+import json
+import logging
+import time
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.core.metrics import estimate_quantile, metrics
+
+logger = logging.getLogger(__name__)
+
+SERVER_TIMING_HEADER = "Server-Timing"
+
+# Upper bounds (seconds) of the stage histogram buckets
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+metrics.describe("request_stage_duration_seconds", "histogram",
+                 "Time spent in each stage of a request, by route template and stage", buckets=STAGE_BUCKETS)
+
+# Stage name -> seconds for the current request (None outside timed requests)
+_stages: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("request_stages", default=None)
+
+
+class Span:
+    """Context manager adding its duration to a stage of the current request"""
+
+    __slots__ = ("name", "stages", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stages = _stages.get()
+
+    def __enter__(self) -> "Span":
+        if self.stages is not None:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self.stages is not None:
+            elapsed = time.perf_counter() - self.started
+            self.stages[self.name] = self.stages.get(self.name, 0.0) + elapsed
+
+
+def span(name: str) -> Span:
+    """
+    Time a stage of the current request
+
+    Usage:
+        with span("read"):
+            img = src.tile(x, y, z)
+
+    Repeated stages (e.g. one read per file) are summed.
+    """
+    return Span(name)
+
+
+def record(name: str, seconds: float) -> None:
+    """Add an already measured duration to a stage of the current request"""
+    stages = _stages.get()
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + seconds
+
+
+def server_timing_value(stages: Dict[str, float], total: float) -> str:
+    """Server-Timing header value (durations in milliseconds)"""
+    parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in list(stages.items())]
+    parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
+
+
+def stage_stats() -> dict:
+    """Estimated p50/p95/p99 (ms) and count per route and stage, from the stage histogram"""
+    stats: Dict[str, dict] = {}
+    for labels, (buckets, counts, _) in sorted(metrics.histogram("request_stage_duration_seconds").items()):
+        label_map = dict(labels)
+        route_stats = stats.setdefault(label_map["route"], {})
+        route_stats[label_map["stage"]] = {
+            "count": sum(counts),
+            **{
+                f"p{int(q * 100)}_ms": round(estimate_quantile(q, buckets, counts) * 1000, 3)
+                for q in (0.5, 0.95, 0.99)
+            },
+        }
+    return stats
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware collecting span() timings for each request
+
+    Requests that record no spans get no header and cost one context
+    variable set/reset.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        stages: Dict[str, float] = {}
+        token = _stages.set(stages)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if stages:
+                    value = server_timing_value(stages, time.perf_counter() - started)
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (SERVER_TIMING_HEADER.lower().encode("latin-1"), value.encode("latin-1"))
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _stages.reset(token)
+            if stages:
+                self._finish(scope, stages, status_code, time.perf_counter() - started)
+
+    def _finish(self, scope, stages: Dict[str, float], status_code: int, total: float) -> None:
+        route = getattr(scope.get("route"), "path", None) or "<unmatched>"
+        for name, seconds in list(stages.items()):
+            metrics.observe("request_stage_duration_seconds", (("route", route), ("stage", name)), seconds)
+
+        if settings.TIMING_LOG_MS > 0 and total * 1000 >= settings.TIMING_LOG_MS:
+            logger.info(json.dumps({
+                "event": "request_timing",
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": route,
+                "status": status_code,
+                "total_ms": round(total * 1000, 2),
+                "stages_ms": {name: round(seconds * 1000, 2) for name, seconds in stages.items()},
+            }))
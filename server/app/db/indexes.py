@@ -0,0 +1,152 @@
+"""
+MongoDB index registry
+
+Every index the app relies on is declared here and created by
+connect_to_mongo() at startup. create_indexes() is a no-op for indexes that
+already exist with the same keys and options, so applying the registry is
+idempotent. Default index names are used so indexes created earlier by
+migrations (e.g. username_1, email_1) are recognised as the same index.
+
+HOT_QUERIES lists the shapes of the app's frequent queries; the
+diagnostics endpoint explains them to catch collection scans.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+
+# Collection name -> indexes
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True),
+        IndexModel([("username", ASCENDING)], unique=True),
+    ],
+    "locations": [
+        # /location/history pages (sorted by timestamp, _id desc), /location/export and /location/stats
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]),
+    ],
+    "location_daily_rollups": [
+        IndexModel([("user_id", ASCENDING), ("day", ASCENDING)]),
+    ],
+}
+
+
+# Representative query shapes: (name, collection, filter, sort)
+HOT_QUERIES = [
+    ("location_history", "locations",
+     {"user_id": "", "timestamp": {"$gte": datetime(1970, 1, 1)}}, {"timestamp": -1, "_id": -1}),
+    ("location_stats", "locations",
+     {"user_id": "", "timestamp": {"$gte": datetime(1970, 1, 1)}}, None),
+    ("location_rollups", "location_daily_rollups",
+     {"user_id": "", "day": {"$gte": ""}}, None),
+    ("users_page", "users", {"_id": {"$gt": ObjectId("000000000000000000000000")}}, {"_id": 1}),
+    ("login_by_email", "users", {"email": ""}, None),
+    ("login_by_username", "users", {"username": ""}, None),
+]
+
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """
+    Create all registered indexes that don't exist yet
+
+    Failures (e.g. duplicate values blocking a unique index, or an existing
+    index with the same keys but different options) are logged and don't
+    stop the remaining indexes from being created.
+
+    Returns:
+        Mapping of collection name to index names ensured
+    """
+    ensured = {}
+    for collection, models in INDEXES.items():
+        ensured[collection] = []
+        for model in models:
+            name = model.document["name"]
+            try:
+                await db[collection].create_indexes([model])
+                ensured[collection].append(name)
+            except OperationFailure as e:
+                logger.error(f"❌ Could not create index {collection}.{name}: {e}")
+    logger.info(f"✅ MongoDB indexes ensured: {ensured}")
+    return ensured
+
+
+def _plan_stages(plan: Optional[dict]) -> List[str]:
+    """Stage names of a (classic or SBE) query plan tree, root first"""
+    if not plan:
+        return []
+    if "queryPlan" in plan:
+        plan = plan["queryPlan"]
+    stages = [plan.get("stage")] if plan.get("stage") else []
+    children = []
+    if "inputStage" in plan:
+        children.append(plan["inputStage"])
+    children.extend(plan.get("inputStages", []))
+    for child in children:
+        stages.extend(_plan_stages(child))
+    return stages
+
+
+async def index_usage(db) -> Dict[str, dict]:
+    """
+    $indexStats for every registered collection
+
+    Returns:
+        Mapping of collection name to {"indexes": [{name, key, ops, since}],
+        "missing": [registered index names that don't exist]}
+    """
+    usage = {}
+    for collection, models in INDEXES.items():
+        stats = await db[collection].aggregate([{"$indexStats": {}}]).to_list(length=None)
+        existing = {s["name"] for s in stats}
+        usage[collection] = {
+            "indexes": [
+                {
+                    "name": s["name"],
+                    "key": dict(s.get("key", {})),
+                    "ops": s.get("accesses", {}).get("ops"),
+                    "since": s.get("accesses", {}).get("since"),
+                }
+                for s in sorted(stats, key=lambda s: s["name"])
+            ],
+            "missing": [m.document["name"] for m in models if m.document["name"] not in existing],
+        }
+    return usage
+
+
+async def explain_hot_queries(db) -> List[dict]:
+    """
+    Explain each HOT_QUERIES shape and flag collection scans
+
+    Returns:
+        One {name, collection, stages, collscan} entry per query
+    """
+    results = []
+    for name, collection, query_filter, sort in HOT_QUERIES:
+        find = {"find": collection, "filter": query_filter}
+        if sort:
+            find["sort"] = sort
+        try:
+            explain = await db.command({"explain": find, "verbosity": "queryPlanner"})
+            stages = _plan_stages(explain.get("queryPlanner", {}).get("winningPlan"))
+            results.append({"name": name, "collection": collection, "stages": stages,
+                            "collscan": "COLLSCAN" in stages})
+        except OperationFailure as e:
+            results.append({"name": name, "collection": collection, "error": str(e)})
+    return results
+
+
+async def mongo_diagnostics(db) -> dict:
+    """Index usage plus hot-query plans, with COLLSCAN queries listed separately"""
+    usage, queries = await asyncio.gather(index_usage(db), explain_hot_queries(db))
+    return {
+        "indexes": usage,
+        "queries": queries,
+        "collscan_queries": [q["name"] for q in queries if q.get("collscan")],
+    }
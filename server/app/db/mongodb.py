@@ -1,7 +1,11 @@
 """
 MongoDB database connection and utilities
 """
+import asyncio
+
 from app.core.config import settings
+from app.db.indexes import ensure_indexes
+from app.db.monitoring import CommandMetricsListener, PoolMetricsListener
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
@@ -11,6 +15,7 @@ load_dotenv()
 class MongoDB:
     client: AsyncIOMotorClient = None
     db = None
+    index_task: asyncio.Task = None
 
 mongodb = MongoDB()
 
@@ -18,7 +23,9 @@ mongodb = MongoDB()
 async def connect_to_mongo():
     """Connect to MongoDB"""
     # print(f"🔄 Connecting to MongoDB at {settings.MONGODB_URL}")
-    mongodb.client = AsyncIOMotorClient(settings.MONGODB_URL)
+    # Command latency and pool usage for /metrics
+    listeners = [CommandMetricsListener(), PoolMetricsListener()] if settings.METRICS_ENABLED else []
+    mongodb.client = AsyncIOMotorClient(settings.MONGODB_URL, event_listeners=listeners)
     mongodb.db = mongodb.client[settings.MONGODB_DB_NAME]
     
     # Test connection
@@ -28,9 +35,20 @@ async def connect_to_mongo():
     except Exception as e:
         print(f"❌ Failed to connect to MongoDB: {e}")
         raise
+    
+    # Create registered indexes (idempotent)
+    if settings.MONGO_ENSURE_INDEXES:
+        if settings.MONGO_INDEX_BUILD_BACKGROUND:
+            # Don't hold up startup while large indexes build (MongoDB 4.2+
+            # builds only lock the collection briefly at start and end)
+            mongodb.index_task = asyncio.create_task(ensure_indexes(mongodb.db))
+        else:
+            await ensure_indexes(mongodb.db)
 
 async def close_mongo_connection():
     """Close MongoDB connection"""
+    if mongodb.index_task is not None and not mongodb.index_task.done():
+        mongodb.index_task.cancel()
     if mongodb.client:
         print("🔄 Closing MongoDB connection")
         mongodb.client.close()
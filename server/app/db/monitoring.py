@@ -0,0 +1,89 @@
+"""
+pymongo event listeners feeding the /metrics registry
+
+Command and pool events are delivered on the threads Motor runs pymongo
+calls on, so they only touch the calling thread's metrics shard.
+"""
+from app.core.metrics import metrics
+from pymongo import monitoring
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Latency and failures of MongoDB commands (find, insert, aggregate, ...)"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        metrics.observe("mongodb_command_duration_seconds", (("command", event.command_name),),
+                        event.duration_micros / 1e6)
+
+    def failed(self, event):
+        labels = (("command", event.command_name),)
+        metrics.observe("mongodb_command_duration_seconds", labels, event.duration_micros / 1e6)
+        metrics.inc("mongodb_command_failures_total", labels)
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """
+    Connection pool usage
+
+    Check-outs and check-ins may happen on different threads, so they are
+    counted separately and the checked-out gauge is their difference.
+    """
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        metrics.inc("mongodb_pool_connections_created_total")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        metrics.inc("mongodb_pool_connections_closed_total")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        metrics.inc("mongodb_pool_check_out_failures_total")
+
+    def connection_checked_out(self, event):
+        metrics.inc("mongodb_pool_checkouts_total")
+
+    def connection_checked_in(self, event):
+        metrics.inc("mongodb_pool_checkins_total")
+
+
+def pool_gauges(client):
+    """Checked-out and open connections, plus the pool size limit of client"""
+    created = metrics.counter_value("mongodb_pool_connections_created_total")
+    closed = metrics.counter_value("mongodb_pool_connections_closed_total")
+    checked_out = (metrics.counter_value("mongodb_pool_checkouts_total")
+                   - metrics.counter_value("mongodb_pool_checkins_total"))
+    gauges = [
+        ("mongodb_pool_checked_out_connections", (), checked_out),
+        ("mongodb_pool_open_connections", (), created - closed),
+    ]
+    if client is not None:
+        gauges.append(("mongodb_pool_max_size", (), client.options.pool_options.max_pool_size))
+    return gauges
+
+
+metrics.describe("mongodb_pool_open_connections", "gauge", "MongoDB connections open in the pool")
+metrics.describe("mongodb_pool_checkouts_total", "counter", "MongoDB connection check-outs")
+metrics.describe("mongodb_pool_checkins_total", "counter", "MongoDB connection check-ins")
+metrics.describe("mongodb_pool_check_out_failures_total", "counter", "Failed MongoDB connection check-outs")
+metrics.describe("mongodb_pool_connections_created_total", "counter", "MongoDB connections created")
+metrics.describe("mongodb_pool_connections_closed_total", "counter", "MongoDB connections closed")
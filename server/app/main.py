@@ -1,14 +1,28 @@
 """
 Main FastAPI application
 """
+import asyncio
 import logging
 
 from app.api import api_router
 from app.core.config import settings
-from app.db.mongodb import close_mongo_connection, connect_to_mongo
+from app.core.executor import password_executor, raster_executor
+from app.core.cache import BoundedCache
+from app.core.metrics import (MetricsMiddleware, describe_stats_counters,
+                              metrics, stats_samples)
+from app.core.pagination import NEXT_CURSOR_HEADER
+from app.core.responses import FastJSONResponse
+from app.core.security import auth_stats
+from app.core.timing import SERVER_TIMING_HEADER, ServerTimingMiddleware, stage_stats
+from app.db.monitoring import pool_gauges
+from app.db.mongodb import close_mongo_connection, connect_to_mongo, mongodb
+from app.services import (configure_gdal, datacube, dataset_pool,
+                          grid_store, location_write_buffer, sampling_stats,
+                          tif_catalog, tile_cache, user_cache,
+                          weather_service)
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 
 # Setup logging
 logging.basicConfig(
@@ -23,7 +37,8 @@ app = FastAPI(
     description=settings.APP_DESCRIPTION,
     version=settings.APP_VERSION,
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=FastJSONResponse if settings.FAST_JSON_RESPONSES else JSONResponse
 )
 
 # Add CORS middleware
@@ -33,16 +48,32 @@ app.add_middleware(
     allow_credentials=settings.CORS_ALLOW_CREDENTIALS,
     allow_methods=settings.CORS_ALLOW_METHODS,
     allow_headers=settings.CORS_ALLOW_HEADERS,
+    expose_headers=[NEXT_CURSOR_HEADER, SERVER_TIMING_HEADER],
 )
 
+# Per-stage timings (Server-Timing header, stage histograms)
+if settings.SERVER_TIMING_ENABLED:
+    app.add_middleware(ServerTimingMiddleware)
+
+# Request metrics for /metrics (outermost, so CORS preflights are counted too)
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Startup and shutdown events
 @app.on_event("startup")
 async def startup_event():
     """Connect to MongoDB on startup"""
     logger.info("🚀 Starting up application...")
+    configure_gdal()
+    raster_executor.start()
+    password_executor.start()
+    dataset_pool.start_sweeper()
+    weather_service.start()
     try:
         await connect_to_mongo()
         logger.info("✅ MongoDB connection established")
+        if settings.LOCATION_WRITE_BEHIND_ENABLED:
+            location_write_buffer.start()
     except Exception as e:
         logger.error(f"❌ Failed to connect to MongoDB: {e}")
         # Continue without MongoDB - some endpoints may not work
@@ -51,7 +82,13 @@ async def startup_event():
 async def shutdown_event():
     """Close MongoDB connection on shutdown"""
     logger.info("🔄 Shutting down application...")
+    await location_write_buffer.stop()  # flush queued writes while MongoDB is still connected
+    # Cancel queued raster reads / password hashes and let running ones finish off the loop
+    await asyncio.gather(raster_executor.aclose(), password_executor.aclose())
     await close_mongo_connection()
+    await dataset_pool.stop_sweeper()
+    dataset_pool.close_all()
+    await weather_service.aclose()
     logger.info("✅ Application shutdown complete")
 
 # Include API router
@@ -75,30 +112,90 @@ async def root():
     }
 
 
+def component_stats() -> dict:
+    """Executor, cache and pool stats reported by /health and /metrics"""
+    return {
+        "tile_cache": tile_cache.stats(),
+        "raster_executor": raster_executor.stats(),
+        "password_executor": password_executor.stats(),
+        "auth": auth_stats(),
+        "user_cache": user_cache.stats(),
+        "dataset_pool": dataset_pool.stats(),
+        "point_sampling": sampling_stats.stats(),
+        "grid_store": grid_store.stats(),
+        "datacube": datacube.stats(),
+        "weather_cache": weather_service.stats(),
+        "location_write_buffer": location_write_buffer.stats()
+    }
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    tif_count = len(list(settings.TIF_DIR.glob("PM25_*.tif"))) if settings.TIF_DIR.exists() else 0
+    tif_count = len(tif_catalog)
     
     return {
         "status": "healthy",
         "tif_directory": str(settings.TIF_DIR),
         "tif_directory_exists": settings.TIF_DIR.exists(),
-        "tif_files_count": tif_count
+        "tif_files_count": tif_count,
+        **component_stats(),
+        "stage_timings": stage_stats()
     }
 
 
+# Cumulative fields of each component_stats() entry; everything else is a gauge
+COMPONENT_COUNTERS = {
+    "tile_cache": BoundedCache.COUNTER_FIELDS,
+    "raster_executor": raster_executor.COUNTER_FIELDS,
+    "password_executor": password_executor.COUNTER_FIELDS,
+    "auth": tuple(f"token_cache.{field}" for field in BoundedCache.COUNTER_FIELDS),
+    "user_cache": BoundedCache.COUNTER_FIELDS,
+    "dataset_pool": dataset_pool.COUNTER_FIELDS,
+    "point_sampling": sampling_stats.COUNTER_FIELDS,
+    "weather_cache": weather_service.COUNTER_FIELDS,
+    "location_write_buffer": location_write_buffer.COUNTER_FIELDS,
+}
+
+
+def _component_samples():
+    samples = [("tif_files_count", (), len(tif_catalog))]
+    for name, stats in component_stats().items():
+        samples.extend(stats_samples(name, stats, COMPONENT_COUNTERS.get(name, ())))
+    samples.extend(pool_gauges(mongodb.client))
+    return samples
+
+
+if settings.METRICS_ENABLED:
+    for component, counters in COMPONENT_COUNTERS.items():
+        describe_stats_counters(component, counters)
+    metrics.add_gauge_source(_component_samples)
+
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    async def metrics_endpoint():
+        """Prometheus scrape endpoint"""
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.on_event("startup")
 async def startup_event():
     """Application startup event"""
     logger.info(f"Starting {settings.APP_NAME} v{settings.APP_VERSION}")
     logger.info(f"TIF directory: {settings.TIF_DIR}")
     
-    if settings.TIF_DIR.exists():
-        tif_files = list(settings.TIF_DIR.glob("PM25_*.tif"))
-        logger.info(f"Found {len(tif_files)} GeoTIFF files")
-        for tif in tif_files[:5]:  # Log first 5 files
-            logger.info(f"  - {tif.name}")
+    # Build the GeoTIFF catalog once, then watch for new files (and the
+    # directory itself, if it doesn't exist yet)
+    if settings.GRID_STORE_AUTO_INGEST:
+        tif_catalog.add_listener(grid_store.ingest_dates)
+    if settings.CUBE_AUTO_UPDATE:
+        tif_catalog.add_listener(datacube.update_dates)
+    await asyncio.to_thread(tif_catalog.refresh)
+    tif_catalog.start_watcher()
+    if tif_catalog.directory_exists():
+        dates = tif_catalog.dates()
+        logger.info(f"Found {len(dates)} GeoTIFF files")
+        for d in dates[:5]:  # Log latest 5 files
+            logger.info(f"  - {d['filename']}")
     else:
         logger.warning(f"TIF directory does not exist: {settings.TIF_DIR}")
 
@@ -107,6 +204,7 @@ async def startup_event():
 async def shutdown_event():
     """Application shutdown event"""
     logger.info("Shutting down application")
+    await tif_catalog.stop_watcher()
 
 
 
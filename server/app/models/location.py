@@ -2,8 +2,9 @@
 Location tracking models
 """
 from datetime import datetime
-from typing import Optional
+from typing import Any, List, Optional
 
+from app.core.config import settings
 from pydantic import BaseModel, Field
 
 
@@ -54,6 +55,38 @@ class LocationRecordCreate(BaseModel):
         }
 
 
+class LocationBatchItem(LocationRecordCreate):
+    """A location recorded on the device, possibly while offline"""
+    timestamp: Optional[datetime] = Field(None, description="When the point was recorded (UTC if no offset; server time if omitted)")
+
+
+class LocationBatchCreate(BaseModel):
+    """
+    Batch of queued locations
+
+    Items are validated one by one (as LocationBatchItem), so an invalid
+    item is reported in the results instead of rejecting the whole batch.
+    """
+    items: List[Any] = Field(..., min_length=1, max_length=settings.LOCATION_BATCH_MAX_ITEMS)
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "items": [
+                    {
+                        "user_id": "674d8e5c3f2a1b4d5e6f7g8h",
+                        "lat": 21.0285,
+                        "lng": 105.8542,
+                        "aqi": 141,
+                        "pm25": 84.6,
+                        "address": "Phường Dịch Vọng, Quận Cầu Giấy, Hà Nội",
+                        "timestamp": "2024-12-05T10:30:00Z"
+                    }
+                ]
+            }
+        }
+
+
 class LocationRecordResponse(BaseModel):
     """Location record response"""
     id: str = Field(alias="_id")
@@ -69,6 +102,11 @@ class LocationRecordResponse(BaseModel):
         populate_by_name = True
 
 
+class SavedLocationResponse(LocationRecordResponse):
+    """Response of /location/save: the saved record plus its AQI category"""
+    category: Optional[dict] = Field(None, description="AQI category (level, label, color)")
+
+
 class LocationHistoryStats(BaseModel):
     """Statistics for location history"""
     total_records: int
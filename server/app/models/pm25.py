@@ -0,0 +1,29 @@
+"""
+PM2.5 query models
+"""
+from typing import List, Optional
+
+from app.core.config import settings
+from pydantic import BaseModel, Field
+
+
+class PointQuery(BaseModel):
+    """A coordinate to sample, optionally for a specific date"""
+    lon: float = Field(..., ge=-180, le=180)
+    lat: float = Field(..., ge=-90, le=90)
+    date: Optional[str] = Field(None, description="Date in YYYYMMDD format (latest if omitted)")
+
+
+class PointsQuery(BaseModel):
+    """Batch of coordinates to sample"""
+    points: List[PointQuery] = Field(..., min_length=1, max_length=settings.PM25_BATCH_MAX_POINTS)
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "points": [
+                    {"lon": 105.8542, "lat": 21.0285},
+                    {"lon": 106.6297, "lat": 10.8231, "date": "20251202"}
+                ]
+            }
+        }
@@ -2,16 +2,49 @@
 Services module initialization
 """
 from .aqi_service import get_aqi_category, pm25_to_aqi
-from .geotiff_service import get_available_dates, get_tif_file_path
+from .datacube import datacube
+from .exposure_service import enrich_locations
+from .geotiff_service import (configure_gdal, dataset_pool,
+                              get_available_dates, get_tif_entry,
+                              get_tif_file_path, tif_catalog)
+from .grid_store import grid_store, ingest_tif
+from .sampling_service import sample_point, sample_points, sampling_stats
+from .tile_cache import (etag_matches, make_tile_etag, make_tile_key,
+                         tile_cache)
 from .tile_service import (apply_aqi_colormap, create_tile_png,
-                           create_transparent_tile)
+                           create_transparent_tile, read_tile)
+from .user_service import user_cache
+from .weather_service import weather_service
+from .write_buffer import (BufferClosedError, BufferFullError,
+                           location_write_buffer)
 
 __all__ = [
     "pm25_to_aqi",
     "get_aqi_category",
     "get_tif_file_path",
+    "get_tif_entry",
+    "tif_catalog",
     "get_available_dates",
+    "configure_gdal",
+    "dataset_pool",
     "apply_aqi_colormap",
     "create_tile_png",
     "create_transparent_tile",
+    "read_tile",
+    "datacube",
+    "enrich_locations",
+    "grid_store",
+    "ingest_tif",
+    "sample_point",
+    "sample_points",
+    "sampling_stats",
+    "tile_cache",
+    "make_tile_key",
+    "make_tile_etag",
+    "etag_matches",
+    "user_cache",
+    "weather_service",
+    "BufferClosedError",
+    "BufferFullError",
+    "location_write_buffer",
 ]
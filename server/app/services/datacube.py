@@ -0,0 +1,308 @@
+"""
+Time-stacked PM2.5 datacube for per-pixel time series
+
+All daily grids are stacked into one raw float32 array of shape
+(row, col, slot), stored with the time axis innermost, so the series of
+every date for one pixel is a single contiguous slice. Dates map to slots
+through a small JSON index next to the data file. The cube has a fixed
+number of slots; when it is full the oldest date's slot is reused.
+
+Files in CUBE_DIR:
+    cube.f32   raw float32 data (NaN = nodata)
+    cube.json  {"width", "height", "transform", "slots", "dates": {date_str: {"slot", "mtime_ns"}}}
+"""
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from app.core.config import settings
+from app.services.grid_store import affine_rowcol, is_nodata, nodata_mask
+
+try:
+    import fcntl
+except ImportError:  # Windows - single-writer deployments only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Reads retried when a writer replaces the index meanwhile
+READ_ATTEMPTS = 3
+
+
+class DataCube:
+    """
+    Reader/writer for the stacked datacube
+
+    Args:
+        cube_dir: Directory holding cube.f32 and cube.json
+        slots: Number of dates the cube holds
+    """
+
+    def __init__(self, cube_dir: Path, slots: int):
+        self.cube_dir = Path(cube_dir)
+        self.slots = slots
+        self.data_path = self.cube_dir / "cube.f32"
+        self.index_path = self.cube_dir / "cube.json"
+        self._lock = threading.Lock()
+        self._view = None
+        self._view_sigs = None
+
+    # ---- reading ---------------------------------------------------------
+
+    def _index_sig(self) -> Optional[tuple]:
+        """Signature of the index file; every write replaces it with a new inode"""
+        try:
+            st = os.stat(self.index_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+    def _load(self) -> Optional[Tuple[dict, object, np.memmap, tuple]]:
+        """
+        Consistent view of the cube, (re)loaded if the files changed
+
+        Returns:
+            (index, inverse transform, data mapping, index signature), never
+            modified after creation, or None if there is no cube or a writer
+            is replacing it (the data file doesn't match the index shape)
+        """
+        index_sig = self._index_sig()
+        try:
+            data_st = os.stat(self.data_path)
+        except FileNotFoundError:
+            return None
+        if index_sig is None:
+            return None
+
+        data_sig = (data_st.st_ino, data_st.st_size)
+        with self._lock:
+            view = self._view
+            if view is not None and self._view_sigs == (index_sig, data_sig):
+                return view
+
+            if view is not None and view[3] == index_sig:
+                index, inverse = view[0], view[1]
+            else:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    index = json.load(f)
+                from affine import Affine
+                inverse = ~Affine(*index["transform"])
+
+            shape = (index["height"], index["width"], index["slots"])
+            if data_st.st_size != shape[0] * shape[1] * shape[2] * 4:
+                return None
+            if view is not None and self._view_sigs[1] == data_sig and view[2].shape == shape:
+                data = view[2]
+            else:
+                data = np.memmap(self.data_path, dtype=np.float32, mode="r", shape=shape)
+
+            self._view = (index, inverse, data, index_sig)
+            self._view_sigs = (index_sig, data_sig)
+            return self._view
+
+    def sample_series(self, lon: float, lat: float, dates: Dict[str, int]) -> Dict[str, Optional[float]]:
+        """
+        Values at a coordinate for several dates, read as one contiguous slice
+
+        Writers unlist slots (replacing the index) before overwriting them,
+        so a read is only kept if the index is unchanged after it; otherwise
+        it is retried against the new index.
+
+        Args:
+            lon: Longitude
+            lat: Latitude
+            dates: Mapping of YYYYMMDD date string to the source GeoTIFF's
+                mtime_ns; dates whose cube slot is missing or was built
+                from a different file version are left out of the result
+
+        Returns:
+            Mapping of date string to value (None for nodata or out of bounds);
+            empty if the cube kept changing during the read
+        """
+        for _ in range(READ_ATTEMPTS):
+            view = self._load()
+            if view is None:
+                return {}
+            index, inverse, data, index_sig = view
+
+            stored = index["dates"]
+            wanted = {d: stored[d]["slot"] for d, mtime_ns in dates.items()
+                      if d in stored and stored[d]["mtime_ns"] == mtime_ns}
+            if not wanted:
+                return {}
+
+            row, col = affine_rowcol(inverse, lon, lat)
+            if row < 0 or row >= index["height"] or col < 0 or col >= index["width"]:
+                return {d: None for d in wanted}
+
+            series = np.array(data[row, col])
+            if self._index_sig() != index_sig:
+                continue
+
+            values = {}
+            for date_str, slot in wanted.items():
+                value = float(series[slot])
+                values[date_str] = None if is_nodata(value) else value
+            return values
+        return {}
+
+    # ---- writing ---------------------------------------------------------
+
+    @contextmanager
+    def _write_lock(self) -> Iterator[None]:
+        """Serialize writers across processes (no-op where fcntl is unavailable)"""
+        self.cube_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.cube_dir / "cube.lock", "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write_index(self, index: dict) -> None:
+        tmp_path = self.index_path.with_suffix(f".json.tmp{os.getpid()}")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _read_index_for_write(self) -> Optional[dict]:
+        if not (self.index_path.exists() and self.data_path.exists()):
+            return None
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _create(self, width: int, height: int, transform: List[float]) -> dict:
+        """Start a new, empty cube for a grid shape"""
+        index = {"width": width, "height": height, "transform": transform, "slots": self.slots, "dates": {}}
+        tmp_path = self.data_path.with_suffix(f".f32.tmp{os.getpid()}")
+        data = np.memmap(tmp_path, dtype=np.float32, mode="w+", shape=(height, width, self.slots))
+        data[:] = np.nan
+        data.flush()
+        del data
+        os.replace(tmp_path, self.data_path)
+        self._write_index(index)
+        logger.info(f"Created datacube {width}x{height} with {self.slots} slots")
+        return index
+
+    def add_dates(self, files: Dict[str, Path]) -> List[str]:
+        """
+        Write dates into the cube in one pass over the data file
+
+        Dates already stored from the same file version are skipped. A new
+        cube is started when the newest date's file has a different grid
+        (or the slot count changed); other files whose grid doesn't match
+        the cube are skipped.
+
+        Args:
+            files: Mapping of YYYYMMDD date string to GeoTIFF path
+
+        Returns:
+            Dates that were written
+        """
+        import rasterio
+
+        with self._write_lock():
+            index = self._read_index_for_write()
+            if index is not None and index["slots"] != self.slots:
+                index = None
+            stored = index["dates"] if index is not None else {}
+            newest_stored = max(stored, default="")
+
+            bands = {}
+            # Newest first: it decides the grid before any other band is kept
+            for date_str in sorted(files)[-self.slots:][::-1]:
+                tif_path = Path(files[date_str])
+                mtime_ns = tif_path.stat().st_mtime_ns
+                if date_str in stored and stored[date_str]["mtime_ns"] == mtime_ns:
+                    continue
+                with rasterio.open(str(tif_path)) as src:
+                    band = src.read(1).astype(np.float32)
+                    transform = list(tuple(src.transform)[:6])
+                    nodata = src.nodata
+                band[nodata_mask(band, nodata)] = np.nan
+                height, width = band.shape
+                if (index is None or index["width"] != width or index["height"] != height
+                        or index["transform"] != transform):
+                    if index is not None and (bands or date_str < newest_stored):
+                        logger.warning(f"Datacube: skipping {date_str}, its grid differs from the cube's")
+                        continue
+                    index = self._create(width, height, transform)
+                    stored = index["dates"]
+                bands[date_str] = (band, mtime_ns)
+            if not bands:
+                return []
+
+            # Assign slots: reuse a date's own slot, then free slots, then the oldest dates'
+            dates = index["dates"]
+            slots = {}
+            for date_str in bands:
+                if date_str in dates:
+                    slots[date_str] = dates.pop(date_str)["slot"]
+            used = {d["slot"] for d in dates.values()} | set(slots.values())
+            free = [s for s in range(self.slots) if s not in used]
+            for date_str in bands:
+                if date_str in slots:
+                    continue
+                if free:
+                    slots[date_str] = free.pop(0)
+                else:
+                    oldest = min(dates)
+                    slots[date_str] = dates.pop(oldest)["slot"]
+                    logger.info(f"Datacube full, dropping {oldest}")
+            # Unlist the slots before overwriting them so readers never see mixed data
+            self._write_index(index)
+
+            order = sorted(bands)
+            data = np.memmap(self.data_path, dtype=np.float32, mode="r+",
+                             shape=(index["height"], index["width"], self.slots))
+            data[:, :, [slots[d] for d in order]] = np.stack([bands[d][0] for d in order], axis=-1)
+            data.flush()
+            del data
+
+            for date_str in order:
+                dates[date_str] = {"slot": slots[date_str], "mtime_ns": bands[date_str][1]}
+            self._write_index(index)
+        logger.info(f"Datacube: stored {len(order)} dates ({order[0]} .. {order[-1]})")
+        return order
+
+    def remove_date(self, date_str: str) -> None:
+        """Unlist a date (its slot is reused later)"""
+        with self._write_lock():
+            index = self._read_index_for_write()
+            if index is not None and index["dates"].pop(date_str, None) is not None:
+                self._write_index(index)
+
+    def update_dates(self, changed_dates, removed_dates) -> None:
+        """GeoTIFF catalog listener: keep the cube in step with the directory"""
+        from app.services.geotiff_service import tif_catalog
+
+        files = {}
+        for date_str in changed_dates:
+            entry = tif_catalog.get(date_str)
+            if entry is not None:
+                files[date_str] = entry["path"]
+        try:
+            if files:
+                self.add_dates(files)
+            for date_str in removed_dates:
+                self.remove_date(date_str)
+        except Exception as e:
+            logger.error(f"Datacube update failed: {e}", exc_info=True)
+
+    def stats(self) -> dict:
+        view = self._load()
+        if view is None:
+            return {"dates": 0, "slots": self.slots}
+        index = view[0]
+        return {"dates": len(index["dates"]), "slots": index["slots"]}
+
+
+# Shared datacube used by /pm25/forecast
+datacube = DataCube(settings.CUBE_DIR, settings.CUBE_SLOTS)
@@ -0,0 +1,133 @@
+"""
+Server-side PM2.5 / AQI enrichment of saved locations
+
+Locations saved without pm25 are sampled from the GeoTIFF of their
+VN-local day with the same sampling layer as /pm25/point (memory-mapped
+grid when ingested, otherwise a windowed read). If that day has no file
+yet and it is newer than every file in the catalog, the latest file is
+used, as /pm25/point does without a date. Values sent by the client are
+kept as they are.
+"""
+import logging
+from datetime import timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+from app.core.executor import raster_executor
+from app.services.aqi_service import pm25_to_aqi
+from app.services.geotiff_service import tif_catalog
+from app.services.grid_store import is_nodata
+from app.services.location_stats import VN_TZ
+from app.services.sampling_service import sample_point, sample_points
+
+logger = logging.getLogger(__name__)
+
+
+def _tif_date(ts) -> str:
+    """VN-local day of a timestamp in the GeoTIFF YYYYMMDD format"""
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(VN_TZ).strftime("%Y%m%d")
+
+
+def _entry_for_date(date_str: str) -> Optional[dict]:
+    """
+    Catalog entry for a day, or the latest one if the day is newer than all files
+
+    Both are in-memory lookups (the catalog never rescans on a miss), so
+    this is safe on the event loop for the usual case of today having no
+    file yet.
+    """
+    entry = tif_catalog.get(date_str)
+    if entry is not None:
+        return entry
+    latest = tif_catalog.latest()
+    if latest is not None and latest["date_str"] < date_str:
+        return latest
+    return None
+
+
+def _sample_groups(groups: Dict[str, dict]) -> Dict[str, np.ndarray]:
+    """
+    Sample each file once for its group of points (blocking - run on the raster executor)
+
+    Returns:
+        Mapping of file date to an array of PM2.5 values (NaN for nodata,
+        negative fill values or out of bounds); files that fail to read are
+        left out
+    """
+    values = {}
+    for date_str, group in groups.items():
+        try:
+            if len(group["lons"]) == 1:
+                sample = sample_point(group["path"], group["lons"][0], group["lats"][0], group["mtime_ns"])
+                value = sample["value"] if sample["in_bounds"] and sample["value"] is not None else np.nan
+                values[date_str] = np.array([value], dtype=np.float64)
+            else:
+                values[date_str] = sample_points(group["path"], group["lons"], group["lats"], group["mtime_ns"])["values"]
+        except Exception as e:
+            logger.warning(f"Error sampling PM2.5 for date {date_str}: {e}")
+    return values
+
+
+async def enrich_locations(location_docs: List[dict]) -> int:
+    """
+    Fill in pm25 and aqi of location documents from the raster (in place)
+
+    Documents without pm25 are sampled at their latitude/longitude from the
+    file of their timestamp's day; aqi is filled in when missing (also from
+    a pm25 sent by the client). Documents that get a raster value are
+    tagged with pm25_date, the file date used. Pixels without a reading
+    (NaN, nodata or negative fill values) and sampling errors leave pm25,
+    aqi and pm25_date unset.
+
+    Args:
+        location_docs: Documents with latitude, longitude, timestamp, pm25, aqi
+
+    Returns:
+        Number of documents that got a PM2.5 value from the raster
+    """
+    indices_by_date: Dict[str, List[int]] = {}
+    paths: Dict[str, str] = {}
+    mtimes: Dict[str, int] = {}
+    for i, doc in enumerate(location_docs):
+        if doc.get("pm25") is not None:
+            continue
+        entry = _entry_for_date(_tif_date(doc["timestamp"]))
+        if entry is None:
+            continue
+        paths[entry["date_str"]] = str(entry["path"].resolve())
+        mtimes[entry["date_str"]] = entry["mtime_ns"]
+        indices_by_date.setdefault(entry["date_str"], []).append(i)
+
+    sampled = 0
+    if indices_by_date:
+        groups = {
+            date_str: {
+                "path": paths[date_str],
+                "mtime_ns": mtimes[date_str],
+                "lons": np.array([location_docs[i]["longitude"] for i in indices]),
+                "lats": np.array([location_docs[i]["latitude"] for i in indices]),
+            }
+            for date_str, indices in indices_by_date.items()
+        }
+        try:
+            values = await raster_executor.run(_sample_groups, groups)
+        except Exception as e:
+            logger.warning(f"Error enriching {len(location_docs)} locations: {e}")
+            values = {}
+
+        for date_str, indices in indices_by_date.items():
+            if date_str not in values:
+                continue
+            for i, value in zip(indices, values[date_str]):
+                if not is_nodata(value):
+                    location_docs[i]["pm25"] = float(value)
+                    location_docs[i]["pm25_date"] = date_str
+                    sampled += 1
+
+    for doc in location_docs:
+        if doc.get("aqi") is None and doc.get("pm25") is not None:
+            doc["aqi"] = pm25_to_aqi(doc["pm25"])
+    return sampled
+
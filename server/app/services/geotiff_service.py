@@ -1,51 +1,459 @@
 """
 GeoTIFF file management service
 """
+import asyncio
 import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
 from app.core.config import settings
+from app.core.timing import span
 
 logger = logging.getLogger(__name__)
 
 
-def get_tif_file_path(date_str: Optional[str] = None) -> Path:
+def configure_gdal() -> None:
     """
-    Find GeoTIFF file for the specified date
+    Apply GDAL cache settings from Settings
+
+    Must run before the first dataset is opened: GDAL reads GDAL_CACHEMAX
+    when its block cache is first used.
+    """
+    os.environ["GDAL_CACHEMAX"] = str(settings.GDAL_CACHEMAX)
+    os.environ["VSI_CACHE"] = "TRUE" if settings.VSI_CACHE else "FALSE"
+    os.environ["VSI_CACHE_SIZE"] = str(settings.VSI_CACHE_SIZE)
+    logger.info(f"GDAL block cache: {settings.GDAL_CACHEMAX} MB, "
+                f"VSI cache: {settings.VSI_CACHE} ({settings.VSI_CACHE_SIZE} bytes)")
+
+
+def _file_signature(path: str) -> Tuple[int, int, int]:
+    """Identify a file version by (mtime, inode, size)"""
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_ino, st.st_size
+
+
+class _PooledDataset:
+    """An open dataset plus the file version it was opened from"""
+
+    __slots__ = ("dataset", "signature", "last_used")
+
+    def __init__(self, dataset, signature: Tuple[int, int, int]):
+        self.dataset = dataset
+        self.signature = signature
+        self.last_used = time.monotonic()
+
+
+class DatasetPool:
+    """
+    Pool of open rasterio datasets, keyed by file path
+
+    A rasterio dataset must not be used by two threads at once, so handles
+    are checked out exclusively and returned to the pool afterwards. A file
+    can have several idle handles (one per concurrent reader). Handles are
+    dropped when the file's mtime/inode/size changes and closed after
+    sitting idle for `idle_ttl` seconds, by check-ins or, once traffic
+    stops, by the sweeper task.
+
+    Args:
+        idle_ttl: Seconds an unused handle stays open
+        max_idle_per_file: Maximum idle handles kept per file
+    """
+
+    # Cumulative stats() fields, exported as counters by /metrics
+    COUNTER_FIELDS = ("opened", "reused", "invalidated", "expired")
+
+    def __init__(self, idle_ttl: float, max_idle_per_file: int):
+        self.idle_ttl = idle_ttl
+        self.max_idle_per_file = max_idle_per_file
+        self._idle: Dict[str, List[_PooledDataset]] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self._sweeper: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.opened = 0
+        self.reused = 0
+        self.invalidated = 0
+        self.expired = 0
+
+    @contextmanager
+    def open(self, path: str) -> Iterator:
+        """
+        Check out an open dataset for a file
+
+        Usage:
+            with dataset_pool.open(abs_path) as src:
+                src.read(...)
+        """
+        import rasterio
+
+        with span("open"):
+            signature = _file_signature(path)
+            handle, stale = self._checkout(path, signature)
+            self._close(stale)
+
+            if handle is None:
+                handle = _PooledDataset(rasterio.open(path), signature)
+                with self._lock:
+                    self.opened += 1
+
+        try:
+            yield handle.dataset
+        finally:
+            self._checkin(path, handle)
+
+    def _checkout(self, path: str, signature: Tuple[int, int, int]):
+        """Take an idle handle for the current file version; return stale ones to close"""
+        stale = []
+        with self._lock:
+            handles = self._idle.get(path, [])
+            while handles:
+                handle = handles.pop()
+                if handle.signature == signature:
+                    self.reused += 1
+                    return handle, stale
+                stale.append(handle)
+                self.invalidated += 1
+        return None, stale
+
+    def _checkin(self, path: str, handle: _PooledDataset) -> None:
+        handle.last_used = time.monotonic()
+        to_close = []
+        with self._lock:
+            handles = self._idle.setdefault(path, [])
+            if len(handles) < self.max_idle_per_file:
+                handles.append(handle)
+            else:
+                to_close.append(handle)
+            if handle.last_used - self._last_sweep >= self.idle_ttl / 2:
+                to_close.extend(self._pop_expired(handle.last_used))
+        self._close(to_close)
+
+    def _pop_expired(self, now: float) -> List[_PooledDataset]:
+        """Remove idle handles older than the TTL (caller holds the lock)"""
+        self._last_sweep = now
+        expired = []
+        for path in list(self._idle):
+            keep = []
+            for handle in self._idle[path]:
+                if now - handle.last_used > self.idle_ttl:
+                    expired.append(handle)
+                else:
+                    keep.append(handle)
+            if keep:
+                self._idle[path] = keep
+            else:
+                del self._idle[path]
+        self.expired += len(expired)
+        return expired
+
+    def close_idle(self) -> None:
+        """Close handles that have been idle longer than the TTL"""
+        with self._lock:
+            expired = self._pop_expired(time.monotonic())
+        self._close(expired)
+
+    def start_sweeper(self) -> None:
+        """Start closing expired idle handles in the background"""
+        if self._sweeper is None and self.idle_ttl > 0:
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def stop_sweeper(self) -> None:
+        """Stop the sweeper task"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    async def _sweep(self) -> None:
+        while True:
+            await asyncio.sleep(self.idle_ttl / 2)
+            try:
+                await asyncio.to_thread(self.close_idle)
+            except Exception as e:
+                logger.error(f"Dataset pool sweep failed: {e}", exc_info=True)
+
+    def close_all(self) -> None:
+        """Close every idle handle (checked-out handles are returned normally)"""
+        with self._lock:
+            handles = [h for hs in self._idle.values() for h in hs]
+            self._idle.clear()
+        self._close(handles)
+
+    @staticmethod
+    def _close(handles: List[_PooledDataset]) -> None:
+        for handle in handles:
+            try:
+                handle.dataset.close()
+            except Exception as e:
+                logger.warning(f"Error closing dataset: {e}")
+
+    def stats(self) -> dict:
+        """Snapshot of pool metrics"""
+        with self._lock:
+            return {
+                "files": len(self._idle),
+                "idle_handles": sum(len(hs) for hs in self._idle.values()),
+                "opened": self.opened,
+                "reused": self.reused,
+                "invalidated": self.invalidated,
+                "expired": self.expired,
+            }
+
+
+# Shared pool of open GeoTIFF datasets
+dataset_pool = DatasetPool(
+    idle_ttl=settings.DATASET_POOL_IDLE_TTL,
+    max_idle_per_file=settings.DATASET_POOL_MAX_IDLE_PER_FILE,
+)
+
+
+class TifCatalog:
+    """
+    In-memory index of the PM2.5 GeoTIFF files in a directory
+
+    Maps YYYYMMDD date strings to file metadata so lookups on the request
+    path are dict hits instead of directory globs. refresh() rescans the
+    directory incrementally: only new or modified files are opened to read
+    their metadata. A background task polls for changes; lookups never
+    rescan, so new files show up within TIF_CATALOG_POLL_SECONDS.
+
+    Args:
+        tif_dir: Directory containing PM25_YYYYMMDD_*.tif files
+    """
+
+    def __init__(self, tif_dir: Path):
+        self.tif_dir = tif_dir
+        self._entries: Dict[str, dict] = {}
+        self._dates: List[dict] = []
+        self._invalid_names = set()
+        self._loaded = False
+        self._dir_exists = False
+        self._refresh_lock = threading.Lock()
+        self._listeners: List[Callable[[List[str], List[str]], None]] = []
+        self._watcher: Optional[asyncio.Task] = None
+
+    def add_listener(self, callback: Callable[[List[str], List[str]], None]) -> None:
+        """
+        Register a callback run after each refresh that changed the catalog
+
+        Called as callback(changed_dates, removed_dates) from the thread
+        that ran the refresh.
+        """
+        self._listeners.append(callback)
+
+    def refresh(self) -> Tuple[List[str], List[str]]:
+        """
+        Rescan the directory and update changed entries
+
+        Returns:
+            (added_or_changed_dates, removed_dates)
+        """
+        with self._refresh_lock:
+            found = self._scan()
+            dir_exists = found is not None
+            found = found or {}
+            entries = dict(self._entries)
+            changed, removed = [], []
+
+            for date_str in list(entries):
+                if date_str not in found:
+                    del entries[date_str]
+                    removed.append(date_str)
+
+            for date_str, (path, st) in found.items():
+                current = entries.get(date_str)
+                if (current is not None and current["path"] == path
+                        and current["mtime_ns"] == st.st_mtime_ns and current["size"] == st.st_size):
+                    continue
+                try:
+                    entries[date_str] = self._read_entry(date_str, path, st)
+                    changed.append(date_str)
+                except Exception as e:
+                    logger.warning(f"Could not read GeoTIFF metadata for {path.name}: {e}")
+                    if date_str in entries:
+                        del entries[date_str]
+                        removed.append(date_str)
+
+            # Swap in the new index in one step so readers never see a partial update
+            self._entries = entries
+            self._dir_exists = dir_exists
+            self._dates = [
+                {"date": e["date"], "date_str": e["date_str"], "filename": e["filename"]}
+                for e in sorted(entries.values(), key=lambda e: e["date"], reverse=True)
+            ]
+            self._loaded = True
+
+        if changed or removed:
+            logger.info(f"GeoTIFF catalog: {len(changed)} added/changed, {len(removed)} removed, "
+                        f"{len(self._entries)} total")
+            for callback in self._listeners:
+                try:
+                    callback(changed, removed)
+                except Exception as e:
+                    logger.error(f"GeoTIFF catalog listener failed: {e}", exc_info=True)
+        return changed, removed
+
+    def _scan(self) -> Optional[Dict[str, Tuple[Path, os.stat_result]]]:
+        """
+        List PM25_YYYYMMDD_*.tif files by date (first filename wins on duplicates)
+
+        Returns None if the directory does not exist.
+        """
+        found = {}
+        try:
+            with os.scandir(self.tif_dir) as it:
+                dir_entries = sorted((e for e in it if e.is_file()), key=lambda e: e.name)
+        except FileNotFoundError:
+            return None
+        for dir_entry in dir_entries:
+            if not (dir_entry.name.startswith("PM25_") and dir_entry.name.endswith(".tif")):
+                continue
+            # Extract date from filename: PM25_YYYYMMDD_*.tif
+            parts = dir_entry.name[:-len(".tif")].split("_")
+            date_str = parts[1] if len(parts) >= 2 else ""
+            try:
+                datetime.strptime(date_str, "%Y%m%d")
+            except ValueError:
+                if dir_entry.name not in self._invalid_names:
+                    self._invalid_names.add(dir_entry.name)
+                    logger.warning(f"Invalid date format in filename: {dir_entry.name}")
+                continue
+            if date_str not in found:
+                found[date_str] = (Path(dir_entry.path), dir_entry.stat())
+        return found
+
+    @staticmethod
+    def _read_entry(date_str: str, path: Path, st: os.stat_result) -> dict:
+        """Read file metadata (header only)"""
+        import rasterio
+
+        with rasterio.open(str(path)) as src:
+            return {
+                "date": datetime.strptime(date_str, "%Y%m%d").strftime("%Y-%m-%d"),
+                "date_str": date_str,
+                "filename": path.name,
+                "path": path,
+                "mtime_ns": st.st_mtime_ns,
+                "size": st.st_size,
+                "bounds": tuple(src.bounds),
+                "nodata": src.nodata,
+                "dtype": src.dtypes[0],
+                "resolution": src.res,
+                "width": src.width,
+                "height": src.height,
+            }
+
+    def _ensure_loaded(self) -> None:
+        # The app loads the catalog off the loop at startup; this covers scripts
+        # (and a missing TIF_DIR, where the scan is a no-op)
+        if not self._loaded:
+            self.refresh()
+
+    def directory_exists(self) -> bool:
+        """Whether the directory existed at the last refresh (no filesystem access)"""
+        self._ensure_loaded()
+        return self._dir_exists
+
+    def get(self, date_str: str) -> Optional[dict]:
+        """Metadata for a date, or None if there is no file for it (a dict lookup)"""
+        self._ensure_loaded()
+        return self._entries.get(date_str)
+
+    def latest(self) -> Optional[dict]:
+        """Metadata for the most recent date"""
+        self._ensure_loaded()
+        dates = self._dates
+        return self._entries.get(dates[0]["date_str"]) if dates else None
+
+    def dates(self) -> List[dict]:
+        """Available dates, most recent first"""
+        self._ensure_loaded()
+        return self._dates
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._entries)
+
+    def start_watcher(self) -> None:
+        """Start polling the directory for new/changed files"""
+        if self._watcher is None and settings.TIF_CATALOG_POLL_SECONDS > 0:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def stop_watcher(self) -> None:
+        """Stop the polling task"""
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(settings.TIF_CATALOG_POLL_SECONDS)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                logger.error(f"GeoTIFF catalog refresh failed: {e}", exc_info=True)
+
+
+# Shared catalog of the GeoTIFF directory
+tif_catalog = TifCatalog(settings.TIF_DIR)
+
+
+def get_tif_entry(date_str: Optional[str] = None) -> dict:
+    """
+    Find GeoTIFF metadata for the specified date
     
     Args:
         date_str: Date in YYYYMMDD format. If None, returns latest file
         
     Returns:
-        Path to the GeoTIFF file
+        Catalog entry (path, mtime_ns, bounds, nodata, dtype, resolution, ...)
         
     Raises:
         FileNotFoundError: If no matching file is found
     """
-    if not settings.TIF_DIR.exists():
+    if not tif_catalog.directory_exists():
         raise FileNotFoundError(f"TIF directory does not exist: {settings.TIF_DIR}")
     
-    # Get all TIF files
-    tif_files = list(settings.TIF_DIR.glob("PM25_*.tif"))
+    if date_str:
+        entry = tif_catalog.get(date_str)
+        if entry is None:
+            raise FileNotFoundError(f"No PM2.5 file found for date {date_str}")
+        return entry
     
-    if not tif_files:
+    # Return latest file
+    entry = tif_catalog.latest()
+    if entry is None:
         raise FileNotFoundError(f"No GeoTIFF files found in {settings.TIF_DIR}")
+    return entry
+
+
+def get_tif_file_path(date_str: Optional[str] = None) -> Path:
+    """
+    Find GeoTIFF file for the specified date
     
-    if date_str:
-        # Find file matching specific date
-        pattern = f"PM25_{date_str}_*.tif"
-        matching_files = list(settings.TIF_DIR.glob(pattern))
+    Args:
+        date_str: Date in YYYYMMDD format. If None, returns latest file
         
-        if not matching_files:
-            raise FileNotFoundError(f"No PM2.5 file found for date {date_str}")
+    Returns:
+        Path to the GeoTIFF file
         
-        return matching_files[0]
-    else:
-        # Return latest file
-        tif_files.sort(reverse=True)
-        return tif_files[0]
+    Raises:
+        FileNotFoundError: If no matching file is found
+    """
+    return get_tif_entry(date_str)["path"]
 
 
 def get_available_dates() -> List[dict]:
@@ -53,32 +461,6 @@ def get_available_dates() -> List[dict]:
     Get list of available dates from TIF files
     
     Returns:
-        List of date information dictionaries
+        List of date information dictionaries, most recent first
     """
-    if not settings.TIF_DIR.exists():
-        return []
-    
-    tif_files = list(settings.TIF_DIR.glob("PM25_*.tif"))
-    dates = []
-    
-    for file in tif_files:
-        # Extract date from filename: PM25_YYYYMMDD_*.tif
-        parts = file.stem.split("_")
-        if len(parts) >= 2:
-            date_str = parts[1]
-            try:
-                # Parse and format date
-                date_obj = datetime.strptime(date_str, "%Y%m%d")
-                dates.append({
-                    "date": date_obj.strftime("%Y-%m-%d"),
-                    "date_str": date_str,
-                    "filename": file.name
-                })
-            except ValueError:
-                logger.warning(f"Invalid date format in filename: {file.name}")
-                continue
-    
-    # Sort by date descending
-    dates.sort(key=lambda x: x["date"], reverse=True)
-    
-    return dates
+    return list(tif_catalog.dates())
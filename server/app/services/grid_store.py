@@ -0,0 +1,300 @@
+"""
+Memory-mapped PM2.5 grid store
+
+Each PM25_YYYYMMDD_*.tif can be ingested into a raw, uncompressed grid
+file (<tif stem>.grid in GRID_DIR): a fixed-size header holding the
+geotransform and nodata, followed by the band as float32 (or scaled
+uint16). Grids are memory-mapped read-only, so a point lookup is an
+affine transform plus one array index, and all server workers share the
+same pages through the OS page cache.
+"""
+import logging
+import math
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+GRID_MAGIC = b"SAQGRID1"
+GRID_VERSION = 1
+GRID_HEADER_SIZE = 256
+
+# magic, version, dtype code, width, height, transform (a, b, c, d, e, f),
+# nodata, scale, offset, source mtime (ns)
+_HEADER_FORMAT = "<8sIIII6ddddq"
+
+_DTYPE_CODES = {1: np.float32, 2: np.uint16}
+_UINT16_NODATA = 65535
+
+
+def nodata_mask(values: np.ndarray, nodata: Optional[float]) -> np.ndarray:
+    """
+    Pixels without a PM2.5 reading: NaN, the declared nodata value, or
+    negative (fill values such as -9999 in files that declare nodata=NaN)
+
+    The one nodata rule used by every storage format and sampling path.
+    """
+    with np.errstate(invalid="ignore"):
+        mask = np.isnan(values) | (values < 0)
+    if nodata is not None and not math.isnan(nodata):
+        mask |= values == nodata
+    return mask
+
+
+def is_nodata(value: float, nodata: Optional[float] = None) -> bool:
+    """Scalar version of nodata_mask()"""
+    return math.isnan(value) or value < 0 or (nodata is not None and value == nodata)
+
+
+def _is_date_file(stem: str, date_str: str) -> bool:
+    """Whether a PM25_YYYYMMDD_* file stem belongs to a date"""
+    parts = stem.split("_")
+    return len(parts) >= 2 and parts[0] == "PM25" and parts[1] == date_str
+
+
+def grid_path_for(tif_path: Path) -> Path:
+    """Grid file location for a GeoTIFF"""
+    return settings.GRID_DIR / f"{Path(tif_path).stem}.grid"
+
+
+def ingest_tif(tif_path: Path, dtype: str = "float32", scale: float = 0.1) -> Path:
+    """
+    Convert a GeoTIFF's first band into a grid file
+
+    The file is written to a temporary name and renamed into place, so
+    workers that already mapped the previous version keep a valid mapping.
+
+    Args:
+        tif_path: Source GeoTIFF
+        dtype: "float32" (exact) or "uint16" (value = raw * scale); in both,
+            pixels matched by nodata_mask() are stored as nodata
+        scale: Resolution of uint16 values in µg/m³
+
+    Returns:
+        Path of the written grid file
+    """
+    import rasterio
+
+    tif_path = Path(tif_path)
+    source_mtime_ns = tif_path.stat().st_mtime_ns
+
+    with rasterio.open(str(tif_path)) as src:
+        band = src.read(1).astype(np.float32)
+        transform = tuple(src.transform)[:6]
+        nodata = src.nodata
+
+    missing = nodata_mask(band, nodata)
+
+    if dtype == "float32":
+        dtype_code = 1
+        scale, offset = 1.0, 0.0
+        grid_nodata = float("nan")
+        band[missing] = grid_nodata
+        data = band
+    elif dtype == "uint16":
+        dtype_code = 2
+        offset = 0.0
+        grid_nodata = float(_UINT16_NODATA)
+        data = np.clip(np.round(np.nan_to_num(band) / scale), 0, _UINT16_NODATA - 1)
+        data[missing] = _UINT16_NODATA
+        data = data.astype(np.uint16)
+    else:
+        raise ValueError(f"Unsupported grid dtype: {dtype}")
+
+    height, width = data.shape
+    header = struct.pack(
+        _HEADER_FORMAT, GRID_MAGIC, GRID_VERSION, dtype_code, width, height,
+        *transform, grid_nodata, scale, offset, source_mtime_ns
+    ).ljust(GRID_HEADER_SIZE, b"\0")
+
+    out_path = grid_path_for(tif_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_suffix(f".grid.tmp{os.getpid()}")
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(np.ascontiguousarray(data).tobytes())
+    os.replace(tmp_path, out_path)
+
+    logger.info(f"Ingested {tif_path.name} -> {out_path.name} ({dtype}, {width}x{height})")
+    return out_path
+
+
+def affine_rowcol(inverse, lon: float, lat: float) -> Tuple[int, int]:
+    """
+    Pixel containing a coordinate, given the inverse geotransform
+
+    Same arithmetic and rounding as rasterio's rowcol, without its
+    per-call setup cost.
+    """
+    col = math.floor(inverse.a * lon + inverse.b * lat + inverse.c)
+    row = math.floor(inverse.d * lon + inverse.e * lat + inverse.f)
+    return row, col
+
+
+class MappedGrid:
+    """A memory-mapped grid file"""
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            header = f.read(GRID_HEADER_SIZE)
+        (magic, version, dtype_code, width, height, a, b, c, d, e, f_,
+         nodata, scale, offset, source_mtime_ns) = struct.unpack_from(_HEADER_FORMAT, header)
+        if magic != GRID_MAGIC or version != GRID_VERSION:
+            raise ValueError(f"Not a grid file (or unsupported version): {path}")
+
+        from affine import Affine
+
+        self.path = path
+        self.width = width
+        self.height = height
+        self.transform = Affine(a, b, c, d, e, f_)
+        self._inverse = ~self.transform
+        self.nodata = nodata
+        self.scale = scale
+        self.offset = offset
+        self.source_mtime_ns = source_mtime_ns
+        self.dtype = np.dtype(_DTYPE_CODES[dtype_code])
+        self.data = np.memmap(path, dtype=self.dtype, mode="r", offset=GRID_HEADER_SIZE, shape=(height, width))
+
+    def _decode(self, raw: np.ndarray) -> np.ndarray:
+        """Raw stored values to PM2.5 (NaN for nodata)"""
+        if self.dtype == np.uint16:
+            values = raw.astype(np.float64) * self.scale + self.offset
+            values[raw == self.nodata] = np.nan
+            return values
+        values = raw.astype(np.float64)
+        # Grids ingested before negatives counted as nodata
+        values[nodata_mask(values, None)] = np.nan
+        return values
+
+    def sample(self, lon: float, lat: float) -> dict:
+        """Value at a coordinate, in the same shape as sampling_service.sample_point()"""
+        row, col = affine_rowcol(self._inverse, lon, lat)
+        if row < 0 or row >= self.height or col < 0 or col >= self.width:
+            return {"in_bounds": False, "value": None, "row": row, "col": col, "bytes_read": 0}
+
+        raw = self.data[row, col]
+        if self.dtype == np.uint16:
+            value = math.nan if raw == self.nodata else float(raw) * self.scale + self.offset
+        else:
+            value = float(raw)
+        return {
+            "in_bounds": True,
+            "value": None if is_nodata(value) else value,
+            "row": row,
+            "col": col,
+            "bytes_read": self.dtype.itemsize,
+        }
+
+    def sample_many(self, lons: np.ndarray, lats: np.ndarray) -> dict:
+        """Values for many coordinates, in the same shape as sampling_service.sample_points()"""
+        from rasterio.transform import rowcol
+
+        lons = np.asarray(lons, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        rows, cols = rowcol(self.transform, lons, lats)
+        rows = np.asarray(rows, dtype=np.int64).reshape(lons.shape)
+        cols = np.asarray(cols, dtype=np.int64).reshape(lons.shape)
+        in_bounds = (rows >= 0) & (rows < self.height) & (cols >= 0) & (cols < self.width)
+
+        values = np.full(lons.shape, np.nan, dtype=np.float64)
+        values[in_bounds] = self._decode(self.data[rows[in_bounds], cols[in_bounds]])
+        return {
+            "values": values,
+            "in_bounds": in_bounds,
+            "bytes_read": int(in_bounds.sum()) * self.dtype.itemsize,
+        }
+
+
+class GridStore:
+    """Cache of memory-mapped grids, keyed by source GeoTIFF path"""
+
+    def __init__(self):
+        self._grids: Dict[str, Tuple[Tuple[int, int], MappedGrid]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, tif_path: str, source_mtime_ns: Optional[int] = None) -> Optional[MappedGrid]:
+        """
+        Mapped grid for a GeoTIFF, or None if it has not been ingested
+
+        A grid whose recorded source mtime no longer matches the GeoTIFF is
+        treated as missing until it is re-ingested.
+
+        Args:
+            tif_path: Path to the GeoTIFF
+            source_mtime_ns: The GeoTIFF's mtime_ns if already known (e.g.
+                from its catalog entry); otherwise the file is stat'ed
+        """
+        grid_path = grid_path_for(Path(tif_path))
+        try:
+            grid_st = os.stat(grid_path)
+            if source_mtime_ns is None:
+                source_mtime_ns = os.stat(tif_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+        grid_sig = (grid_st.st_mtime_ns, grid_st.st_ino)
+        with self._lock:
+            cached = self._grids.get(tif_path)
+        if cached is not None and cached[0] == grid_sig:
+            grid = cached[1]
+        else:
+            try:
+                grid = MappedGrid(grid_path)
+            except Exception as e:
+                logger.warning(f"Could not map grid {grid_path.name}: {e}")
+                return None
+            with self._lock:
+                self._grids[tif_path] = (grid_sig, grid)
+
+        if grid.source_mtime_ns != source_mtime_ns:
+            return None
+        return grid
+
+    def remove_date(self, date_str: str) -> None:
+        """Drop the mapped grids of a date and delete their grid files"""
+        with self._lock:
+            for tif_path in [p for p in self._grids if _is_date_file(Path(p).stem, date_str)]:
+                del self._grids[tif_path]
+        if not settings.GRID_DIR.exists():
+            return
+        for grid_path in settings.GRID_DIR.glob(f"PM25_{date_str}*.grid"):
+            if _is_date_file(grid_path.stem, date_str):
+                try:
+                    grid_path.unlink()
+                    logger.info(f"Removed grid {grid_path.name}")
+                except FileNotFoundError:
+                    pass
+
+    def ingest_dates(self, changed_dates, removed_dates) -> None:
+        """GeoTIFF catalog listener: ingest new/changed files, drop removed ones"""
+        from app.services.geotiff_service import tif_catalog
+
+        for date_str in removed_dates:
+            try:
+                self.remove_date(date_str)
+            except Exception as e:
+                logger.error(f"Grid removal failed for {date_str}: {e}", exc_info=True)
+
+        for date_str in changed_dates:
+            entry = tif_catalog.get(date_str)
+            if entry is None or self.get(str(entry["path"]), entry["mtime_ns"]) is not None:
+                continue
+            try:
+                ingest_tif(entry["path"], dtype=settings.GRID_STORE_DTYPE, scale=settings.GRID_UINT16_SCALE)
+            except Exception as e:
+                logger.error(f"Grid ingest failed for {entry['filename']}: {e}", exc_info=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"mapped_grids": len(self._grids)}
+
+
+# Shared store of memory-mapped grids
+grid_store = GridStore()
@@ -0,0 +1,283 @@
+"""
+Per-user daily location rollups
+
+The location_daily_rollups collection holds one small document per user
+and VN-local day, kept up to date as locations are saved, so statistics
+read at most one document per day instead of every raw record.
+
+Rollup document:
+    _id         "<user_id>:<YYYY-MM-DD>"
+    user_id, day
+    count, aqi_count, aqi_sum, aqi_min, aqi_max, pm25_count, ... (see
+        app.services.location_stats; *_min/*_max are absent until the day
+        has a value > 0)
+    addresses   {sha1(address)[:16]: {"address", "count", "first_ts"}}
+                (addresses are hashed because they may contain "." or "$";
+                absent until the day has a record with an address)
+"""
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from app.services.location_stats import (STAT_FIELDS, VN_TZ, local_day_expr,
+                                         positive_value)
+from pymongo import ReplaceOne, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_COLLECTION = "location_daily_rollups"
+
+
+def local_day(ts: datetime) -> str:
+    """VN-local day of a timestamp (naive timestamps are UTC, as stored)"""
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(VN_TZ).strftime("%Y-%m-%d")
+
+
+def day_bounds_utc(day: str) -> Tuple[datetime, datetime]:
+    """UTC start (inclusive) and end (exclusive) of a VN-local day"""
+    start_local = datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=VN_TZ)
+    return start_local.astimezone(timezone.utc), (start_local + timedelta(days=1)).astimezone(timezone.utc)
+
+
+def address_key(address: str) -> str:
+    return hashlib.sha1(address.encode("utf-8")).hexdigest()[:16]
+
+
+def rollup_id(user_id: str, day: str) -> str:
+    return f"{user_id}:{day}"
+
+
+def _add_to_update(ops: dict, location_doc: dict) -> None:
+    """Fold one location into the $inc/$min/$max/$set operators of its day's rollup"""
+    ts = location_doc["timestamp"]
+    inc, min_ops, max_ops = ops["$inc"], ops["$min"], ops["$max"]
+
+    def add(path, amount):
+        inc[path] = inc.get(path, 0) + amount
+
+    def lower(path, value):
+        min_ops[path] = value if path not in min_ops else min(min_ops[path], value)
+
+    add("count", 1)
+    for field in STAT_FIELDS:
+        value = location_doc.get(field)
+        has_value = value is not None and value > 0
+        add(f"{field}_count", 1 if has_value else 0)
+        add(f"{field}_sum", value if has_value else 0)
+        if has_value:
+            lower(f"{field}_min", value)
+            max_ops[f"{field}_max"] = max(max_ops.get(f"{field}_max", value), value)
+
+    address = location_doc.get("address")
+    if address:
+        key = address_key(address)
+        add(f"addresses.{key}.count", 1)
+        ops["$set"][f"addresses.{key}.address"] = address
+        lower(f"addresses.{key}.first_ts", ts)
+
+
+async def record_locations(db, location_docs: List[dict]) -> None:
+    """
+    Add saved locations to their days' rollups
+
+    Locations are merged per user and day first, so each rollup gets a
+    single atomic upsert.
+
+    Args:
+        db: Database
+        location_docs: Location documents as inserted into db.locations
+    """
+    updates: Dict[str, dict] = {}
+    for location_doc in location_docs:
+        user_id = location_doc["user_id"]
+        day = local_day(location_doc["timestamp"])
+        ops = updates.setdefault(rollup_id(user_id, day), {
+            "$setOnInsert": {"user_id": user_id, "day": day},
+            "$inc": {}, "$min": {}, "$max": {}, "$set": {},
+        })
+        _add_to_update(ops, location_doc)
+    if not updates:
+        return
+
+    requests = [
+        UpdateOne({"_id": _id}, {op: fields for op, fields in ops.items() if fields}, upsert=True)
+        for _id, ops in updates.items()
+    ]
+    await db[ROLLUP_COLLECTION].bulk_write(requests, ordered=False)
+
+
+async def record_location(db, location_doc: dict) -> None:
+    """Add one saved location to its day's rollup (single atomic upsert)"""
+    await record_locations(db, [location_doc])
+
+
+def _as_day_stats(rollup: dict) -> dict:
+    """Rollup document in the per-day shape used by summarize_location_stats()"""
+    day = {"_id": rollup["day"], "count": rollup.get("count", 0)}
+    for field in STAT_FIELDS:
+        day[f"{field}_count"] = rollup.get(f"{field}_count", 0)
+        day[f"{field}_sum"] = rollup.get(f"{field}_sum", 0)
+        day[f"{field}_min"] = rollup.get(f"{field}_min")
+        day[f"{field}_max"] = rollup.get(f"{field}_max")
+    return day
+
+
+def _ordered_addresses(rollups: List[dict]) -> List[dict]:
+    """Address entries merged across rollups, ordered by first visit"""
+    merged: Dict[str, dict] = {}
+    for rollup in rollups:
+        for entry in rollup.get("addresses", {}).values():
+            total = merged.setdefault(entry["address"], {"address": entry["address"], "count": 0,
+                                                         "first_ts": entry["first_ts"]})
+            total["count"] += entry["count"]
+            total["first_ts"] = min(total["first_ts"], entry["first_ts"])
+    return sorted(merged.values(), key=lambda a: a["first_ts"])
+
+
+async def rollup_stats(db, user_id: str, start_day: str) -> Tuple[List[dict], Optional[str], int]:
+    """
+    Per-day statistics from rollups, from start_day (VN-local) onwards
+
+    Returns:
+        (per-day documents, most visited address, number of distinct addresses);
+        ties for most visited go to the address visited first
+    """
+    rollups = await db[ROLLUP_COLLECTION].find(
+        {"user_id": user_id, "day": {"$gte": start_day}}
+    ).to_list(length=None)
+
+    addresses = _ordered_addresses(rollups)
+    most_visited = max(addresses, key=lambda a: a["count"])["address"] if addresses else None
+    return [_as_day_stats(r) for r in rollups], most_visited, len(addresses)
+
+
+async def rollup_day(db, user_id: str, day: str) -> Optional[dict]:
+    """
+    Statistics for one VN-local day from its rollup
+
+    Returns:
+        Per-day document plus "addresses" ({address: count} in order of
+        first visit), or None if the day has no records
+    """
+    rollup = await db[ROLLUP_COLLECTION].find_one({"_id": rollup_id(user_id, day)})
+    if rollup is None or not rollup.get("count"):
+        return None
+    day_stats = _as_day_stats(rollup)
+    day_stats["addresses"] = {a["address"]: a["count"] for a in _ordered_addresses([rollup])}
+    return day_stats
+
+
+def _rebuild_pipeline(match: dict) -> List[dict]:
+    """Raw records grouped by user, VN-local day and address"""
+    group = {
+        "_id": {"user_id": "$user_id", "day": local_day_expr(), "address": "$address"},
+        "count": {"$sum": 1},
+        "first_ts": {"$min": "$timestamp"},
+    }
+    for field in STAT_FIELDS:
+        group[f"{field}_count"] = {"$sum": {"$cond": [{"$gt": [f"${field}", 0]}, 1, 0]}}
+        group[f"{field}_sum"] = {"$sum": positive_value(field)}
+        group[f"{field}_min"] = {"$min": positive_value(field)}
+        group[f"{field}_max"] = {"$max": positive_value(field)}
+    return [{"$match": match}, {"$group": group}, {"$sort": {"_id.user_id": 1, "_id.day": 1}}]
+
+
+def _merge_groups(user_id: str, day: str, groups: List[dict]) -> dict:
+    """Build one rollup document from its (user, day, address) groups"""
+    rollup = {"_id": rollup_id(user_id, day), "user_id": user_id, "day": day,
+              "count": sum(g["count"] for g in groups)}
+    for field in STAT_FIELDS:
+        with_values = [g for g in groups if g[f"{field}_count"]]
+        rollup[f"{field}_count"] = sum(g[f"{field}_count"] for g in groups)
+        rollup[f"{field}_sum"] = sum(g[f"{field}_sum"] for g in with_values)
+        if with_values:
+            rollup[f"{field}_min"] = min(g[f"{field}_min"] for g in with_values)
+            rollup[f"{field}_max"] = max(g[f"{field}_max"] for g in with_values)
+    for g in groups:
+        address = g["_id"].get("address")
+        if address:
+            rollup.setdefault("addresses", {})[address_key(address)] = {
+                "address": address, "count": g["count"], "first_ts": g["first_ts"]
+            }
+    return rollup
+
+
+async def rebuild_rollups(
+    db,
+    user_id: Optional[str] = None,
+    start_utc: Optional[datetime] = None,
+    end_utc: Optional[datetime] = None,
+    batch_size: int = 500
+) -> int:
+    """
+    Recompute rollups from raw records
+
+    The range must cover whole VN-local days. Rollups in the range that no
+    longer have raw records are deleted. Locations saved while a rollup is
+    being rebuilt may be missed; run it again if writes were going on.
+
+    Args:
+        db: Database
+        user_id: Only rebuild this user (default: all users)
+        start_utc: Start of the range (inclusive, default: unbounded)
+        end_utc: End of the range (exclusive, default: unbounded)
+        batch_size: Rollups written per bulk write
+
+    Returns:
+        Number of rollup documents written
+    """
+    match, rollup_match = {}, {}
+    if user_id is not None:
+        match["user_id"] = rollup_match["user_id"] = user_id
+    if start_utc is not None or end_utc is not None:
+        match["timestamp"], rollup_match["day"] = {}, {}
+        if start_utc is not None:
+            match["timestamp"]["$gte"] = start_utc
+            rollup_match["day"]["$gte"] = local_day(start_utc)
+        if end_utc is not None:
+            match["timestamp"]["$lt"] = end_utc
+            rollup_match["day"]["$lt"] = local_day(end_utc)
+
+    collection = db[ROLLUP_COLLECTION]
+    await collection.delete_many(rollup_match)
+
+    written = 0
+    ops = []
+    current, groups = None, []
+    cursor = db.locations.aggregate(_rebuild_pipeline(match), allowDiskUse=True)
+    async for group in cursor:
+        key = (group["_id"]["user_id"], group["_id"]["day"])
+        if key != current and groups:
+            ops.append(ReplaceOne({"_id": rollup_id(*current)}, _merge_groups(*current, groups), upsert=True))
+            groups = []
+        current = key
+        groups.append(group)
+        if len(ops) >= batch_size:
+            await collection.bulk_write(ops, ordered=False)
+            written += len(ops)
+            ops = []
+    if groups:
+        ops.append(ReplaceOne({"_id": rollup_id(*current)}, _merge_groups(*current, groups), upsert=True))
+    if ops:
+        await collection.bulk_write(ops, ordered=False)
+        written += len(ops)
+    return written
+
+
+async def remove_rollups_before(db, user_id: str, cutoff_utc: Optional[datetime] = None) -> None:
+    """
+    Update rollups after raw records older than cutoff_utc were deleted
+
+    Days entirely before the cutoff are dropped; the day containing the
+    cutoff is rebuilt from the records that remain. Without a cutoff all
+    of the user's rollups are dropped.
+    """
+    if cutoff_utc is None:
+        await db[ROLLUP_COLLECTION].delete_many({"user_id": user_id})
+        return
+    cutoff_day = local_day(cutoff_utc)
+    await db[ROLLUP_COLLECTION].delete_many({"user_id": user_id, "day": {"$lt": cutoff_day}})
+    await rebuild_rollups(db, user_id, *day_bounds_utc(cutoff_day))
@@ -0,0 +1,177 @@
+"""
+Location history statistics
+
+Statistics are computed by MongoDB aggregation pipelines that return one
+small summary document per VN-local day (plus address counts), instead of
+pulling raw location records into Python. The per-day documents have the
+same fields as the stored daily rollups, so both sources are summarized
+by summarize_location_stats().
+
+Per-day document fields:
+    _id         VN-local date (YYYY-MM-DD)
+    count       number of records
+    aqi_count   number of records with AQI > 0 (same for pm25_*)
+    aqi_sum     sum of those AQI values
+    aqi_min     minimum of those AQI values (None if aqi_count is 0)
+    aqi_max     maximum of those AQI values (None if aqi_count is 0)
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from app.models.location import LocationHistoryStats
+
+VN_TZ = timezone(timedelta(hours=7))  # UTC+7 Vietnam timezone (no DST)
+VN_TZ_OFFSET = "+07:00"
+
+STAT_FIELDS = ("aqi", "pm25")
+
+
+def positive_value(field: str) -> dict:
+    """Field value if > 0, else null (ignored by $sum/$avg/$min/$max)"""
+    return {"$cond": [{"$gt": [f"${field}", 0]}, f"${field}", None]}
+
+
+def local_day_expr(field: str = "timestamp") -> dict:
+    """VN-local calendar day of a UTC timestamp as YYYY-MM-DD"""
+    return {"$dateToString": {"format": "%Y-%m-%d", "date": f"${field}", "timezone": VN_TZ_OFFSET}}
+
+
+def daily_stats_stage() -> dict:
+    """$group stage producing one per-day document per VN-local day"""
+    group = {"_id": local_day_expr(), "count": {"$sum": 1}}
+    for field in STAT_FIELDS:
+        group[f"{field}_count"] = {"$sum": {"$cond": [{"$gt": [f"${field}", 0]}, 1, 0]}}
+        group[f"{field}_sum"] = {"$sum": positive_value(field)}
+        group[f"{field}_min"] = {"$min": positive_value(field)}
+        group[f"{field}_max"] = {"$max": positive_value(field)}
+    return {"$group": group}
+
+
+# Records with a non-empty address, grouped by address with their first _id
+_ADDRESS_GROUP_STAGES = [
+    {"$match": {"address": {"$nin": [None, ""]}}},
+    {"$group": {"_id": "$address", "count": {"$sum": 1}, "first_id": {"$min": "$_id"}}},
+]
+
+
+def location_stats_pipeline(user_id: str, start_utc: datetime) -> List[dict]:
+    """
+    Pipeline for /location/stats
+
+    Returns one document: {"days": [per-day documents],
+    "addresses": [{"unique": n, "top": most frequent address}]}
+    Ties for the most frequent address go to the one recorded first.
+    """
+    return [
+        {"$match": {"user_id": user_id, "timestamp": {"$gte": start_utc}}},
+        {"$facet": {
+            "days": [daily_stats_stage()],
+            "addresses": _ADDRESS_GROUP_STAGES + [
+                {"$sort": {"count": -1, "first_id": 1}},
+                {"$group": {"_id": None, "unique": {"$sum": 1}, "top": {"$first": "$_id"}}},
+            ],
+        }},
+    ]
+
+
+def day_stats_pipeline(user_id: str, start_utc: datetime, end_utc: datetime) -> List[dict]:
+    """
+    Pipeline for /location/stats/day
+
+    Returns one document: {"totals": [{total, avg/min/max per field}],
+    "addresses": [{_id: address, count}, ...] in order of first record}
+    """
+    totals = {"_id": None, "total": {"$sum": 1}}
+    for field in STAT_FIELDS:
+        totals[f"{field}_avg"] = {"$avg": positive_value(field)}
+        totals[f"{field}_min"] = {"$min": positive_value(field)}
+        totals[f"{field}_max"] = {"$max": positive_value(field)}
+    return [
+        {"$match": {"user_id": user_id, "timestamp": {"$gte": start_utc, "$lt": end_utc}}},
+        {"$facet": {
+            "totals": [{"$group": totals}],
+            "addresses": _ADDRESS_GROUP_STAGES + [{"$sort": {"first_id": 1}}],
+        }},
+    ]
+
+
+def empty_location_stats() -> LocationHistoryStats:
+    return LocationHistoryStats(
+        total_records=0,
+        date_range={"start": None, "end": None},
+        avg_aqi=None,
+        max_aqi=None,
+        min_aqi=None,
+        avg_pm25=None,
+        max_pm25=None,
+        min_pm25=None,
+        most_visited_location=None,
+        unique_locations=0,
+        daily_avg_aqi=[]
+    )
+
+
+def summarize_location_stats(
+    days: List[dict],
+    most_visited: Optional[str],
+    unique_locations: int,
+    now_local: Optional[datetime] = None
+) -> LocationHistoryStats:
+    """
+    Build the /location/stats response from per-day documents
+
+    Today's (partial) day is left out of every figure except the address
+    counts. Averages are averages of the daily averages.
+
+    Args:
+        days: Per-day documents (see module docstring)
+        most_visited: Most frequent address
+        unique_locations: Number of distinct addresses
+        now_local: Current VN-local time (defaults to now)
+    """
+    if not days:
+        return empty_location_stats()
+
+    now_local = now_local or datetime.now(VN_TZ)
+    today = now_local.date()
+    end_date = (today - timedelta(days=1)).strftime("%Y-%m-%d")
+    today_str = today.strftime("%Y-%m-%d")
+
+    valid_days = sorted((d for d in days if d["_id"] != today_str), key=lambda d: d["_id"])
+    total_records = sum(d["count"] for d in valid_days)
+    start_date = valid_days[0]["_id"] if valid_days else None
+
+    summary: Dict[str, Optional[float]] = {}
+    daily_averages: Dict[str, Dict[str, float]] = {}
+    for field in STAT_FIELDS:
+        with_values = [d for d in valid_days if d[f"{field}_count"]]
+        daily_averages[field] = {d["_id"]: d[f"{field}_sum"] / d[f"{field}_count"] for d in with_values}
+        averages = list(daily_averages[field].values())
+        summary[f"avg_{field}"] = sum(averages) / len(averages) if averages else None
+        summary[f"max_{field}"] = max(d[f"{field}_max"] for d in with_values) if with_values else None
+        summary[f"min_{field}"] = min(d[f"{field}_min"] for d in with_values) if with_values else None
+
+    # Daily AQI for the last 7 days (excluding today)
+    valid_dates = {(today - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(1, 8)}
+    daily_avg_aqi = [
+        {"date": date, "avg_aqi": round(avg, 1)}
+        for date, avg in daily_averages["aqi"].items()
+        if date in valid_dates
+    ]
+
+    avg_aqi, avg_pm25 = summary["avg_aqi"], summary["avg_pm25"]
+    max_pm25, min_pm25 = summary["max_pm25"], summary["min_pm25"]
+    return LocationHistoryStats(
+        total_records=total_records,
+        date_range={"start": start_date, "end": end_date},
+        avg_aqi=round(avg_aqi, 1) if avg_aqi is not None else None,
+        max_aqi=summary["max_aqi"],
+        min_aqi=summary["min_aqi"],
+        avg_pm25=round(avg_pm25, 1) if avg_pm25 is not None else None,
+        max_pm25=round(max_pm25, 1) if max_pm25 else None,
+        min_pm25=round(min_pm25, 1) if min_pm25 else None,
+        most_visited_location=most_visited,
+        unique_locations=unique_locations,
+        daily_avg_aqi=daily_avg_aqi,
+        length=len(daily_avg_aqi)
+    )
@@ -0,0 +1,59 @@
+"""
+In-process cache of rendered PNG tiles
+"""
+import hashlib
+from typing import Optional, Tuple
+
+from app.core.cache import BoundedCache
+from app.core.config import settings
+
+# Bump whenever the tile rendering output changes so stale ETags are not reused
+TILE_RENDER_VERSION = 2
+
+# Cached value: (png_bytes, etag)
+tile_cache = BoundedCache(settings.TILE_CACHE_MAX_BYTES, getsizeof=lambda entry: len(entry[0]))
+
+
+def make_tile_key(
+    tif_entry: dict,
+    z: int,
+    x: int,
+    y: int,
+    colormap_name: str,
+    rescale: Optional[str]
+) -> Tuple:
+    """
+    Build the cache key for a tile
+
+    The source file's mtime (from the GeoTIFF catalog entry) is part of the
+    key, so a replaced GeoTIFF never serves tiles rendered from the
+    previous file.
+    """
+    return (TILE_RENDER_VERSION, tif_entry["filename"], tif_entry["mtime_ns"], z, x, y, colormap_name, rescale)
+
+
+def make_tile_etag(key: Tuple) -> str:
+    """
+    Strong ETag for a tile key
+
+    Rendering is deterministic for a given key, so the ETag can be derived
+    from the key alone and checked before the tile is rendered.
+    """
+    digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header value against an ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        # If-None-Match uses weak comparison
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
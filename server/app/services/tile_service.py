@@ -3,14 +3,119 @@ Tile rendering service with AQI colormap
 """
 import logging
 from io import BytesIO
+from typing import Dict, Optional, Tuple
 
 import numpy as np
 from app.core.config import settings
+from app.core.timing import span
+from app.services.geotiff_service import dataset_pool
 from PIL import Image
 
 logger = logging.getLogger(__name__)
 
 
+def _build_aqi_lookup():
+    """
+    Build the palette used to colorize PM2.5 data
+
+    Class indices: 0 = no color, 1..N = AQI breakpoints (in settings order),
+    N + 1 = values above 500. Indices N + 2 and up repeat the same classes
+    with alpha 0 for masked pixels, so an 8-bit palette can carry the mask.
+    """
+    breakpoints = settings.AQI_BREAKPOINTS
+    colors = [(0, 0, 0, 0)] + [tuple(bp["color"]) for bp in breakpoints] + [(126, 0, 35, 255)]
+    masked_colors = [(r, g, b, 0) for r, g, b, _ in colors]
+    lut = np.array(colors + masked_colors, dtype=np.uint8)
+    return lut, len(colors)
+
+
+_AQI_LUT, _AQI_MASK_OFFSET = _build_aqi_lookup()
+# The same palette with one uint32 per RGBA color, for single-gather RGBA output
+_AQI_LUT32 = np.ascontiguousarray(_AQI_LUT).view(np.uint32).ravel()
+
+
+def _aqi_class(value: float) -> int:
+    """Class of one value: the last breakpoint containing it, overridden above 500"""
+    cls = 0
+    for i, bp in enumerate(settings.AQI_BREAKPOINTS, start=1):
+        if bp["pm_min"] <= value <= bp["pm_max"]:
+            cls = i
+    if value > 500:
+        cls = _AQI_MASK_OFFSET - 1
+    return cls
+
+
+_AQI_SEGMENTS: Dict[np.dtype, Tuple[np.ndarray, np.ndarray]] = {}
+
+
+def _aqi_segments(dtype: np.dtype) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Edges splitting the value axis of a float dtype into runs of one class
+
+    Every point where class membership changes is an edge: each pm_min,
+    the next representable value after each pm_max and after 500. The
+    number of edges <= a value is its segment, and classes[segment] its
+    class.
+
+    Returns:
+        (sorted edges in dtype, uint8 class of each segment)
+    """
+    cached = _AQI_SEGMENTS.get(dtype)
+    if cached is not None:
+        return cached
+
+    inf = dtype.type(np.inf)
+    bounds = {dtype.type(bp["pm_min"]) for bp in settings.AQI_BREAKPOINTS}
+    bounds |= {np.nextafter(dtype.type(bp["pm_max"]), inf) for bp in settings.AQI_BREAKPOINTS}
+    bounds.add(np.nextafter(dtype.type(500), inf))
+    edges = sorted(bounds)
+
+    # Segment 0 lies below the first edge; segment k starts at edge k - 1
+    starts = [np.nextafter(edges[0], -inf)] + edges
+    classes = [_aqi_class(float(v)) for v in starts]
+
+    cached = (np.array(edges, dtype=dtype), np.array(classes, dtype=np.uint8))
+    _AQI_SEGMENTS[dtype] = cached
+    return cached
+
+
+def classify_aqi(data: np.ndarray, mask: np.ndarray = None) -> np.ndarray:
+    """
+    Bin PM2.5 data into AQI color classes
+    
+    Counts the segment edges at or below each value (one vectorized
+    comparison per edge, a handful for the AQI breakpoints) and maps the
+    count to a class through a small table.
+    
+    Args:
+        data: PM2.5 data array
+        mask: Optional mask array (0 = nodata)
+        
+    Returns:
+        uint8 array of indices into the AQI lookup table
+    """
+    if data.dtype.kind != "f":
+        data = data.astype(np.float64)
+    edges, segment_classes = _aqi_segments(data.dtype)
+    
+    segments = np.zeros(data.shape, dtype=np.uint8)
+    above = np.empty(data.shape, dtype=bool)
+    for edge in edges:
+        np.greater_equal(data, edge, out=above)
+        segments += above
+    classes = np.take(segment_classes, segments)
+    
+    # NaN compares false against every edge and lands in segment 0
+    if segment_classes[0] != 0:
+        classes[np.isnan(data)] = 0
+    
+    # Handle nodata/mask
+    if mask is not None:
+        classes += (mask == 0).view(np.uint8) * np.uint8(_AQI_MASK_OFFSET)
+    
+    return classes
+
+
 def apply_aqi_colormap(data: np.ndarray, mask: np.ndarray = None) -> np.ndarray:
     """
     Apply AQI colormap to PM2.5 data
@@ -22,22 +127,35 @@ def apply_aqi_colormap(data: np.ndarray, mask: np.ndarray = None) -> np.ndarray:
     Returns:
         RGBA array with AQI colors applied
     """
-    # Create RGBA array
-    rgba = np.zeros((*data.shape, 4), dtype=np.uint8)
+    classes = classify_aqi(data, mask)
+    return np.take(_AQI_LUT32, classes).view(np.uint8).reshape(*classes.shape, 4)
+
+
+def create_aqi_tile_png(data: np.ndarray, mask: np.ndarray = None) -> bytes:
+    """
+    Create an 8-bit palette PNG tile with the AQI colormap
     
-    # Apply colors for each AQI breakpoint
-    for bp in settings.AQI_BREAKPOINTS:
-        mask_range = (data >= bp["pm_min"]) & (data <= bp["pm_max"])
-        rgba[mask_range] = bp["color"]
+    Decodes to the same RGBA pixels as apply_aqi_colormap, at a fraction
+    of the size of a full RGBA PNG.
     
-    # Handle values > 500
-    rgba[data > 500] = (126, 0, 35, 255)
+    Args:
+        data: PM2.5 data array
+        mask: Optional mask array
+        
+    Returns:
+        PNG image bytes
+    """
+    with span("colormap"):
+        classes = classify_aqi(data, mask)
+    height, width = classes.shape
     
-    # Handle nodata/mask
-    if mask is not None:
-        rgba[mask == 0, 3] = 0  # Set alpha to 0 for masked pixels
+    with span("encode"):
+        pil_img = Image.frombytes('P', (width, height), np.ascontiguousarray(classes).tobytes())
+        pil_img.putpalette(_AQI_LUT[:, :3].tobytes(), rawmode='RGB')
+        buf = BytesIO()
+        pil_img.save(buf, format='PNG', transparency=_AQI_LUT[:, 3].tobytes())
     
-    return rgba
+    return buf.getvalue()
 
 
 def create_tile_png(
@@ -61,10 +179,11 @@ def create_tile_png(
         PNG image bytes
     """
     if colormap.lower() == 'aqi':
-        rgba_uint8 = apply_aqi_colormap(data, mask)
-    else:
-        # Use matplotlib colormap
-        import matplotlib.pyplot as plt
+        return create_aqi_tile_png(data, mask)
+    
+    # Use matplotlib colormap
+    import matplotlib.pyplot as plt
+    with span("colormap"):
         data_normalized = np.clip((data - vmin) / (vmax - vmin), 0, 1)
         colormap_obj = plt.get_cmap(colormap)
         rgba = colormap_obj(data_normalized)
@@ -75,13 +194,39 @@ def create_tile_png(
             rgba_uint8[..., 3] = np.where(mask == 0, 0, 255)
     
     # Create PIL image and save to bytes
-    pil_img = Image.fromarray(rgba_uint8, mode='RGBA')
-    buf = BytesIO()
-    pil_img.save(buf, format='PNG')
+    with span("encode"):
+        pil_img = Image.fromarray(rgba_uint8, mode='RGBA')
+        buf = BytesIO()
+        pil_img.save(buf, format='PNG')
     
     return buf.getvalue()
 
 
+def read_tile(abs_path: str, x: int, y: int, z: int) -> Optional[Tuple[np.ndarray, Optional[np.ndarray]]]:
+    """
+    Read the first band of a map tile from a GeoTIFF (blocking)
+    
+    Args:
+        abs_path: Absolute path to the GeoTIFF file
+        x, y, z: XYZ tile coordinates
+        
+    Returns:
+        (data, mask) arrays, or None if the tile has no data
+    """
+    from rio_tiler.io import Reader
+
+    with dataset_pool.open(abs_path) as dataset:
+        with span("read"), Reader(abs_path, dataset=dataset) as src:
+            img = src.tile(x, y, z)
+    
+    if img.data.size == 0:
+        return None
+    
+    data = img.data[0]
+    mask = img.mask[0] if img.mask is not None else None
+    return data, mask
+
+
 def create_transparent_tile() -> bytes:
     """
     Create transparent PNG tile
@@ -89,7 +234,8 @@ def create_transparent_tile() -> bytes:
     Returns:
         PNG image bytes
     """
-    transparent = Image.new('RGBA', (settings.TILE_SIZE, settings.TILE_SIZE), (0, 0, 0, 0))
-    buf = BytesIO()
-    transparent.save(buf, format='PNG')
+    with span("encode"):
+        transparent = Image.new('RGBA', (settings.TILE_SIZE, settings.TILE_SIZE), (0, 0, 0, 0))
+        buf = BytesIO()
+        transparent.save(buf, format='PNG')
     return buf.getvalue()
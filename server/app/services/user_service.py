@@ -0,0 +1,82 @@
+"""
+User lookups shared by the auth endpoints
+
+Profile lookups are served from a short-lived in-process cache of built
+UserResponse objects, keyed by _id, email and username. Profile updates
+drop all three keys; other workers see the change within USER_CACHE_TTL.
+"""
+import time
+from typing import Optional
+
+from app.core.cache import BoundedCache
+from app.core.config import settings
+from app.models.user import UserProfile, UserResponse
+
+# Fields of a user document used by UserResponse
+PROFILE_PROJECTION = {"email": 1, "username": 1, "profile": 1, "role": 1, "is_active": 1, "created_at": 1}
+
+# ...plus the password hash, for login
+LOGIN_PROJECTION = {**PROFILE_PROJECTION, "hashed_password": 1}
+
+# (field, value) -> UserResponse, field being "_id", "email" or "username"
+user_cache = BoundedCache(
+    max(settings.USER_CACHE_SIZE, 1),
+    ttu=lambda key, value, now: now + settings.USER_CACHE_TTL,
+    timer=time.monotonic,
+)
+
+
+def user_response(user: dict) -> UserResponse:
+    """Build the API representation of a user document"""
+    return UserResponse(
+        _id=str(user["_id"]),
+        email=user["email"],
+        username=user.get("username", ""),
+        profile=UserProfile(**user.get("profile", {})),
+        role=user.get("role", "user"),
+        is_active=user.get("is_active", True),
+        created_at=user["created_at"]
+    )
+
+
+async def find_login_user(db, identifier: str) -> Optional[dict]:
+    """
+    User document (with password hash) for an email or username
+
+    A single equality lookup on one unique index: usernames can't contain
+    "@" and emails must, so the identifier can only match one of the two.
+    """
+    field = "email" if "@" in identifier else "username"
+    return await db.users.find_one({field: identifier}, LOGIN_PROJECTION)
+
+
+async def get_user_profile(db, field: str, value) -> Optional[UserResponse]:
+    """
+    Cached profile lookup by "_id", "email" or "username"
+
+    Returns:
+        UserResponse (shared between requests - don't modify it), or None
+        if no user matches (misses aren't cached)
+    """
+    cache_enabled = settings.USER_CACHE_SIZE > 0 and settings.USER_CACHE_TTL > 0
+    key = (field, value)
+    if cache_enabled:
+        cached = user_cache.get(key)
+        if cached is not None:
+            return cached
+
+    user = await db.users.find_one({field: value}, PROFILE_PROJECTION)
+    if user is None:
+        return None
+    response = user_response(user)
+    if cache_enabled:
+        user_cache.set(key, response)
+    return response
+
+
+def invalidate_user(user: dict) -> None:
+    """Drop the cached profile of a user under all of its keys"""
+    user_cache.pop(("_id", user["_id"]))
+    user_cache.pop(("email", user["email"]))
+    if user.get("username"):
+        user_cache.pop(("username", user["username"]))
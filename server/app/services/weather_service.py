@@ -0,0 +1,176 @@
+"""
+Open-Meteo daily weather for /pm25/forecast
+
+One pooled HTTP client is kept for the lifetime of the app (keep-alive,
+no TLS handshake per request). Responses are cached per grid cell of
+rounded coordinates and number of forecast days:
+
+- younger than WEATHER_CACHE_TTL: served from the cache
+- older, but within WEATHER_CACHE_STALE_SECONDS more: served stale while
+  one background refresh runs
+- older than that (or missing): fetched before answering
+
+Concurrent requests for the same cell share a single upstream fetch.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+import httpx
+from app.core.cache import BoundedCache
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+DAILY_VARIABLES = "temperature_2m_max,temperature_2m_min,relative_humidity_2m_mean,wind_speed_10m_max,rain_sum"
+
+# Open-Meteo daily variable -> key used in the forecast response
+_FIELDS = {
+    "temperature_2m_max": "temp_max",
+    "temperature_2m_min": "temp_min",
+    "relative_humidity_2m_mean": "humidity",
+    "wind_speed_10m_max": "wind_speed",
+    "rain_sum": "rain_sum",
+}
+
+
+def parse_daily(daily: dict) -> Dict[str, dict]:
+    """
+    Map an Open-Meteo "daily" block by date
+
+    Returns:
+        Mapping of YYYY-MM-DD to {temp_max, temp_min, humidity, wind_speed, rain_sum}
+    """
+    weather_data = {}
+    for i, date_key in enumerate(daily.get("time", [])):
+        weather_data[date_key] = {}
+        for variable, field in _FIELDS.items():
+            values = daily.get(variable, [])
+            weather_data[date_key][field] = values[i] if i < len(values) else None
+    return weather_data
+
+
+class WeatherService:
+    """Pooled client plus TTL / stale-while-revalidate cache for Open-Meteo"""
+
+    # Cumulative stats() fields, exported as counters by /metrics
+    COUNTER_FIELDS = BoundedCache.COUNTER_FIELDS + ("fetches", "fetch_errors", "stale_served")
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._cache = BoundedCache(settings.WEATHER_CACHE_MAX_ENTRIES)
+        self._inflight: Dict[Tuple, asyncio.Task] = {}
+        self.fetches = 0
+        self.fetch_errors = 0
+        self.stale_served = 0
+
+    def start(self) -> None:
+        """Create the shared HTTP client (idempotent)"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=settings.WEATHER_TIMEOUT,
+                limits=httpx.Limits(max_connections=settings.WEATHER_MAX_CONNECTIONS,
+                                    max_keepalive_connections=settings.WEATHER_MAX_CONNECTIONS),
+            )
+
+    async def aclose(self) -> None:
+        """Cancel background refreshes and close the HTTP client"""
+        for task in list(self._inflight.values()):
+            task.cancel()
+        self._inflight.clear()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @staticmethod
+    def cache_key(lat: float, lon: float, days: int) -> Tuple[float, float, int]:
+        """Grid cell (rounded lat/lon) and forecast length"""
+        cell = settings.WEATHER_CACHE_CELL_DEG
+        return (round(round(lat / cell) * cell, 6), round(round(lon / cell) * cell, 6), days)
+
+    async def _fetch(self, key: Tuple[float, float, int]) -> Dict[str, dict]:
+        """Fetch one cell from Open-Meteo and store it in the cache"""
+        lat, lon, days = key
+        self.start()
+        self.fetches += 1
+        try:
+            response = await self._client.get(settings.WEATHER_API_URL, params={
+                "latitude": lat,
+                "longitude": lon,
+                "daily": DAILY_VARIABLES,
+                "timezone": "Asia/Bangkok",
+                "forecast_days": days,
+            })
+            if response.status_code != 200:
+                raise httpx.HTTPStatusError(f"Weather API returned {response.status_code}",
+                                            request=response.request, response=response)
+            weather_data = parse_daily(response.json().get("daily", {}))
+        except Exception:
+            self.fetch_errors += 1
+            raise
+        self._cache.set(key, (time.monotonic(), weather_data))
+        logger.info(f"✅ Weather data fetched for {len(weather_data)} days")
+        return weather_data
+
+    def _refresh(self, key: Tuple[float, float, int]) -> asyncio.Task:
+        """Start a fetch for key, or join the one already running"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._refresh_done(key, t))
+        return task
+
+    def _refresh_done(self, key: Tuple[float, float, int], task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"⚠️ Could not fetch weather data: {task.exception()}")
+
+    async def get_daily(self, lat: float, lon: float, days: int) -> Dict[str, dict]:
+        """
+        Daily weather for a coordinate
+
+        Args:
+            lat: Latitude
+            lon: Longitude
+            days: Number of forecast days
+
+        Returns:
+            Mapping of YYYY-MM-DD to weather fields; empty if the weather
+            API is unavailable and nothing usable is cached
+        """
+        key = self.cache_key(lat, lon, days)
+        cached = self._cache.get(key)
+        if cached is not None:
+            fetched_at, weather_data = cached
+            age = time.monotonic() - fetched_at
+            if age < settings.WEATHER_CACHE_TTL:
+                return weather_data
+            if age < settings.WEATHER_CACHE_TTL + settings.WEATHER_CACHE_STALE_SECONDS:
+                self.stale_served += 1
+                self._refresh(key)
+                return weather_data
+
+        try:
+            # shield: a cancelled request must not cancel the fetch other requests share
+            return await asyncio.shield(self._refresh(key))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Already logged by _refresh_done; an expired entry beats no weather
+            return cached[1] if cached is not None else {}
+
+    def stats(self) -> dict:
+        return {
+            **self._cache.stats(),
+            "fetches": self.fetches,
+            "fetch_errors": self.fetch_errors,
+            "stale_served": self.stale_served,
+            "inflight": len(self._inflight),
+        }
+
+
+# Shared weather client/cache, started and closed with the app
+weather_service = WeatherService()
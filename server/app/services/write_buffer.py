@@ -0,0 +1,241 @@
+"""
+Write-behind buffer for high-frequency inserts
+
+Documents from all requests are queued in-process and written by one
+background task with unordered insert_many, in batches flushed when they
+reach max_batch documents or flush_interval seconds after the first queued
+document. Callers either return as soon as the document is queued, or
+await an acknowledgement that resolves once their batch is written.
+
+When the queue is full, put() waits (backpressure) up to put_timeout and
+then raises BufferFullError. put() on a buffer that isn't running raises
+BufferClosedError instead of queueing a document nothing will write.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional
+
+from app.core.config import settings
+from app.db.mongodb import get_database
+from app.services.location_rollups import record_locations
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+
+class BufferFullError(Exception):
+    """The write buffer stayed full for longer than put_timeout"""
+
+
+class BufferClosedError(Exception):
+    """The write buffer is not running (never started, or stopped)"""
+
+
+class WriteBehindBuffer:
+    """
+    Coalesces inserts into one collection
+
+    Args:
+        name: Name used in logs and stats
+        get_collection: Returns the collection to write to
+        max_batch: Documents per insert_many
+        flush_interval: Seconds to wait for a batch to fill
+        max_queue: Queued documents before put() blocks
+        put_timeout: Seconds put() waits for space before raising BufferFullError
+        after_write: Optional coroutine called with each batch's written documents
+    """
+
+    # Cumulative stats() fields, exported as counters by /metrics
+    COUNTER_FIELDS = ("queued", "written", "failed", "rejected", "batches")
+
+    def __init__(
+        self,
+        name: str,
+        get_collection: Callable[[], object],
+        max_batch: int = 500,
+        flush_interval: float = 0.2,
+        max_queue: int = 10000,
+        put_timeout: float = 5.0,
+        after_write: Optional[Callable[[List[dict]], Awaitable[None]]] = None,
+    ):
+        self.name = name
+        self.get_collection = get_collection
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.put_timeout = put_timeout
+        self.after_write = after_write
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.queued = 0
+        self.written = 0
+        self.failed = 0
+        self.rejected = 0
+        self.batches = 0
+        self.max_batch_size = 0
+        self.total_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.max_queue_depth = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """Start the flush task (idempotent)"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"✅ Write-behind buffer '{self.name}' started "
+                    f"(batch {self.max_batch}, interval {self.flush_interval * 1000:.0f} ms)")
+
+    async def stop(self) -> None:
+        """Write everything still queued, then stop the flush task"""
+        if not self.running:
+            return
+        await self._queue.put(None)  # sentinel: flush and exit
+        await self._task
+        self._task = None
+        logger.info(f"✅ Write-behind buffer '{self.name}' flushed and stopped")
+
+    async def put(self, document: dict, ack: bool = False) -> None:
+        """
+        Queue a document for insertion
+
+        Args:
+            document: Document to insert (give it an _id up front if the
+                caller needs to return it)
+            ack: Wait until the document's batch has been written; write
+                errors are raised to the caller
+
+        Raises:
+            BufferFullError: The queue stayed full for put_timeout seconds
+            BufferClosedError: The buffer is not running
+        """
+        if not self.running:
+            self.rejected += 1
+            raise BufferClosedError(f"Write buffer '{self.name}' is not running")
+        future = asyncio.get_running_loop().create_future() if ack else None
+        try:
+            self._queue.put_nowait((document, future))
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self._queue.put((document, future)), timeout=self.put_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise BufferFullError(f"Write buffer '{self.name}' is full")
+            if not self.running:
+                # The buffer finished stopping while we waited for space
+                self.rejected += 1
+                raise BufferClosedError(f"Write buffer '{self.name}' stopped")
+        self.queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        if future is not None:
+            await future
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self._queue.get_nowait() if timeout <= 0 else await asyncio.wait_for(self._queue.get(), timeout)
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+        # Drain whatever was queued behind the sentinel
+        while not self._queue.empty():
+            batch = []
+            while len(batch) < self.max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is not None:
+                    batch.append(item)
+            if batch:
+                await self._flush(batch)
+
+    async def _flush(self, batch: list) -> None:
+        documents = [document for document, _ in batch]
+        started = time.perf_counter()
+        errors = {}
+        try:
+            await self.get_collection().insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            errors = {err["index"]: e for err in e.details.get("writeErrors", [])}
+        except Exception as e:
+            errors = {i: e for i in range(len(documents))}
+        elapsed = time.perf_counter() - started
+
+        self.batches += 1
+        self.max_batch_size = max(self.max_batch_size, len(batch))
+        self.total_flush_seconds += elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        self.failed += len(errors)
+        self.written += len(batch) - len(errors)
+        if errors:
+            logger.error(f"❌ Write buffer '{self.name}': {len(errors)}/{len(batch)} inserts failed: "
+                         f"{next(iter(errors.values()))}")
+
+        for i, (_, future) in enumerate(batch):
+            if future is not None and not future.done():
+                if i in errors:
+                    future.set_exception(errors[i])
+                else:
+                    future.set_result(None)
+
+        written = [document for i, document in enumerate(documents) if i not in errors]
+        if written and self.after_write is not None:
+            try:
+                await self.after_write(written)
+            except Exception as e:
+                logger.error(f"Write buffer '{self.name}' post-write hook failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.running,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_depth": self.max_queue_depth,
+            "queued": self.queued,
+            "written": self.written,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "avg_batch_size": round((self.written + self.failed) / self.batches, 1) if self.batches else None,
+            "max_batch_size": self.max_batch_size,
+            "avg_flush_ms": round(self.total_flush_seconds / self.batches * 1000, 2) if self.batches else None,
+            "max_flush_ms": round(self.max_flush_seconds * 1000, 2),
+        }
+
+
+def _locations_collection():
+    return get_database().locations
+
+
+async def _update_location_rollups(documents: List[dict]) -> None:
+    if settings.LOCATION_ROLLUPS_ENABLED:
+        await record_locations(get_database(), documents)
+
+
+# Buffer for /location/save (started only when LOCATION_WRITE_BEHIND_ENABLED)
+location_write_buffer = WriteBehindBuffer(
+    "locations",
+    _locations_collection,
+    max_batch=settings.LOCATION_WRITE_BATCH_SIZE,
+    flush_interval=settings.LOCATION_WRITE_FLUSH_MS / 1000,
+    max_queue=settings.LOCATION_WRITE_QUEUE_SIZE,
+    put_timeout=settings.LOCATION_WRITE_PUT_TIMEOUT,
+    after_write=_update_location_rollups,
+)
@@ -0,0 +1,52 @@
+"""
+Migration script to build per-user daily rollups (location_daily_rollups)
+from existing location records
+Run this script once before serving /location/stats from rollups; it can be
+re-run at any time to rebuild them
+
+Usage:
+    python migrations/backfill_location_rollups.py [--user USER_ID]
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+parent_dir = str(Path(__file__).parent.parent)
+sys.path.insert(0, parent_dir)
+
+from app.db.mongodb import (close_mongo_connection, connect_to_mongo,
+                            get_database)
+from app.services.location_rollups import ROLLUP_COLLECTION, rebuild_rollups
+
+
+async def migrate_backfill_rollups(user_id: str = None):
+    """Rebuild daily rollups from db.locations"""
+    print("🚀 Starting migration: Backfill location daily rollups")
+    
+    try:
+        await connect_to_mongo()
+        db = get_database()
+        
+        scope = f"user {user_id}" if user_id else "all users"
+        print(f"📊 Rebuilding rollups for {scope}...")
+        written = await rebuild_rollups(db, user_id=user_id)
+        print(f"  ✓ Wrote {written} daily rollups")
+        
+        total = await db[ROLLUP_COLLECTION].count_documents({})
+        print(f"✅ Migration completed successfully! ({total} rollups in {ROLLUP_COLLECTION})")
+        
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill per-user daily location rollups")
+    parser.add_argument("--user", help="Only rebuild this user's rollups")
+    args = parser.parse_args()
+    asyncio.run(migrate_backfill_rollups(args.user))
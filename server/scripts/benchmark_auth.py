@@ -0,0 +1,63 @@
+"""
+Micro-benchmark: per-request JWT verification cost
+
+Times decode_token() (what get_current_user runs on every authenticated
+request) with each available JWT backend, uncached and with the
+verified-token cache, for the same long-lived token.
+
+Usage:
+    SECRET_KEY=... python scripts/benchmark_auth.py [--number 20000]
+"""
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+# Add parent directory to path
+parent_dir = str(Path(__file__).parent.parent)
+sys.path.insert(0, parent_dir)
+
+from app.core import security
+from app.core.config import settings
+
+
+def backends() -> dict:
+    """Decode functions of the installed JWT backends"""
+    found = {"jose": security._jose_decode}
+    try:
+        import jwt as pyjwt
+        found["pyjwt"] = lambda token: pyjwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except ImportError:
+        print("PyJWT not installed - skipping the pyjwt backend (pip install pyjwt)")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JWT verification per request")
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    token = security.create_access_token({"sub": "user@example.com", "user_id": "674d8e5c3f2a1b4d5e6f7g8h"})
+    original_decode, original_size = security._backend_decode, settings.JWT_CACHE_SIZE
+
+    available = backends()
+    print(f"{'backend':>8} {'uncached (µs)':>14} {'cached (µs)':>12}")
+    try:
+        for name, decode in available.items():
+            assert decode(token)["user_id"] == "674d8e5c3f2a1b4d5e6f7g8h"
+            security._backend_decode = decode
+
+            settings.JWT_CACHE_SIZE = 0
+            uncached = timeit.timeit(lambda: security.decode_token(token), number=args.number) / args.number
+
+            settings.JWT_CACHE_SIZE = original_size or 10000
+            security.token_cache.clear()
+            cached = timeit.timeit(lambda: security.decode_token(token), number=args.number) / args.number
+
+            print(f"{name:>8} {uncached * 1e6:>14.1f} {cached * 1e6:>12.2f}")
+    finally:
+        security._backend_decode, settings.JWT_CACHE_SIZE = original_decode, original_size
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Micro-benchmark: lookup-table AQI colormap vs the original per-breakpoint masks
+
+Checks that both produce identical RGBA pixels, then compares colormap time
+and PNG tile size.
+
+Usage:
+    python scripts/benchmark_colormap.py [--size 256] [--repeat 200]
+"""
+import argparse
+import sys
+import timeit
+from io import BytesIO
+from pathlib import Path
+
+# Add parent directory to path
+parent_dir = str(Path(__file__).parent.parent)
+sys.path.insert(0, parent_dir)
+
+import numpy as np
+from app.core.config import settings
+from app.services.tile_service import apply_aqi_colormap, create_aqi_tile_png
+from PIL import Image
+
+
+def legacy_apply_aqi_colormap(data: np.ndarray, mask: np.ndarray = None) -> np.ndarray:
+    """Original implementation: one boolean mask per breakpoint"""
+    rgba = np.zeros((*data.shape, 4), dtype=np.uint8)
+    for bp in settings.AQI_BREAKPOINTS:
+        mask_range = (data >= bp["pm_min"]) & (data <= bp["pm_max"])
+        rgba[mask_range] = bp["color"]
+    rgba[data > 500] = (126, 0, 35, 255)
+    if mask is not None:
+        rgba[mask == 0, 3] = 0
+    return rgba
+
+
+def legacy_tile_png(data: np.ndarray, mask: np.ndarray = None) -> bytes:
+    """Original RGBA PNG output"""
+    buf = BytesIO()
+    Image.fromarray(legacy_apply_aqi_colormap(data, mask), mode='RGBA').save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def make_tile(size: int, seed: int = 0):
+    """Smooth PM2.5 field with edge values, NaNs and a nodata region"""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:size, 0:size]
+    data = (60 + 50 * np.sin(xx / 23.0) * np.cos(yy / 31.0) + rng.normal(0, 5, (size, size))).astype(np.float32)
+    data[:4, :] = np.array([-1, 0, 25, 50, 80, 150, 250, 500, 500.2, 800], dtype=np.float32).repeat(size)[:4 * size].reshape(4, size)
+    data[10:20, 10:20] = np.nan
+    mask = np.full((size, size), 255, dtype=np.uint8)
+    mask[size // 2:, : size // 3] = 0
+    return data, mask
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    data, mask = make_tile(args.size)
+
+    # Correctness: RGBA arrays and decoded PNG pixels must match exactly
+    assert np.array_equal(legacy_apply_aqi_colormap(data, mask), apply_aqi_colormap(data, mask))
+    data64 = data.astype(np.float64)
+    assert np.array_equal(legacy_apply_aqi_colormap(data64, mask), apply_aqi_colormap(data64, mask))
+    decoded = np.asarray(Image.open(BytesIO(create_aqi_tile_png(data, mask))).convert("RGBA"))
+    assert np.array_equal(decoded, legacy_apply_aqi_colormap(data, mask))
+    print("✅ Pixel output identical")
+
+    def bench(label, func):
+        seconds = min(timeit.repeat(func, number=args.repeat, repeat=3)) / args.repeat
+        print(f"  {label:<28} {seconds * 1000:8.3f} ms")
+        return seconds
+
+    print(f"Colormap ({args.size}x{args.size}):")
+    old = bench("legacy masks", lambda: legacy_apply_aqi_colormap(data, mask))
+    new = bench("lookup table", lambda: apply_aqi_colormap(data, mask))
+    print(f"  speedup: {old / new:.1f}x")
+
+    print("Colormap + PNG encode:")
+    old = bench("legacy RGBA PNG", lambda: legacy_tile_png(data, mask))
+    new = bench("palette PNG", lambda: create_aqi_tile_png(data, mask))
+    print(f"  speedup: {old / new:.1f}x")
+
+    old_size = len(legacy_tile_png(data, mask))
+    new_size = len(create_aqi_tile_png(data, mask))
+    print(f"PNG size: {old_size} -> {new_size} bytes ({new_size / old_size:.0%})")
+
+
+if __name__ == "__main__":
+    main()
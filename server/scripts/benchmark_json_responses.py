@@ -0,0 +1,128 @@
+"""
+Benchmark: FastAPI response_model serialization vs the fast JSON path
+
+Serves the same synthetic location history through a throwaway FastAPI
+app three ways and checks the bodies are byte-identical:
+    default       List[LocationRecordResponse] returned through response_model
+    prevalidated  model_list_response(): built models dumped in one pass
+    orjson dicts  a forecast-style dict payload, JSONResponse vs FastJSONResponse
+
+Usage:
+    SECRET_KEY=... python scripts/benchmark_json_responses.py [--items 10000] [--repeat 5]
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+# Add parent directory to path
+parent_dir = str(Path(__file__).parent.parent)
+sys.path.insert(0, parent_dir)
+
+from app.core.responses import FastJSONResponse, model_list_response
+from app.models.location import LocationRecordResponse
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+
+def make_history(n: int, seed: int = 0) -> List[dict]:
+    """Location documents as returned by Motor (naive UTC timestamps)"""
+    rng = random.Random(seed)
+    ts = datetime(2026, 1, 1)
+    return [
+        {
+            "_id": ObjectId(),
+            "user_id": "674d8e5c3f2a1b4d5e6f7g8h",
+            "latitude": 21.0 + rng.random(),
+            "longitude": 105.5 + rng.random(),
+            "aqi": rng.choice([None, rng.randint(0, 300)]),
+            "pm25": rng.choice([None, rng.random() * 200]),
+            "address": rng.choice([None, "Phường Dịch Vọng, Quận Cầu Giấy, Hà Nội"]),
+            "timestamp": ts + timedelta(milliseconds=7123 * i),
+        }
+        for i in range(n)
+    ]
+
+
+def build_records(docs: List[dict]) -> List[LocationRecordResponse]:
+    return [
+        LocationRecordResponse(
+            _id=str(doc["_id"]),
+            user_id=doc["user_id"],
+            latitude=doc["latitude"],
+            longitude=doc["longitude"],
+            aqi=doc.get("aqi"),
+            pm25=doc.get("pm25"),
+            address=doc.get("address"),
+            timestamp=doc["timestamp"]
+        )
+        for doc in docs
+    ]
+
+
+def make_app(docs: List[dict], forecast: dict) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/default", response_model=List[LocationRecordResponse])
+    def default():
+        return build_records(docs)
+
+    @app.get("/prevalidated", response_model=List[LocationRecordResponse])
+    def prevalidated():
+        return model_list_response(LocationRecordResponse, build_records(docs))
+
+    @app.get("/forecast/json", response_class=JSONResponse)
+    def forecast_json():
+        return forecast
+
+    @app.get("/forecast/orjson", response_class=FastJSONResponse)
+    def forecast_orjson():
+        return forecast
+
+    return app
+
+
+def time_get(client: TestClient, path: str, repeat: int):
+    best, body = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = client.get(path).content
+        best = min(best, time.perf_counter() - start)
+    return best, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON response serialization")
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    docs = make_history(args.items)
+    forecast = {
+        "lat": 21.03, "lon": 105.85, "unit": "μg/m³",
+        "forecast": [{"date": f"2026-01-{d:02d}", "pm25": 40.5 + d, "aqi": 110 + d,
+                      "weather": {"temperature_2m_max": 25.1, "precipitation_sum": 0.0}}
+                     for d in range(1, 8)] * (args.items // 70 or 1),
+    }
+    client = TestClient(make_app(docs, forecast))
+
+    print(f"{'path':>16} {'ms':>8} {'bytes':>10}")
+    results = {}
+    for path in ("/default", "/prevalidated", "/forecast/json", "/forecast/orjson"):
+        seconds, body = time_get(client, path, args.repeat)
+        results[path] = (seconds, body)
+        print(f"{path:>16} {seconds * 1000:>8.1f} {len(body):>10}")
+
+    assert results["/default"][1] == results["/prevalidated"][1], "History bodies differ"
+    assert results["/forecast/json"][1] == results["/forecast/orjson"][1], "Forecast bodies differ"
+    print(f"✅ Bodies identical; history {results['/default'][0] / results['/prevalidated'][0]:.1f}x faster, "
+          f"dict payload {results['/forecast/json'][0] / results['/forecast/orjson'][0]:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
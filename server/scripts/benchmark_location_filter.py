@@ -0,0 +1,82 @@
+"""
+Benchmark: windowed duplicate filter for location history vs the O(n²) scan
+
+Generates synthetic GPS histories (frequent pings with jitter plus trips
+across a city), checks that both filters keep exactly the same records,
+then times them.
+
+Usage:
+    python scripts/benchmark_location_filter.py [--sizes 1000 10000 100000] [--scan-max 10000]
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add parent directory to path
+parent_dir = str(Path(__file__).parent.parent)
+sys.path.insert(0, parent_dir)
+
+from app.api.endpoints.location import (_filter_duplicate_locations_scan,
+                                        filter_duplicate_locations)
+
+
+def make_history(n: int, seed: int = 0) -> list:
+    """Synthetic location documents sorted by timestamp DESC"""
+    rng = random.Random(seed)
+    lat, lon = 21.03, 105.85
+    ts = datetime(2026, 1, 1)
+    docs = []
+    for i in range(n):
+        if rng.random() < 0.05:
+            # Move somewhere else in the city
+            lat, lon = 21.03 + rng.uniform(-0.15, 0.15), 105.85 + rng.uniform(-0.15, 0.15)
+        docs.append({
+            "_id": i,
+            "latitude": lat + rng.gauss(0, 0.004),
+            "longitude": lon + rng.gauss(0, 0.004),
+            "timestamp": ts,
+        })
+        ts += timedelta(seconds=rng.randint(5, 120))
+    docs.reverse()
+    return docs
+
+
+def time_call(func, docs, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(docs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark location duplicate filtering")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--scan-max", type=int, default=10000,
+                        help="Largest size to run the O(n²) scan on")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'records':>8} {'kept':>7} {'scan (ms)':>11} {'window (ms)':>12} {'speedup':>8}")
+    for n in args.sizes:
+        docs = make_history(n)
+        kept = filter_duplicate_locations(docs)
+        new_ms = time_call(filter_duplicate_locations, docs, args.repeat) * 1000
+
+        if n <= args.scan_max:
+            expected = _filter_duplicate_locations_scan(docs)
+            assert [d["_id"] for d in kept] == [d["_id"] for d in expected], f"Output differs at n={n}"
+            scan_ms = time_call(_filter_duplicate_locations_scan, docs, 1) * 1000
+            print(f"{n:>8} {len(kept):>7} {scan_ms:>11.1f} {new_ms:>12.1f} {scan_ms / new_ms:>7.1f}x")
+        else:
+            print(f"{n:>8} {len(kept):>7} {'-':>11} {new_ms:>12.1f} {'-':>8}")
+
+    print("✅ Outputs identical")
+
+
+if __name__ == "__main__":
+    main()
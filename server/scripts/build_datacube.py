@@ -0,0 +1,52 @@
+"""
+Build or update the time-stacked PM2.5 datacube used by /pm25/forecast
+
+Adds the most recent CUBE_SLOTS dates (or the given dates) to the cube in
+CUBE_DIR. Dates already stored from the same file version are skipped.
+
+Usage:
+    python scripts/build_datacube.py                 # latest CUBE_SLOTS dates
+    python scripts/build_datacube.py 20251202 20251203
+    python scripts/build_datacube.py --rebuild
+"""
+import argparse
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+parent_dir = str(Path(__file__).parent.parent)
+sys.path.insert(0, parent_dir)
+
+from app.core.config import settings
+from app.services.datacube import datacube
+from app.services.geotiff_service import tif_catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the PM2.5 datacube")
+    parser.add_argument("dates", nargs="*", help="Dates in YYYYMMDD format (default: latest CUBE_SLOTS)")
+    parser.add_argument("--rebuild", action="store_true", help="Discard the existing cube first")
+    args = parser.parse_args()
+
+    print(f"🚀 Building datacube in {settings.CUBE_DIR} ({settings.CUBE_SLOTS} slots)")
+    if args.rebuild:
+        for path in (datacube.index_path, datacube.data_path):
+            if path.exists():
+                path.unlink()
+
+    dates = args.dates or [d["date_str"] for d in tif_catalog.dates()[:settings.CUBE_SLOTS]]
+    files = {}
+    for date_str in dates:
+        entry = tif_catalog.get(date_str)
+        if entry is None:
+            print(f"  ⚠️  No GeoTIFF for {date_str}")
+            continue
+        files[date_str] = entry["path"]
+
+    written = datacube.add_dates(files)
+    print(f"✅ Done: {len(written)} dates written, {len(files) - len(written)} up to date")
+    print(f"   Cube: {datacube.stats()}")
+
+
+if __name__ == "__main__":
+    main()
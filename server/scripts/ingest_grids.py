@@ -0,0 +1,59 @@
+"""
+Ingest PM2.5 GeoTIFFs into memory-mapped grid files for fast point lookups
+
+Writes <tif stem>.grid files into GRID_DIR. Files whose grid is already up
+to date are skipped unless --force is given.
+
+Usage:
+    python scripts/ingest_grids.py                  # all dates
+    python scripts/ingest_grids.py 20251202 20251203
+    python scripts/ingest_grids.py --dtype uint16
+"""
+import argparse
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+parent_dir = str(Path(__file__).parent.parent)
+sys.path.insert(0, parent_dir)
+
+from app.core.config import settings
+from app.services.geotiff_service import tif_catalog
+from app.services.grid_store import grid_store, ingest_tif
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest PM2.5 GeoTIFFs into grid files")
+    parser.add_argument("dates", nargs="*", help="Dates in YYYYMMDD format (default: all)")
+    parser.add_argument("--dtype", choices=["float32", "uint16"], default=settings.GRID_STORE_DTYPE)
+    parser.add_argument("--scale", type=float, default=settings.GRID_UINT16_SCALE,
+                        help="µg/m³ per step for uint16 grids")
+    parser.add_argument("--force", action="store_true", help="Re-ingest up-to-date grids")
+    args = parser.parse_args()
+
+    print(f"🚀 Ingesting grids into {settings.GRID_DIR}")
+    dates = args.dates or [d["date_str"] for d in tif_catalog.dates()]
+
+    written = skipped = failed = 0
+    for date_str in dates:
+        entry = tif_catalog.get(date_str)
+        if entry is None:
+            print(f"  ⚠️  No GeoTIFF for {date_str}")
+            failed += 1
+            continue
+        if not args.force and grid_store.get(str(entry["path"]), entry["mtime_ns"]) is not None:
+            skipped += 1
+            continue
+        try:
+            ingest_tif(entry["path"], dtype=args.dtype, scale=args.scale)
+            print(f"  ✓ {entry['filename']}")
+            written += 1
+        except Exception as e:
+            print(f"  ❌ {entry['filename']}: {e}")
+            failed += 1
+
+    print(f"✅ Done: {written} written, {skipped} up to date, {failed} failed")
+
+
+if __name__ == "__main__":
+    main()
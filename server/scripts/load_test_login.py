@@ -0,0 +1,94 @@
+"""
+Load test: latency of other endpoints during a login storm
+
+Measures a probe endpoint (default /health) while idle, then again while
+many concurrent logins hit /auth/login. With bcrypt on the password
+executor the probe latency should stay flat; with bcrypt on the event
+loop every probe waits behind the queued hashes.
+
+Run against a running server with an existing account:
+
+Usage:
+    python scripts/load_test_login.py --user alice --password secret \
+        [--url http://localhost:8000] [--logins 200] [--concurrency 50] \
+        [--probe /pm25/point?lon=105.85&lat=21.03]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+def summarize(latencies: list) -> str:
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) >= 20 else latencies[-1]
+    return (f"n={len(latencies):>4}  p50={statistics.median(latencies) * 1000:7.1f} ms  "
+            f"p95={p95 * 1000:7.1f} ms  max={latencies[-1] * 1000:7.1f} ms")
+
+
+async def probe(client: httpx.AsyncClient, path: str, stop: asyncio.Event, interval: float) -> list:
+    """Request the probe path every interval seconds until stop is set"""
+    latencies = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get(path)
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def login_storm(client: httpx.AsyncClient, user: str, password: str, logins: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = {}
+
+    async def login():
+        async with semaphore:
+            r = await client.post("/auth/login", json={"email_or_username": user, "password": password})
+            statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+    await asyncio.gather(*(login() for _ in range(logins)))
+    return statuses
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Probe latency during a login storm")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--user", required=True, help="Email or username of an existing account")
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--probe", default="/health", help="Path whose latency is measured")
+    parser.add_argument("--idle-seconds", type=float, default=3.0)
+    parser.add_argument("--interval", type=float, default=0.05)
+    args = parser.parse_args()
+
+    limits = httpx.Limits(max_connections=args.concurrency + 10)
+    async with httpx.AsyncClient(base_url=args.url, timeout=120, limits=limits) as client:
+        stop = asyncio.Event()
+        idle = asyncio.create_task(probe(client, args.probe, stop, args.interval))
+        await asyncio.sleep(args.idle_seconds)
+        stop.set()
+        idle_latencies = await idle
+
+        stop = asyncio.Event()
+        during = asyncio.create_task(probe(client, args.probe, stop, args.interval))
+        started = time.perf_counter()
+        statuses = await login_storm(client, args.user, args.password, args.logins, args.concurrency)
+        storm_seconds = time.perf_counter() - started
+        stop.set()
+        storm_latencies = await during
+
+        health = (await client.get("/health")).json()
+
+    print(f"Probe {args.probe}")
+    print(f"  idle:        {summarize(idle_latencies)}")
+    print(f"  login storm: {summarize(storm_latencies)}")
+    print(f"Logins: {args.logins} in {storm_seconds:.1f} s ({args.logins / storm_seconds:.1f}/s), statuses {statuses}")
+    if "password_executor" in health:
+        print(f"Password executor: {health['password_executor']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
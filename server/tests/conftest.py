@@ -0,0 +1,22 @@
+"""
+Shared pytest setup
+
+Settings are read when app modules are imported, so the required
+environment is set here, before any test module imports the app.
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add parent directory to path to import app
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+
+@pytest.fixture
+def anyio_backend():
+    """Run async tests on asyncio only (the app uses asyncio tasks directly)"""
+    return "asyncio"
@@ -0,0 +1,300 @@
+"""
+Equivalence tests for the aggregation-backed /location/stats endpoints
+
+/location/stats and /location/stats/day are run against an in-process
+mongomock database and compared with the previous implementation, which
+pulled the raw records and aggregated them in Python (kept below as the
+reference, reading stored timestamps as UTC). Timestamps cluster around
+VN-local midnight (17:00 UTC) so day bucketing in UTC+7 is checked at
+the boundary.
+"""
+import random
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import mongomock.aggregate
+import pytest
+from app.api.endpoints import location as location_endpoints
+from app.core.config import settings
+from app.db.mongodb import mongodb
+from app.models.location import LocationHistoryStats
+from mongomock_motor import AsyncMongoMockClient
+
+pytestmark = pytest.mark.anyio
+
+VN_TZ = timezone(timedelta(hours=7))
+USER = {"user_id": "user-1"}
+
+# Fixed "now" for the endpoints and the reference: 10:30 VN-local, 2025-12-20
+NOW_LOCAL = datetime(2025, 12, 20, 10, 30, tzinfo=VN_TZ)
+
+
+class FrozenDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return NOW_LOCAL.astimezone(tz) if tz is not None else NOW_LOCAL.replace(tzinfo=None)
+
+
+def _date_operator_with_timezone(original):
+    """mongomock ignores $dateToString's timezone when a format is given"""
+
+    def handle(self, operator, values):
+        if operator == "$dateToString" and isinstance(values, dict) and "timezone" in values:
+            tz = values["timezone"]
+            sign = -1 if tz[0] == "-" else 1
+            hours, minutes = map(int, tz[1:].split(":"))
+            date = self.parse(values["date"])
+            if date.tzinfo is not None:
+                date = date.replace(tzinfo=None) - date.utcoffset()
+            return (date + sign * timedelta(hours=hours, minutes=minutes)).strftime(values["format"])
+        return original(self, operator, values)
+
+    return handle
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(mongomock.aggregate._Parser, "_handle_date_operator",
+                        _date_operator_with_timezone(mongomock.aggregate._Parser._handle_date_operator))
+    monkeypatch.setattr(location_endpoints, "datetime", FrozenDatetime)
+    monkeypatch.setattr(settings, "LOCATION_ROLLUPS_ENABLED", False)
+    db = AsyncMongoMockClient(tz_aware=True)["test"]
+    monkeypatch.setattr(mongodb, "db", db)
+    return db
+
+
+# ---- reference: the previous Python implementation ----------------------
+
+def _local(ts: datetime) -> datetime:
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(VN_TZ)
+
+
+async def reference_location_stats(db, user_id: str, days: int) -> LocationHistoryStats:
+    today_local = NOW_LOCAL.date()
+    start_local_date = today_local - timedelta(days=days)
+    cutoff_utc = datetime(start_local_date.year, start_local_date.month, start_local_date.day,
+                          tzinfo=VN_TZ).astimezone(timezone.utc)
+    locations = await db.locations.find({"user_id": user_id, "timestamp": {"$gte": cutoff_utc}}).to_list(None)
+    if not locations:
+        return LocationHistoryStats(
+            total_records=0, date_range={"start": None, "end": None},
+            avg_aqi=None, max_aqi=None, min_aqi=None,
+            avg_pm25=None, max_pm25=None, min_pm25=None,
+            most_visited_location=None, unique_locations=0, daily_avg_aqi=[]
+        )
+
+    end_date = (today_local - timedelta(days=1)).strftime("%Y-%m-%d")
+    valid_records = []
+    daily_aqi_map = defaultdict(list)
+    daily_pm25_map = defaultdict(list)
+    aqi_values = []
+    pm25_values = []
+    for loc in locations:
+        ts_local = _local(loc["timestamp"])
+        if ts_local.date() == today_local:
+            continue
+        valid_records.append(loc)
+        date_str = ts_local.strftime("%Y-%m-%d")
+        if loc.get("aqi") is not None and loc.get("aqi") > 0:
+            daily_aqi_map[date_str].append(loc["aqi"])
+            aqi_values.append(loc["aqi"])
+        if loc.get("pm25") is not None and loc.get("pm25") > 0:
+            daily_pm25_map[date_str].append(loc["pm25"])
+            pm25_values.append(loc["pm25"])
+
+    start_date = None
+    if valid_records:
+        start_date = _local(min(r["timestamp"] for r in valid_records)).strftime("%Y-%m-%d")
+
+    daily_aqi_avgs = [sum(v) / len(v) for v in daily_aqi_map.values()]
+    avg_aqi = sum(daily_aqi_avgs) / len(daily_aqi_avgs) if daily_aqi_avgs else None
+    daily_pm25_avgs = [sum(v) / len(v) for v in daily_pm25_map.values()]
+    avg_pm25 = sum(daily_pm25_avgs) / len(daily_pm25_avgs) if daily_pm25_avgs else None
+    max_pm25 = max(pm25_values) if pm25_values else None
+    min_pm25 = min(pm25_values) if pm25_values else None
+
+    address_counts = {}
+    for loc in locations:
+        if loc.get("address"):
+            address_counts[loc["address"]] = address_counts.get(loc["address"], 0) + 1
+    most_visited = max(address_counts.items(), key=lambda x: x[1])[0] if address_counts else None
+
+    valid_dates = [(today_local - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(1, 8)]
+    daily_avg_aqi = [
+        {"date": date, "avg_aqi": round(sum(daily_aqi_map[date]) / len(daily_aqi_map[date]), 1)}
+        for date in sorted(daily_aqi_map)
+        if date in valid_dates
+    ]
+    return LocationHistoryStats(
+        total_records=len(valid_records),
+        date_range={"start": start_date, "end": end_date},
+        avg_aqi=round(avg_aqi, 1) if avg_aqi is not None else None,
+        max_aqi=max(aqi_values) if aqi_values else None,
+        min_aqi=min(aqi_values) if aqi_values else None,
+        avg_pm25=round(avg_pm25, 1) if avg_pm25 is not None else None,
+        max_pm25=round(max_pm25, 1) if max_pm25 else None,
+        min_pm25=round(min_pm25, 1) if min_pm25 else None,
+        most_visited_location=most_visited,
+        unique_locations=len(address_counts),
+        daily_avg_aqi=daily_avg_aqi,
+        length=len(daily_avg_aqi)
+    )
+
+
+async def reference_stats_for_day(db, user_id: str, date: str) -> dict:
+    year, month, day = map(int, date.split("-"))
+    start_local = datetime(year, month, day, tzinfo=VN_TZ)
+    records = await db.locations.find({
+        "user_id": user_id,
+        "timestamp": {"$gte": start_local.astimezone(timezone.utc),
+                      "$lt": (start_local + timedelta(days=1)).astimezone(timezone.utc)},
+    }).to_list(None)
+    if not records:
+        return {
+            "date": date, "total_records": 0,
+            "avg_aqi": None, "max_aqi": None, "min_aqi": None,
+            "avg_pm25": None, "max_pm25": None, "min_pm25": None,
+            "most_visited_location": None, "unique_locations": 0
+        }
+
+    aqi_values = [r["aqi"] for r in records if r.get("aqi") is not None and r.get("aqi") > 0]
+    pm25_values = [r["pm25"] for r in records if r.get("pm25") is not None and r.get("pm25") > 0]
+    address_counts = {}
+    for r in records:
+        if r.get("address"):
+            address_counts[r["address"]] = address_counts.get(r["address"], 0) + 1
+    return {
+        "date": date,
+        "total_records": len(records),
+        "avg_aqi": round(sum(aqi_values) / len(aqi_values), 1) if aqi_values else None,
+        "max_aqi": max(aqi_values) if aqi_values else None,
+        "min_aqi": min(aqi_values) if aqi_values else None,
+        "avg_pm25": round(sum(pm25_values) / len(pm25_values), 1) if pm25_values else None,
+        "max_pm25": max(pm25_values) if pm25_values else None,
+        "min_pm25": min(pm25_values) if pm25_values else None,
+        "most_visited_location": address_counts,
+        "unique_locations": len(address_counts),
+    }
+
+
+# ---- data -----------------------------------------------------------------
+
+def _vn_midnight_utc(days_ago: int) -> datetime:
+    """UTC instant of VN-local midnight starting the day `days_ago` before today"""
+    day = NOW_LOCAL.date() - timedelta(days=days_ago)
+    return datetime(day.year, day.month, day.day, tzinfo=VN_TZ).astimezone(timezone.utc)
+
+
+def make_locations(seed: int, count: int) -> list:
+    """Random records over the last 35 days, half of them within a minute of VN midnight"""
+    rng = random.Random(seed)
+    now_utc = NOW_LOCAL.astimezone(timezone.utc)
+    docs = []
+    for _ in range(count):
+        if rng.random() < 0.5:
+            ts = _vn_midnight_utc(rng.randint(0, 35)) + timedelta(seconds=rng.randint(-60, 60))
+        else:
+            ts = now_utc - timedelta(seconds=rng.randint(0, 35 * 24 * 3600))
+        docs.append({
+            "user_id": USER["user_id"],
+            "latitude": 21.0,
+            "longitude": 105.8,
+            "aqi": rng.choice([None, 0, rng.randint(1, 300)]),
+            "pm25": rng.choice([None, 0.0, round(rng.uniform(0.1, 200), 2)]),
+            "address": rng.choice([None, "", "A", "B", "C", f"D{rng.randint(0, 5)}"]),
+            "timestamp": min(ts, now_utc),
+        })
+    docs.sort(key=lambda d: d["timestamp"])
+    docs.append({"user_id": "someone-else", "timestamp": now_utc - timedelta(days=1), "aqi": 5, "address": "X"})
+    return docs
+
+
+def dump_day(stats: dict) -> tuple:
+    """Day stats plus the order of their address counts (first seen first)"""
+    return stats, list(stats["most_visited_location"] or [])
+
+
+# ---- tests ----------------------------------------------------------------
+
+class TestLocationStats:
+    """/location/stats"""
+
+    @pytest.mark.parametrize("seed", range(6))
+    async def test_matches_python_reference(self, db, seed):
+        await db.locations.insert_many(make_locations(seed, [1, 40, 300, 800, 800, 800][seed]))
+
+        for days in (1, 7, 15, 30):
+            expected = await reference_location_stats(db, USER["user_id"], days)
+            actual = await location_endpoints.get_location_stats(days=days, current_user=USER)
+            assert actual.model_dump() == expected.model_dump(), days
+
+    async def test_no_records(self, db):
+        expected = await reference_location_stats(db, USER["user_id"], 15)
+        actual = await location_endpoints.get_location_stats(days=15, current_user=USER)
+        assert actual.model_dump() == expected.model_dump()
+        assert actual.total_records == 0
+
+    async def test_days_split_at_vn_midnight(self, db):
+        yesterday = _vn_midnight_utc(1)
+        await db.locations.insert_many([
+            # Same UTC date as the next record, but 23:59:59 of the previous VN-local day
+            {"user_id": USER["user_id"], "timestamp": yesterday - timedelta(seconds=1), "aqi": 100, "pm25": 40.0},
+            {"user_id": USER["user_id"], "timestamp": yesterday, "aqi": 50, "pm25": 10.0},
+            # Today's first second VN-local is left out of the statistics
+            {"user_id": USER["user_id"], "timestamp": _vn_midnight_utc(0), "aqi": 300, "pm25": 250.0},
+        ])
+
+        stats = await location_endpoints.get_location_stats(days=7, current_user=USER)
+
+        assert stats.model_dump() == (await reference_location_stats(db, USER["user_id"], 7)).model_dump()
+        assert stats.total_records == 2
+        assert stats.daily_avg_aqi == [
+            {"date": "2025-12-18", "avg_aqi": 100.0},
+            {"date": "2025-12-19", "avg_aqi": 50.0},
+        ]
+        assert stats.date_range == {"start": "2025-12-18", "end": "2025-12-19"}
+
+    async def test_window_starts_at_vn_midnight(self, db):
+        start = _vn_midnight_utc(3)
+        await db.locations.insert_many([
+            {"user_id": USER["user_id"], "timestamp": start - timedelta(seconds=1), "aqi": 10},
+            {"user_id": USER["user_id"], "timestamp": start, "aqi": 20},
+        ])
+
+        stats = await location_endpoints.get_location_stats(days=3, current_user=USER)
+
+        assert stats.model_dump() == (await reference_location_stats(db, USER["user_id"], 3)).model_dump()
+        assert stats.total_records == 1
+        assert stats.min_aqi == 20
+
+
+class TestDayStats:
+    """/location/stats/day"""
+
+    @pytest.mark.parametrize("seed", range(3))
+    async def test_matches_python_reference(self, db, seed):
+        await db.locations.insert_many(make_locations(seed, 800))
+
+        for days_ago in range(0, 36, 1):
+            date = (NOW_LOCAL.date() - timedelta(days=days_ago)).strftime("%Y-%m-%d")
+            expected = await reference_stats_for_day(db, USER["user_id"], date)
+            actual = await location_endpoints.get_stats_for_day(date=date, current_user=USER)
+            assert dump_day(actual) == dump_day(expected), date
+
+    async def test_day_is_vn_local(self, db):
+        midnight = _vn_midnight_utc(2)
+        await db.locations.insert_many([
+            {"user_id": USER["user_id"], "timestamp": midnight - timedelta(seconds=1), "aqi": 80, "address": "A"},
+            {"user_id": USER["user_id"], "timestamp": midnight, "aqi": 20, "address": "B"},
+            {"user_id": USER["user_id"], "timestamp": midnight + timedelta(hours=23, minutes=59), "aqi": 40,
+             "address": "B"},
+        ])
+
+        stats = await location_endpoints.get_stats_for_day(date="2025-12-18", current_user=USER)
+
+        assert dump_day(stats) == dump_day(await reference_stats_for_day(db, USER["user_id"], "2025-12-18"))
+        assert stats["total_records"] == 2
+        assert stats["avg_aqi"] == 30.0
+        assert stats["most_visited_location"] == {"B": 2}
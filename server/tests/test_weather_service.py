@@ -0,0 +1,244 @@
+"""
+Tests for the pooled Open-Meteo client and its stale-while-revalidate cache
+
+WEATHER_API_URL points at a local stub server that answers like
+Open-Meteo's /v1/forecast and counts the requests it gets.
+"""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from app.core.config import settings
+from app.services.weather_service import WeatherService
+
+pytestmark = pytest.mark.anyio
+
+
+class StubOpenMeteo:
+    """
+    Local stand-in for the Open-Meteo forecast API
+
+    Every successful response carries its request number as
+    temperature_2m_max, so tests can tell which fetch a value came from.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.fail = False
+        self.delay = 0.0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                with stub._lock:
+                    stub.requests.append(query)
+                    number = len(stub.requests)
+                if stub.delay:
+                    time.sleep(stub.delay)
+                if stub.fail:
+                    self.send_response(500)
+                    self.end_headers()
+                    return
+                days = int(query.get("forecast_days", 1))
+                body = json.dumps({"daily": {
+                    "time": [f"2025-12-{i + 1:02d}" for i in range(days)],
+                    "temperature_2m_max": [number] * days,
+                    "temperature_2m_min": [20.0] * days,
+                    "relative_humidity_2m_mean": [80] * days,
+                    "wind_speed_10m_max": [5.5] * days,
+                    "rain_sum": [0.0] * days,
+                }}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/forecast"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    stub = StubOpenMeteo()
+    monkeypatch.setattr(settings, "WEATHER_API_URL", stub.url)
+    monkeypatch.setattr(settings, "WEATHER_TIMEOUT", 5.0)
+    yield stub
+    stub.close()
+
+
+@pytest.fixture
+async def service():
+    service = WeatherService()
+    yield service
+    await service.aclose()
+
+
+def cache_window(monkeypatch, ttl: float, stale: float) -> None:
+    monkeypatch.setattr(settings, "WEATHER_CACHE_TTL", ttl)
+    monkeypatch.setattr(settings, "WEATHER_CACHE_STALE_SECONDS", stale)
+
+
+async def wait_for_refreshes(service: WeatherService) -> None:
+    await asyncio.gather(*list(service._inflight.values()), return_exceptions=True)
+    await asyncio.sleep(0)  # let the done callbacks run
+
+
+class TestFreshCache:
+    """Responses younger than WEATHER_CACHE_TTL"""
+
+    async def test_fresh_hit_is_served_from_cache(self, stub, service, monkeypatch):
+        cache_window(monkeypatch, ttl=60, stale=60)
+
+        first = await service.get_daily(21.0285, 105.8542, 3)
+        second = await service.get_daily(21.0285, 105.8542, 3)
+
+        assert len(stub.requests) == 1
+        assert second == first
+        assert list(first) == ["2025-12-01", "2025-12-02", "2025-12-03"]
+        assert first["2025-12-01"] == {
+            "temp_max": 1, "temp_min": 20.0, "humidity": 80, "wind_speed": 5.5, "rain_sum": 0.0,
+        }
+        assert stub.requests[0]["forecast_days"] == "3"
+
+    async def test_nearby_coordinates_share_a_cell(self, stub, service, monkeypatch):
+        cache_window(monkeypatch, ttl=60, stale=60)
+        monkeypatch.setattr(settings, "WEATHER_CACHE_CELL_DEG", 0.05)
+
+        await service.get_daily(21.001, 105.801, 3)
+        await service.get_daily(21.012, 105.789, 3)
+        await service.get_daily(21.001, 105.801, 7)
+
+        assert len(stub.requests) == 2
+        assert stub.requests[0]["latitude"] == "21.0"
+        assert stub.requests[0]["longitude"] == "105.8"
+
+    async def test_concurrent_misses_share_one_fetch(self, stub, service, monkeypatch):
+        cache_window(monkeypatch, ttl=60, stale=60)
+        stub.delay = 0.2
+
+        results = await asyncio.gather(*[service.get_daily(21.0, 105.8, 3) for _ in range(5)])
+
+        assert len(stub.requests) == 1
+        assert all(result == results[0] for result in results)
+
+
+class TestStaleWhileRevalidate:
+    """Responses past the TTL but within WEATHER_CACHE_STALE_SECONDS"""
+
+    async def test_stale_is_served_with_one_background_refresh(self, stub, service, monkeypatch):
+        cache_window(monkeypatch, ttl=0, stale=60)
+        first = await service.get_daily(21.0, 105.8, 3)
+        stub.delay = 0.2
+
+        results = await asyncio.gather(*[service.get_daily(21.0, 105.8, 3) for _ in range(5)])
+
+        # All answered from the stale entry without waiting for the refresh
+        assert all(result == first for result in results)
+        assert service.stale_served == 5
+        assert len(service._inflight) == 1
+
+        await wait_for_refreshes(service)
+        assert len(stub.requests) == 2
+        assert service._inflight == {}
+
+        cache_window(monkeypatch, ttl=60, stale=60)
+        refreshed = await service.get_daily(21.0, 105.8, 3)
+        assert refreshed["2025-12-01"]["temp_max"] == 2
+        assert len(stub.requests) == 2
+
+    async def test_failed_refresh_keeps_stale_entry(self, stub, service, monkeypatch):
+        cache_window(monkeypatch, ttl=0, stale=60)
+        first = await service.get_daily(21.0, 105.8, 3)
+        stub.fail = True
+
+        assert await service.get_daily(21.0, 105.8, 3) == first
+        await wait_for_refreshes(service)
+
+        assert service.fetch_errors == 1
+        assert await service.get_daily(21.0, 105.8, 3) == first
+
+
+class TestUpstreamFailure:
+    """Weather API errors when the cache can't answer on its own"""
+
+    async def test_expired_entry_is_returned_on_failure(self, stub, service, monkeypatch):
+        cache_window(monkeypatch, ttl=0, stale=0)
+        first = await service.get_daily(21.0, 105.8, 3)
+        stub.fail = True
+
+        assert await service.get_daily(21.0, 105.8, 3) == first
+        assert len(stub.requests) == 2
+        assert service.fetch_errors == 1
+
+    async def test_empty_when_nothing_is_cached(self, stub, service, monkeypatch):
+        cache_window(monkeypatch, ttl=60, stale=60)
+        stub.fail = True
+
+        assert await service.get_daily(21.0, 105.8, 3) == {}
+        assert service.fetch_errors == 1
+        assert service.stats()["entries"] == 0
+
+    async def test_empty_when_upstream_is_unreachable(self, stub, service, monkeypatch):
+        cache_window(monkeypatch, ttl=60, stale=60)
+        stub.close()
+
+        assert await service.get_daily(21.0, 105.8, 3) == {}
+        assert service.fetch_errors == 1
+
+
+class TestClientLifecycle:
+    """start() / aclose() of the shared HTTP client"""
+
+    async def test_start_is_idempotent(self, service):
+        service.start()
+        client = service._client
+        service.start()
+
+        assert client is not None
+        assert service._client is client
+
+    async def test_aclose_closes_client(self, service):
+        service.start()
+        client = service._client
+
+        await service.aclose()
+
+        assert service._client is None
+        assert client.is_closed
+
+    async def test_aclose_cancels_background_refreshes(self, stub, service, monkeypatch):
+        cache_window(monkeypatch, ttl=0, stale=60)
+        await service.get_daily(21.0, 105.8, 3)
+        stub.delay = 0.5
+        await service.get_daily(21.0, 105.8, 3)
+        task = next(iter(service._inflight.values()))
+
+        await service.aclose()
+        await asyncio.gather(task, return_exceptions=True)
+
+        assert task.cancelled()
+        assert service._inflight == {}
+        assert service._client is None
+
+    async def test_client_is_recreated_after_aclose(self, stub, service, monkeypatch):
+        cache_window(monkeypatch, ttl=60, stale=60)
+        await service.aclose()
+
+        assert await service.get_daily(21.0, 105.8, 3) != {}
+        assert service._client is not None
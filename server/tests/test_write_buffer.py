@@ -0,0 +1,206 @@
+"""
+Tests for the write-behind insert buffer
+
+Batches are written to an in-process mongomock-motor collection. A gate
+in front of insert_many holds the flush task mid-write where a test needs
+the queue to fill up behind it.
+"""
+import asyncio
+import time
+
+import pytest
+from app.services.write_buffer import BufferClosedError, BufferFullError, WriteBehindBuffer
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import BulkWriteError
+
+pytestmark = pytest.mark.anyio
+
+
+class GatedCollection:
+    """Collection whose insert_many waits until the gate is opened"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.inserting = asyncio.Event()
+        self.batches = []
+
+    async def insert_many(self, documents, ordered=True):
+        self.batches.append([document["_id"] for document in documents])
+        self.inserting.set()
+        await self.gate.wait()
+        return await self.collection.insert_many(documents, ordered=ordered)
+
+
+@pytest.fixture
+def collection():
+    return GatedCollection(AsyncMongoMockClient()["test"]["locations"])
+
+
+@pytest.fixture
+async def make_buffer(collection):
+    buffers = []
+
+    def make(**kwargs):
+        options = {"max_batch": 100, "flush_interval": 0.05, "max_queue": 100, "put_timeout": 1.0}
+        options.update(kwargs)
+        buffer = WriteBehindBuffer("test", lambda: collection, **options)
+        buffer.start()
+        buffers.append(buffer)
+        return buffer
+
+    yield make
+    collection.gate.set()
+    for buffer in buffers:
+        await buffer.stop()
+
+
+async def wait_until(condition, timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        await asyncio.sleep(0.005)
+
+
+class TestFlush:
+    """When batches are written"""
+
+    async def test_flushes_when_batch_is_full(self, collection, make_buffer):
+        buffer = make_buffer(max_batch=3, flush_interval=10.0)
+
+        for i in range(3):
+            await buffer.put({"_id": i})
+        await wait_until(lambda: buffer.written == 3)
+
+        assert collection.batches == [[0, 1, 2]]
+        assert await collection.collection.count_documents({}) == 3
+
+    async def test_flushes_after_interval(self, collection, make_buffer):
+        buffer = make_buffer(max_batch=100, flush_interval=0.1)
+
+        started = time.monotonic()
+        await buffer.put({"_id": 1})
+        await buffer.put({"_id": 2})
+        assert await collection.collection.count_documents({}) == 0
+
+        await wait_until(lambda: buffer.written == 2)
+        assert time.monotonic() - started >= 0.1
+        assert collection.batches == [[1, 2]]
+        assert buffer.stats()["batches"] == 1
+
+    async def test_after_write_gets_written_documents(self, collection, make_buffer):
+        written = []
+
+        async def after_write(documents):
+            written.extend(document["_id"] for document in documents)
+
+        buffer = make_buffer(max_batch=2, after_write=after_write)
+        await asyncio.gather(buffer.put({"_id": 1}, ack=True), buffer.put({"_id": 2}, ack=True))
+        await wait_until(lambda: len(written) == 2)
+
+        assert written == [1, 2]
+
+
+class TestAck:
+    """put(ack=True) waits for its batch"""
+
+    async def test_ack_resolves_after_write(self, collection, make_buffer):
+        buffer = make_buffer()
+
+        await buffer.put({"_id": 1, "user_id": "u"}, ack=True)
+
+        assert await collection.collection.find_one({"_id": 1}) == {"_id": 1, "user_id": "u"}
+
+    async def test_bulk_write_error_reaches_only_failing_item(self, collection, make_buffer):
+        await collection.collection.insert_one({"_id": 1})
+        buffer = make_buffer(max_batch=3, flush_interval=10.0)
+
+        results = await asyncio.gather(
+            *[buffer.put({"_id": i}, ack=True) for i in range(3)],
+            return_exceptions=True,
+        )
+
+        assert results[0] is None and results[2] is None
+        assert isinstance(results[1], BulkWriteError)
+        assert collection.batches == [[0, 1, 2]]
+        assert buffer.written == 2 and buffer.failed == 1
+
+    async def test_other_errors_reach_every_item(self, make_buffer):
+        class Broken:
+            async def insert_many(self, documents, ordered=True):
+                raise RuntimeError("connection lost")
+
+        buffer = make_buffer(max_batch=2)
+        buffer.get_collection = lambda: Broken()
+
+        results = await asyncio.gather(
+            buffer.put({"_id": 1}, ack=True), buffer.put({"_id": 2}, ack=True), return_exceptions=True
+        )
+
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert buffer.failed == 2
+
+
+class TestBackpressure:
+    """A full queue"""
+
+    async def test_put_raises_after_put_timeout(self, collection, make_buffer):
+        buffer = make_buffer(max_batch=1, max_queue=1, put_timeout=0.1)
+        collection.gate.clear()
+
+        await buffer.put({"_id": 1})  # taken by the flush task, held at the gate
+        await collection.inserting.wait()
+        await buffer.put({"_id": 2})  # fills the queue
+
+        started = time.monotonic()
+        with pytest.raises(BufferFullError):
+            await buffer.put({"_id": 3})
+        assert time.monotonic() - started >= 0.1
+        assert buffer.rejected == 1
+
+        collection.gate.set()
+        await wait_until(lambda: buffer.written == 2)
+        assert await collection.collection.count_documents({}) == 2
+
+
+class TestStop:
+    """stop() and put() on a stopped buffer"""
+
+    async def test_stop_drains_items_queued_behind_sentinel(self, collection, make_buffer):
+        buffer = make_buffer(max_batch=1)
+        collection.gate.clear()
+        await buffer.put({"_id": 1})
+        await collection.inserting.wait()
+        await buffer.put({"_id": 2})
+
+        stopping = asyncio.create_task(buffer.stop())
+        await asyncio.sleep(0.01)  # sentinel queued behind _id 2
+        assert buffer.running
+        acks = [asyncio.create_task(buffer.put({"_id": i}, ack=True)) for i in (3, 4)]
+        await asyncio.sleep(0)
+
+        collection.gate.set()
+        await stopping
+        await asyncio.wait_for(asyncio.gather(*acks), timeout=1.0)
+
+        assert not buffer.running
+        assert sorted(d["_id"] for d in await collection.collection.find().to_list(None)) == [1, 2, 3, 4]
+
+    async def test_put_on_stopped_buffer_raises(self, collection, make_buffer):
+        buffer = make_buffer()
+        await buffer.stop()
+
+        with pytest.raises(BufferClosedError):
+            await asyncio.wait_for(buffer.put({"_id": 1}, ack=True), timeout=1.0)
+        with pytest.raises(BufferClosedError):
+            await buffer.put({"_id": 2})
+
+        assert buffer.stats()["queue_depth"] == 0
+        assert await collection.collection.count_documents({}) == 0
+
+    async def test_put_before_start_raises(self, collection):
+        buffer = WriteBehindBuffer("test", lambda: collection)
+
+        with pytest.raises(BufferClosedError):
+            await buffer.put({"_id": 1}, ack=True)